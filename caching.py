@@ -0,0 +1,62 @@
+# OrderedDict remembers the order in which the keys have been inserted (or moved)
+from collections import OrderedDict
+
+class LRUCache:
+    ''' A dictionary with a bounded number of elements: when it is full, adding a new element
+    removes the one that has not been used for the longest time (Least Recently Used).
+    - maxsize: the maximum number of elements (None means no limit)
+    - maxbytes: the maximum total size of the elements, measured by the function sizeof (None means
+      no limit); an element larger than maxbytes by itself is not kept
+    '''
+    def __init__(self, maxsize, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.data = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # it returns the element stored with key, or default if there is none
+    def get(self, key, default=None):
+        if key not in self.data:
+            self.misses = self.misses + 1
+            return default
+        self.hits = self.hits + 1
+        # the element becomes the most recently used one: we move it at the end
+        value = self.data.pop(key)
+        self.data[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self.data:
+            self.remove(key)
+        self.data[key] = value
+        if self.maxbytes is not None:
+            self.sizes[key] = self.sizeof(value)
+            self.nbytes = self.nbytes + self.sizes[key]
+        # the least recently used elements are at the beginning
+        while self.full():
+            self.remove(next(iter(self.data)))
+
+    # this method tells if there are more elements (or bytes) than allowed
+    def full(self):
+        if self.maxsize is not None and len(self.data) > self.maxsize:
+            return True
+        return self.maxbytes is not None and self.nbytes > self.maxbytes
+
+    def remove(self, key):
+        del self.data[key]
+        self.nbytes = self.nbytes - self.sizes.pop(key, 0)
+
+    def clear(self):
+        self.data.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
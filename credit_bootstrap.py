@@ -0,0 +1,211 @@
+from credit_products import *
+from credit_curves import CreditCurve, CreditCurveCube
+import numpy
+from scipy.optimize import brentq
+from curve_cache import snapshot_key, curve_key
+
+class CreditBootstrapHelper:
+    '''
+    The helper used by the bootstrap: the credit curve is built once and only the survival probability
+    of the last pillar is changed by the root finder. The premiums paid on or before the previous pillar
+    and the protection up to the previous pillar do not depend on it, so their value (known_npv) is
+    computed only once; just the premiums of the last segment (whose discount factors and accruals are
+    in coefficients) and the protection on the last segment [t0, t1] are repriced
+    '''
+    def __init__(self, discountCurve, curve, index, known_npv, payments, coefficients, recovery, t0, t1):
+        self.discountCurve = discountCurve
+        self.curve = curve
+        self.index = index
+        self.known_npv = known_npv
+        self.payments = payments
+        self.coefficients = coefficients
+        self.recovery = recovery
+        self.t0 = t0
+        self.t1 = t1
+
+    def pricer(self, ndp):
+        self.curve.set_ndp(self.index, ndp)
+        premium = numpy.dot(self.coefficients, self.curve.ndp_vector(self.payments))
+        protection = protection_leg(self.discountCurve, self.curve, self.t0, self.t1)
+        return self.known_npv + premium - (1 - self.recovery) * protection
+
+class CreditCurveBootstrap:
+    '''
+    This class will find the survival probabilities of a credit curve given an OIS discount curve and a
+    collection of CDS whose spread is the market quote, i.e. whose npv must be zero.
+    The pillars of the curve are the end dates of the CDS, which must be added ordered by end date: the
+    CDS are taken one at a time and the survival probability of their end date is found with the root
+    finder, the previous ones being already known (see CreditBootstrapHelper).
+
+    bootstrap_batch and bootstrap_cube find the curves of many issuers at once, given the quotes of
+    the same CDS for each of them: all of the curves are solved together as the rows of a
+    CreditCurveCube, with a bisection on the hazard rate of the last segment done by numpy for all of
+    the issuers in the same operations.
+    '''
+    def __init__(self, today, discountCurve):
+        self.today = today
+        self.discountCurve = discountCurve
+        self.products = []
+        self.curve = None
+
+    def addProduct(self, cds):
+        # we add products and check that they are ordered by end date
+        if len(self.products) > 0:
+            if cds.endDate <= self.products[-1].endDate:
+                raise ValueError("Products not ordered")
+        self.products.append(cds)
+
+    def pillars(self):
+        return [self.today] + [cds.endDate for cds in self.products]
+
+    # This method splits the premium leg of the i-th CDS in the flows paid on or before the previous
+    # pillar and the other ones: for each group it returns the payment ordinals and the discount
+    # factors times the accruals (the premium leg is spread * sum(coefficients * ndps))
+    def premium_flows(self, i, pillars_number):
+        cds = self.products[i]
+        coefficients = self.discountCurve.df_vector(cds.premium_payment) * cds.tau
+        known = cds.premium_payment <= pillars_number[i]
+        return cds.premium_payment[known], coefficients[known], cds.premium_payment[~known], coefficients[~known]
+
+    # The protection of the i-th CDS splits at the previous pillar as well: it returns the three
+    # extremes t0 <= t_mid <= t1 of the known and of the open part
+    def protection_extremes(self, i, pillars_number):
+        cds = self.products[i]
+        t0 = float(cds.startDate.toordinal())
+        t1 = float(cds.endDate.toordinal())
+        return t0, min(max(t0, pillars_number[i]), t1), t1
+
+    # the key of the market data snapshot of the bootstrap (see curve_cache): the schedules and the
+    # recoveries of the CDS, their spreads and the discount curve
+    def key(self):
+        instruments = [(cds.startDate, cds.premium_payment, cds.tau, cds.recovery) for cds in self.products]
+        quotes = [cds.spread for cds in self.products]
+        return snapshot_key("CDS credit curve", self.today, instruments, quotes, "loglinear",
+                            [curve_key(self.discountCurve)])
+
+    # the credit curve consistent with the spreads of the CDS
+    # - cache: if given (e.g. curve_cache.curve_cache), the curve is taken from this CurveCache when it
+    #   has already been built from the same snapshot (see key)
+    def bootstrap(self, cache=None):
+        if cache is not None:
+            self.curve = cache.get(self.key(), self.bootstrap)
+            return self.curve
+        pillars = self.pillars()
+        curve = CreditCurve(self.today, pillars, [1.0 for pillar in pillars])
+
+        for i, cds in enumerate(self.products):
+            index = i + 1
+            known_payments, known_coefficients, open_payments, open_coefficients = self.premium_flows(i, curve.pillars_number)
+            t0, t_mid, t1 = self.protection_extremes(i, curve.pillars_number)
+
+            known_npv = cds.spread * numpy.dot(known_coefficients, curve.ndp_vector(known_payments))
+            if t_mid > t0:
+                known_npv = known_npv - (1 - cds.recovery) * protection_leg(self.discountCurve, curve, t0, t_mid)
+
+            helper = CreditBootstrapHelper(self.discountCurve, curve, index, known_npv, open_payments,
+                                           cds.spread * open_coefficients, cds.recovery, t_mid, t1)
+            # the survival probability cannot increase (the hazard rate is not negative)
+            ndp = brentq(helper.pricer, 1e-12, curve.ndps[index - 1])
+            curve.set_ndp(index, ndp)
+
+        self.curve = curve
+        return curve
+
+    # This method finds the curves of many issuers: quotes has one row per issuer and one column per
+    # CDS (the spreads of the CDS are not used), recoveries is the recovery of each issuer (if None the
+    # ones of the CDS are used). It returns a CreditCurveCube with one row per issuer.
+    # - max_hazard: the largest hazard rate (in 1 / years) searched by the bisection
+    # - iterations: the number of steps of the bisection; each halves the interval of the hazard rate
+    def bootstrap_cube(self, quotes, recoveries=None, max_hazard=10.0, iterations=60):
+        quotes = numpy.atleast_2d(numpy.asarray(quotes, dtype=numpy.float64))
+        nissuers = len(quotes)
+        pillars = self.pillars()
+        cube = CreditCurveCube(self.today, pillars, numpy.ones((nissuers, len(pillars))))
+
+        for i, cds in enumerate(self.products):
+            index = i + 1
+            recovery = cds.recovery if recoveries is None else numpy.asarray(recoveries, dtype=numpy.float64)
+            known_payments, known_coefficients, open_payments, open_coefficients = self.premium_flows(i, cube.pillars_number)
+            t0, t_mid, t1 = self.protection_extremes(i, cube.pillars_number)
+
+            known_npv = quotes[:, i] * cube.ndp_vector(known_payments).dot(known_coefficients)
+            if t_mid > t0:
+                known_npv = known_npv - (1 - recovery) * protection_leg(self.discountCurve, cube, t0, t_mid)
+
+            # the npvs for a given hazard rate on the last segment, for all of the issuers
+            ln_previous = cube.ln_ndps[:, index - 1].copy()
+            length = (cube.pillars_number[index] - cube.pillars_number[index - 1]) / 365.0
+            def npvs(hazards):
+                cube.set_ndps(index, numpy.exp(ln_previous - hazards * length))
+                premium = quotes[:, i] * cube.ndp_vector(open_payments).dot(open_coefficients)
+                return known_npv + premium - (1 - recovery) * protection_leg(self.discountCurve, cube, t_mid, t1)
+
+            # the npv decreases when the hazard rate increases
+            low = numpy.zeros(nissuers)
+            high = numpy.repeat(max_hazard, nissuers)
+            if numpy.any(npvs(high) > 0) or numpy.any(npvs(low) < 0):
+                raise ValueError("The quotes cannot be matched with a hazard rate between 0 and max_hazard")
+            for iteration in range(iterations):
+                middle = 0.5 * (low + high)
+                positive = npvs(middle) > 0
+                low = numpy.where(positive, middle, low)
+                high = numpy.where(positive, high, middle)
+            cube.set_ndps(index, numpy.exp(ln_previous - 0.5 * (low + high) * length))
+
+        return cube
+
+    # the same as bootstrap_cube, but it returns a list of CreditCurve, one per issuer
+    def bootstrap_batch(self, quotes, recoveries=None, max_hazard=10.0, iterations=60):
+        cube = self.bootstrap_cube(quotes, recoveries, max_hazard, iterations)
+        return [CreditCurve(self.today, list(cube.pillars), list(row)) for row in cube.ndps]
+
+    # This method returns the derivatives of the logarithms of the survival probabilities of the pillars
+    # (today excluded) of the last bootstrapped curve:
+    # - with respect to the log discount factors of the pillars of the discount curve (today excluded)
+    # - with respect to the spreads of the CDS
+    # The npvs of the CDS stay zero, hence d npv / dy * dy + d npv / dx * dx + annuities * dq = 0
+    def sensitivity(self):
+        curve = self.curve
+        discount_pillars = self.discountCurve.pillars_number
+        npv_x, npv_y, annuities = [], [], []
+        for cds in self.products:
+            payments = cds.premium_payment
+            premiums = cds.spread * cds.tau * self.discountCurve.df_vector(payments) * curve.ndp_vector(payments)
+            d_discount, d_credit = protection_leg_gradient(self.discountCurve, curve,
+                                                           cds.startDate.toordinal(), cds.endDate.toordinal())
+            npv_x.append(premiums.dot(interpolation_weights(payments, discount_pillars))[1:] - (1 - cds.recovery) * d_discount)
+            npv_y.append(premiums.dot(interpolation_weights(payments, curve.pillars_number))[1:] - (1 - cds.recovery) * d_credit)
+            annuities.append(premiums.sum() / cds.spread)
+
+        npv_y = numpy.array(npv_y)
+        ln_ndps_x = numpy.linalg.solve(npv_y, - numpy.array(npv_x))
+        ln_ndps_quotes = numpy.linalg.solve(npv_y, - numpy.diag(annuities))
+        return ln_ndps_x, ln_ndps_quotes
+
+
+from ois_bootstrap import DiscountCurveBootstrap
+from ois_products import buildOIS
+
+if __name__ == '__main__':
+    today = date(2013,10,31)
+
+    dc_bootstrapper = DiscountCurveBootstrap(today)
+    for maturity, quote in [(12, 0.0014), (24, 0.002), (60, 0.0075), (120, 0.0165), (240, 0.0232)]:
+        dc_bootstrapper.addProduct(buildOIS(today, maturity, 12, quote))
+    dc_curve = dc_bootstrapper.bootstrap()
+
+    cds_bootstrapper = CreditCurveBootstrap(today, dc_curve)
+    endDates = [date(2014,12,20), date(2015,12,20), date(2016,12,20), date(2018,12,20), date(2023,12,20)]
+    quotes = [0.0149, 0.0165, 0.0173, 0.0182, 0.0183]
+    for endDate, quote in zip(endDates, quotes):
+        cds_bootstrapper.addProduct(buildCDS(today, endDate, quote, 0.4))
+    cc = cds_bootstrapper.bootstrap()
+    for pillar, ndp in zip(cc.pillars, cc.ndps):
+        print pillar, ": ", ndp
+    print "CDS npvs:", [cds.npv(dc_curve, cc) for cds in cds_bootstrapper.products]
+
+    # 500 issuers with the quotes shifted by up to 100bp, bootstrapped at once
+    shifts = numpy.linspace(0.0, 0.01, 500)
+    cube = cds_bootstrapper.bootstrap_cube(numpy.array(quotes) + shifts[:, numpy.newaxis])
+    print "First issuer, same curve:", numpy.max(numpy.abs(cube.ndps[0] - cc.ndps))
+    print "Survival probabilities of the last issuer:", cube.ndps[-1]
@@ -8,10 +8,10 @@ from datetime import date
 # math is mathematical package
 import math
 
-# dateutil is a library with functions to manipulate the date class;
-# we need a method to shift a date and we will use the function relativedelta
-# that is present in this library
-from dateutil.relativedelta import relativedelta
+# to_ordinals converts dates (or lists of dates) to the numbers used by the interpolator
+from date_conventions import to_ordinals
+from ir_curves import interpolate_rows, discount_schemes
+from interpolation import build_interpolator
 
 # The CreditCurve is a class to obtain by means of an interpolation the survival probabilities
 # and the hazard rated at generic dates given a list of know survival probabilities
@@ -21,7 +21,9 @@ class CreditCurve:
     # - obsdate: the date at which the curve refers to (i.e. today)
     # - pillars: a list of dates at which the survival probabilities are known
     # - ndps: the known survival probabilities, called Non Default Probabilities (ndp)
-    def __init__(self, today, pillars, ndps):
+    # - interpolation: the scheme used to interpolate the logarithms of the survival probabilities, the
+    #   same of the DiscountCurve: "loglinear" (the default), "zerolinear", "monotoneconvex" or "cubic"
+    def __init__(self, today, pillars, ndps, interpolation="loglinear"):
         # the following generates an error that will block the program
         if pillars[0] < today:
             raise "today is greater than the first pillar date"
@@ -35,20 +37,38 @@ class CreditCurve:
         self.today = today
         self.pillars = pillars
         self.ndps = ndps
-
-        # dates must be converted to numbers, otherwise the interpolation function will not work
-        self.pillars_number = map(date.toordinal, pillars)
-
-        # we will linearly interpolate on the logarithm of the discount factors
-        self.ln_ndps = map(math.log, ndps)
+        self.interpolation = interpolation
+
+        # dates must be converted to numbers, otherwise the interpolation function will not work;
+        # as for the DiscountCurve they are stored once in contiguous float64 arrays
+        self.pillars_number = numpy.array(to_ordinals(pillars), dtype=numpy.float64)
+
+        # we will interpolate on the logarithm of the survival probabilities (linearly by default)
+        self.ln_ndps = numpy.log(numpy.array(ndps, dtype=numpy.float64))
+
+        # the hazard rate h(t) = - d ln(NDP(t)) / dt is minus the derivative of the interpolated
+        # logarithms: with the default scheme ln(NDP(t)) is linear between two pillars, so the hazard
+        # rate is constant on each segment and equal to minus the slope of ln(NDP). The interpolator
+        # computes all of its coefficients (the slopes, for the default scheme) once here; the curve is
+        # flat before the first and after the last pillar, where the hazard rate is zero
+        self.interpolator = build_interpolator(interpolation, self.pillars_number, self.ln_ndps, discount_schemes)
+
+    # this method changes the survival probability of the pillar in position index, without building
+    # a new curve: only its logarithm and the coefficients of the interpolator which depend on it (for
+    # the default scheme the hazard rates of the two segments around it) are recomputed.
+    # It is used by the bootstrap, which moves one pillar at a time
+    def set_ndp(self, index, ndp):
+        self.ndps[index] = ndp
+        self.ln_ndps[index] = math.log(ndp)
+        self.interpolator.set_value(index, self.ln_ndps[index])
 
     # this method interpolated the survival probabilities
     def ndp(self, aDate):
         # we convert the date to a number
         date_number = aDate.toordinal()
 
-        #we use the linear interpolator of the numpy library
-        ln_ndp = numpy.interp(date_number, self.pillars_number, self.ln_ndps)
+        #we use the interpolator of the curve
+        ln_ndp = self.interpolator.value(date_number)
 
         #we  will have to the take the exponential because we interpolated the logarithms
         ndp = math.exp(ln_ndp)
@@ -56,18 +76,70 @@ class CreditCurve:
         # return the resulting discount factor
         return ndp
 
+    # the same as ndp, but for a list (or array) of dates or ordinals: it returns a numpy
+    # array with all of the survival probabilities interpolated in a single pass
+    def ndp_vector(self, dates):
+        ln_ndps = self.interpolator.value_vector(to_ordinals(dates))
+        return numpy.exp(ln_ndps)
+
     # we need a method to derive the hazard rate from the survival probability:
     # we now that h(t) = - d ln(NDP(t)) / dt = - 1 / NDP(t) * d NDP(t) / dt
-    # we implement this derivative by an approximation using
-    # finite differences:
-    # h(t) = - 1 / NPP(t) * [ NDP(t + 1day) - NDP(t)] / 1day
-    # we will assume 1day = 1 / 365
+    # the derivative of the interpolated logarithm is given by the interpolator, which finds the
+    # segment containing t with a binary search (the result is in 1 / years, with 1 year = 365 days)
+    def hazard(self, aDate):
+        return self.hazard_vector([aDate])[0]
+
+    # the same as hazard, but for a list (or array) of dates or ordinals
+    def hazard_vector(self, dates):
+        return 365.0 * self.interpolator.forward_vector(to_ordinals(dates))
+
+
+class CreditCurveCube:
+    # The same as the CreditCurve, but with many scenarios at once: all of the scenarios share the
+    # same pillars, while the survival probabilities are a matrix with one row per scenario and one
+    # column per pillar. The methods return one value per scenario (and per date)
+    def __init__(self, today, pillars, ndps):
+        if pillars[0] < today:
+            raise ValueError("today is greater than the first pillar date")
+
+        ndps = numpy.array(ndps, dtype=numpy.float64, ndmin=2)
+        pillars = list(pillars)
+        if pillars[0] > today:
+            pillars.insert(0, today)
+            ndps = numpy.column_stack((numpy.ones(len(ndps)), ndps))
+
+        self.today = today
+        self.pillars = pillars
+        self.ndps = ndps
+        self.pillars_number = numpy.array(to_ordinals(pillars), dtype=numpy.float64)
+        self.ln_ndps = numpy.log(ndps)
+
+        # the (constant) hazard rate of each segment, for each scenario, see CreditCurve
+        slopes = numpy.diff(self.ln_ndps, axis=1) / numpy.diff(self.pillars_number)
+        zeros = numpy.zeros((len(ndps), 1))
+        self.hazard_table = numpy.hstack((zeros, - 365.0 * slopes, zeros))
+
+    # the same as CreditCurve.set_ndp, with one survival probability per scenario
+    def set_ndps(self, index, ndps):
+        self.ndps[:, index] = ndps
+        self.ln_ndps[:, index] = numpy.log(ndps)
+        for k in [index, index + 1]:
+            if 0 < k < len(self.pillars_number):
+                slope = (self.ln_ndps[:, k] - self.ln_ndps[:, k - 1]) / (self.pillars_number[k] - self.pillars_number[k - 1])
+                self.hazard_table[:, k] = - 365.0 * slope
+
+    def ndp(self, aDate):
+        return self.ndp_vector([aDate])[:, 0]
+
+    def ndp_vector(self, dates):
+        return numpy.exp(interpolate_rows(to_ordinals(dates), self.pillars_number, self.ln_ndps))
+
     def hazard(self, aDate):
-        ndp_1 = self.ndp(aDate)
-        ndp_2 = self.ndp(aDate + relativedelta(days=1))
-        delta_t = 1.0 / 365.0
-        h = - 1.0 / ndp_1 * (ndp_2 - ndp_1) / delta_t
-        return h
+        return self.hazard_vector([aDate])[:, 0]
+
+    def hazard_vector(self, dates):
+        k = numpy.searchsorted(self.pillars_number, to_ordinals(dates), side='right')
+        return self.hazard_table[:, k]
 
 
 # example
@@ -81,3 +153,4 @@ if __name__ == '__main__':
 
     hazard = cc.hazard(date(2014,7,1))
     print hazard
+    print cc.hazard_vector([date(2014,7,1), date(2016,7,1), date(2020,1,1)])
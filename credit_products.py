@@ -1,5 +1,6 @@
 from date_conventions import *
-from ir_curves import DiscountCurve
+import numpy
+from ir_curves import DiscountCurve, ForwardLiborCurve, interpolation_weights, log_linear
 from credit_curves import CreditCurve
 from dateutil.relativedelta import relativedelta
 from scipy.integrate import quad
@@ -13,65 +14,245 @@ class CDS:
     - recovery: the fraction of the bond expected to be recovered in case of default;
                 the protection leg pays 1 - recovery in such a case
     '''
-    def __init__(self, startDate, maturity, spread, recovery):
+    def __init__(self, startDate, maturity, spread, recovery, premiumDates=None, tau=None):
         self.startDate = startDate
-        tmpEndDate = startDate + relativedelta(months = maturity)
-        # The end date of a CDS must be one of the following dates:
-        # 20/03 - 20/06 - 20/09 - 20/12
-        # we have to take the one that immediately follows tmpEndDate
-        march = date(tmpEndDate.year, 3, 20)
-        june = date(tmpEndDate.year, 6, 20)
-        sept = date(tmpEndDate.year, 9, 20)
-        dec = date(tmpEndDate.year, 12, 20)
-        if tmpEndDate <= march:
-            self.endDate = march
-        elif tmpEndDate <= june:
-            self.endDate = june
-        elif tmpEndDate <= sept:
-            self.endDate = sept
-        elif tmpEndDate <= dec:
-            self.endDate = dec
+        if premiumDates is not None:
+            # the schedule is given (as ordinals, with its accruals): this is how the CDSStore of
+            # trade_store hands out its trades; the maturity is implied by the last date
+            self.endDate = date.fromordinal(int(to_ordinals(premiumDates)[-1]))
         else:
-            self.endDate = date(tmpEndDate.year+1, 3, 20)
+            tmpEndDate = startDate + relativedelta(months = maturity)
+            # The end date of a CDS must be one of the following dates:
+            # 20/03 - 20/06 - 20/09 - 20/12
+            # we have to take the one that immediately follows tmpEndDate
+            march = date(tmpEndDate.year, 3, 20)
+            june = date(tmpEndDate.year, 6, 20)
+            sept = date(tmpEndDate.year, 9, 20)
+            dec = date(tmpEndDate.year, 12, 20)
+            if tmpEndDate <= march:
+                self.endDate = march
+            elif tmpEndDate <= june:
+                self.endDate = june
+            elif tmpEndDate <= sept:
+                self.endDate = sept
+            elif tmpEndDate <= dec:
+                self.endDate = dec
+            else:
+                self.endDate = date(tmpEndDate.year+1, 3, 20)
 
         # store input parameters
         self.spread = spread
         self.recovery = recovery
 
         #compute the dates at which the spread is paid, plus the start date of the cds
-        self.premiumDates = dates_generator(3, self.startDate, self.endDate)
+        if premiumDates is None:
+            premiumDates = dates_generator(3, self.startDate, self.endDate)
+        self.premiumDates = premiumDates
 
-        # we compute the accruals
-        self.tau = []
-        for i in range(len(self.premiumDates) - 1):
-            startPeriod = self.premiumDates[i]
-            endPeriod = self.premiumDates[i+1]
-            self.tau.append(dc_act360(startPeriod, endPeriod))
+        # the schedule is compiled once into numpy arrays: payment ordinals and accruals
+        premiumOrdinals = to_ordinals(self.premiumDates)
+        self.premium_payment = premiumOrdinals[1:]
+        if tau is None:
+            tau = dc_act360_vector(premiumOrdinals[:-1], self.premium_payment)
+        self.tau = tau
 
     def premiumleg_npv(self, discountCurve, creditCurve):
-        premiumleg_npv = 0
-        for i in range(len(self.premiumDates) - 1):
-            paydate = self.premiumDates[i+1]
-            df = discountCurve.df(paydate)
-            ndp = creditCurve.ndp(paydate)
-            premiumleg_npv = premiumleg_npv + df * ndp * self.tau[i] * self.spread
+        # both curves are evaluated on all of the payment dates at once
+        dfs = discountCurve.df_vector(self.premium_payment)
+        ndps = creditCurve.ndp_vector(self.premium_payment)
+        premiumleg_npv = numpy.dot(dfs * ndps, self.tau) * self.spread
         return premiumleg_npv
 
-    def defaultleg_npv(self, discountCurve, creditCurve):
+    # the default leg pays 1 - recovery at the default time, i.e. it is the integral of
+    # df(t) * ndp(t) * h(t) * (1 - recovery) between the start and the end date. It can be computed with:
+    # - method = "analytic": the exact piecewise formula (see protection_leg), the default
+    # - method = "gauss": a Gauss-Legendre quadrature with a fixed number of nodes on each segment
+    # - method = "quad": the adaptive integration of scipy on the DefaultLegIntegrand
+    def defaultleg_npv(self, discountCurve, creditCurve, method="analytic", nodes=8):
         #we now evaluate the default leg
         # the extremes of the integral are expressed as a number of days
         t0 = self.startDate.toordinal();
         t1 = self.endDate.toordinal();
 
-        integrand = DefaultLegIntegrand(discountCurve, creditCurve, self.recovery)
-        integral = quad(integrand.integrand, t0, t1)
-        defaultleg_npv = integral[0]
+        if method == "quad":
+            integrand = DefaultLegIntegrand(discountCurve, creditCurve, self.recovery)
+            integral = quad(integrand.integrand, t0, t1)
+            defaultleg_npv = integral[0]
+        else:
+            defaultleg_npv = (1 - self.recovery) * protection_leg(discountCurve, creditCurve, t0, t1, method, nodes)
         return defaultleg_npv
 
     def npv(self, discountCurve, creditCurve):
         npv = self.premiumleg_npv(discountCurve, creditCurve) - self.defaultleg_npv(discountCurve, creditCurve)
         return npv
 
+# This function builds a CDS given its end date (usually one of 20/03 - 20/06 - 20/09 - 20/12, as the
+# ones quoted by the market) instead of its maturity in months
+def buildCDS(startDate, endDate, spread, recovery):
+    return CDS(startDate, None, spread, recovery, dates_generator(3, startDate, endDate))
+
+class FixedCouponBond:
+    ''' A bond of a risky issuer paying a fixed coupon, defined by its:
+    - startDate, endDate
+    - couponTenor: the number of months between two coupons
+    - coupon: the yearly fixed rate, accrued with the 30E/360 convention
+    - recovery: the fraction of the nominal received at default
+    - nominal
+    Each coupon and the nominal at the end date are paid only if the issuer has not defaulted yet,
+    so they are weighted with the survival probabilities; in case of default before the end date the
+    bond pays recovery * nominal at the default time (the recovery leg).
+    '''
+    def __init__(self, startDate, endDate, couponTenor, coupon, recovery, nominal=1):
+        self.startDate = startDate
+        self.endDate = endDate
+        self.couponTenor = couponTenor
+        self.coupon = coupon
+        self.recovery = recovery
+        self.nominal = nominal
+
+        # the schedule is compiled once into numpy arrays: payment ordinals and accruals
+        couponOrdinals = schedule_ordinals(couponTenor, startDate, endDate)
+        self.coupon_payment = couponOrdinals[1:]
+        self.tau = dc_30e360_vector(couponOrdinals[:-1], self.coupon_payment)
+
+    # The flows paid if the issuer survives, as the payment ordinals and the amounts
+    # (the nominal is added to the last coupon; a bond whose schedule has no coupons has no flows)
+    def cashflows(self):
+        amounts = self.nominal * self.coupon * self.tau
+        if len(amounts) > 0:
+            amounts[-1] = amounts[-1] + self.nominal
+        return self.coupon_payment, amounts
+
+    # the coupons and the nominal not yet paid, weighted by the survival probabilities
+    def riskyflows_npv(self, discountCurve, creditCurve):
+        payments, amounts = self.cashflows()
+        alive = payments > discountCurve.today.toordinal()
+        payments = payments[alive]
+        return numpy.dot(amounts[alive], discountCurve.df_vector(payments) * creditCurve.ndp_vector(payments))
+
+    # the recovery received at default between today (or the start date, if later) and the end date
+    def recoveryleg_npv(self, discountCurve, creditCurve):
+        return recoveryleg_npv(self, discountCurve, creditCurve)
+
+    def npv(self, discountCurve, creditCurve):
+        return self.riskyflows_npv(discountCurve, creditCurve) + self.recoveryleg_npv(discountCurve, creditCurve)
+
+class FloatingCouponBond:
+    ''' A bond of a risky issuer paying a floating coupon, defined by its:
+    - startDate, endDate
+    - liborTenor: the tenor of the libor, which is also the number of months between two coupons
+    - currentCoupon: the coupon rate (libor fixing plus margin) of the period running today, which is already known
+    - margin: the spread paid over the libor
+    - recovery: the fraction of the nominal received at default
+    - nominal
+    The coupons of the periods starting after today pay the forward libor plus the margin; all of the
+    coupons accrue with the act/360 convention. As for the FixedCouponBond the coupons and the nominal
+    are weighted with the survival probabilities and the bond pays recovery * nominal at default.
+    '''
+    def __init__(self, startDate, endDate, liborTenor, currentCoupon, margin, recovery, nominal=1):
+        self.startDate = startDate
+        self.endDate = endDate
+        self.liborTenor = liborTenor
+        self.currentCoupon = currentCoupon
+        self.margin = margin
+        self.recovery = recovery
+        self.nominal = nominal
+
+        # the schedule is compiled once into numpy arrays: fixing and payment ordinals and accruals
+        couponOrdinals = schedule_ordinals(liborTenor, startDate, endDate)
+        self.coupon_fixing = couponOrdinals[:-1]
+        self.coupon_payment = couponOrdinals[1:]
+        self.tau = dc_act360_vector(self.coupon_fixing, self.coupon_payment)
+
+    # the coupon rates: the current coupon if the period has already started, otherwise the
+    # forward libor (interpolated at once for all of the fixing dates) plus the margin
+    def coupon_rates(self, today, liborCurve):
+        fwd_libors = liborCurve.value_vector(self.coupon_fixing)
+        return numpy.where(self.coupon_fixing <= today, self.currentCoupon, fwd_libors + self.margin)
+
+    # The flows paid if the issuer survives, as the payment ordinals and the amounts
+    # (the nominal is added to the last coupon; a bond whose schedule has no coupons has no flows)
+    def cashflows(self, today, liborCurve):
+        amounts = self.nominal * self.coupon_rates(today, liborCurve) * self.tau
+        if len(amounts) > 0:
+            amounts[-1] = amounts[-1] + self.nominal
+        return self.coupon_payment, amounts
+
+    # the coupons and the nominal not yet paid, weighted by the survival probabilities
+    def riskyflows_npv(self, discountCurve, liborCurve, creditCurve):
+        today = discountCurve.today.toordinal()
+        payments, amounts = self.cashflows(today, liborCurve)
+        alive = payments > today
+        payments = payments[alive]
+        return numpy.dot(amounts[alive], discountCurve.df_vector(payments) * creditCurve.ndp_vector(payments))
+
+    # the recovery received at default between today (or the start date, if later) and the end date
+    def recoveryleg_npv(self, discountCurve, creditCurve):
+        return recoveryleg_npv(self, discountCurve, creditCurve)
+
+    def npv(self, discountCurve, liborCurve, creditCurve):
+        return self.riskyflows_npv(discountCurve, liborCurve, creditCurve) + self.recoveryleg_npv(discountCurve, creditCurve)
+
+# This function computes the recovery leg of a bond (FixedCouponBond or FloatingCouponBond): the
+# recovery times the nominal paid at default between today (or the start date, if later) and the end date
+def recoveryleg_npv(bond, discountCurve, creditCurve):
+    t0 = max(bond.startDate.toordinal(), discountCurve.today.toordinal())
+    t1 = bond.endDate.toordinal()
+    if t1 <= t0:
+        return 0.0
+    return bond.recovery * bond.nominal * protection_leg(discountCurve, creditCurve, t0, t1)
+
+# This function prices many FixedCouponBond at once (see risky_flows_npv). It returns an array with the npvs
+def risky_bonds_npv(bonds, discountCurve, creditCurve):
+    flows = [bond.cashflows() for bond in bonds]
+    owner = numpy.repeat(numpy.arange(len(bonds)), [len(flow[0]) for flow in flows])
+    payments = numpy.concatenate([flow[0] for flow in flows])
+    amounts = numpy.concatenate([flow[1] for flow in flows])
+    return risky_flows_npv(bonds, owner, payments, amounts, discountCurve, creditCurve)
+
+# This function prices many FloatingCouponBond at once: the forward libors of all of the fixing dates
+# of all of the bonds are interpolated in a single call and the coupons are computed for all of the
+# bonds together (see also risky_flows_npv). It returns an array with the npvs
+def floating_bonds_npv(bonds, discountCurve, liborCurve, creditCurve):
+    today = discountCurve.today.toordinal()
+    counts = [len(bond.coupon_payment) for bond in bonds]
+    owner = numpy.repeat(numpy.arange(len(bonds)), counts)
+    fixings = numpy.concatenate([bond.coupon_fixing for bond in bonds])
+    payments = numpy.concatenate([bond.coupon_payment for bond in bonds])
+    taus = numpy.concatenate([bond.tau for bond in bonds])
+
+    grid, index = numpy.unique(fixings, return_inverse=True)
+    fwd_libors = liborCurve.value_vector(grid)[index]
+    current_coupons = numpy.array([bond.currentCoupon for bond in bonds], dtype=numpy.float64)[owner]
+    margins = numpy.array([bond.margin for bond in bonds], dtype=numpy.float64)[owner]
+    nominals = numpy.array([bond.nominal for bond in bonds], dtype=numpy.float64)
+
+    rates = numpy.where(fixings <= today, current_coupons, fwd_libors + margins)
+    amounts = nominals[owner] * rates * taus
+    # the nominal is paid with the last coupon of each bond (the bonds without coupons have no flows)
+    counts = numpy.array(counts)
+    paying = counts > 0
+    amounts[(numpy.cumsum(counts) - 1)[paying]] += nominals[paying]
+    return risky_flows_npv(bonds, owner, payments, amounts, discountCurve, creditCurve)
+
+# This function computes the npvs of many bonds given all of their flows paid if the issuer survives
+# (owner tells the bond of each flow): the two curves are evaluated only once on the sorted grid of the
+# payment dates and the values are summed bond by bond with bincount. The recovery legs are computed
+# with cumulative_protection
+def risky_flows_npv(bonds, owner, payments, amounts, discountCurve, creditCurve):
+    today = discountCurve.today.toordinal()
+    grid, index = numpy.unique(payments, return_inverse=True)
+    risky_dfs = discountCurve.df_vector(grid) * creditCurve.ndp_vector(grid)
+    values = numpy.where(payments > today, amounts * risky_dfs[index], 0.0)
+    npvs = numpy.bincount(owner, values, minlength=len(bonds))
+
+    starts = numpy.maximum([bond.startDate.toordinal() for bond in bonds], today)
+    ends = numpy.array([bond.endDate.toordinal() for bond in bonds])
+    protection = cumulative_protection(discountCurve, creditCurve, numpy.concatenate((starts, ends)))
+    protection = numpy.maximum(protection[len(bonds):] - protection[:len(bonds)], 0.0)
+    recoveries = numpy.array([bond.recovery * bond.nominal for bond in bonds], dtype=numpy.float64)
+    return npvs + recoveries * protection
+
 class DefaultLegIntegrand:
     def __init__(self, discountCurve, creditCurve, recovery):
         self.discountCurve = discountCurve
@@ -89,6 +270,152 @@ class DefaultLegIntegrand:
         value = df * ndp * h * (1 - self.recovery)
         return value
 
+# This function computes the integral of df(t) * ndp(t) * h(t) between the ordinals t0 and t1, i.e.
+# the value of a unit payment at default between t0 and t1.
+# Both curves interpolate linearly the logarithms, therefore on each segment of the merged grid
+# made by the pillars of both curves (and by the two extremes) we have
+#   ln df(t) = ln df(a) - r * (t - a)     ln ndp(t) = ln ndp(a) - h * (t - a)
+# with r and h constant, and the integral on the segment [a, b] is known in closed form:
+#   h / (r + h) * (df(a) * ndp(a) - df(b) * ndp(b))
+# - method = "analytic" uses this formula
+# - method = "gauss" integrates each segment with a Gauss-Legendre rule with the given number of nodes
+# If one of the curves uses another interpolation scheme (see interpolation and log_linear) the closed
+# formula does not hold: whatever the method, each segment is integrated with protection_quadrature
+def protection_leg(discountCurve, creditCurve, t0, t1, method="analytic", nodes=8):
+    grid = protection_grid(discountCurve, creditCurve, t0, t1)
+    if not (log_linear(discountCurve) and log_linear(creditCurve)):
+        return numpy.sum(protection_quadrature(discountCurve, creditCurve, grid[:-1], grid[1:], nodes), axis=-1)
+
+    # the curves are evaluated once on the grid; the slopes of the logarithms give r and h.
+    # All of the operations are on the last axis, so that with curve cubes (one row per scenario)
+    # we get one value per scenario
+    ln_dfs = numpy.log(discountCurve.df_vector(grid))
+    ln_ndps = numpy.log(creditCurve.ndp_vector(grid))
+    delta_ln_ndp = ln_ndps[..., :-1] - ln_ndps[..., 1:]
+    delta_ln_p = delta_ln_ndp + ln_dfs[..., :-1] - ln_dfs[..., 1:]
+    p = numpy.exp(ln_dfs + ln_ndps)
+
+    if method == "analytic":
+        # if r + h is (almost) zero the ratio (p(a) - p(b)) / (r + h) tends to p(a) * (b - a):
+        # we use this limit to avoid dividing by zero
+        small = numpy.abs(delta_ln_p) < 1e-12
+        ratio = numpy.where(small, p[..., :-1], (p[..., :-1] - p[..., 1:]) / numpy.where(small, 1.0, delta_ln_p))
+        return numpy.sum(delta_ln_ndp * ratio, axis=-1)
+    elif method == "gauss":
+        x, w = numpy.polynomial.legendre.leggauss(nodes)
+        lengths = grid[1:] - grid[:-1]
+        hazards = delta_ln_ndp / lengths
+        rates = delta_ln_p / lengths
+        # the nodes of each segment are placed on the rows of a (segments x nodes) matrix
+        s = 0.5 * numpy.outer(lengths, x + 1.0)
+        integrand = p[..., :-1, numpy.newaxis] * numpy.exp(- rates[..., numpy.newaxis] * s) * hazards[..., numpy.newaxis]
+        return numpy.dot(integrand.dot(w), 0.5 * lengths)
+    else:
+        raise ValueError("Integration method not supported")
+
+# This function returns the integrals of df(t) * ndp(t) * h(t) on the intervals [a, b] (two arrays of
+# ordinals) computed with a Gauss-Legendre rule with the given number of nodes: the curves are evaluated
+# (all at once) on the nodes of all of the intervals, whatever their interpolation scheme
+def protection_quadrature(discountCurve, creditCurve, a, b, nodes=8):
+    x, w = numpy.polynomial.legendre.leggauss(nodes)
+    lengths = numpy.asarray(b, dtype=numpy.float64) - a
+    # the nodes of each interval are placed on the rows of a (intervals x nodes) matrix
+    t = (numpy.asarray(a, dtype=numpy.float64)[:, numpy.newaxis] + 0.5 * numpy.outer(lengths, x + 1.0)).ravel()
+    # the hazard rate is in 1 / years, while the intervals are in days
+    integrand = discountCurve.df_vector(t) * creditCurve.ndp_vector(t) * creditCurve.hazard_vector(t) / 365.0
+    integrand = integrand.reshape(integrand.shape[:-1] + (len(lengths), nodes))
+    return integrand.dot(w) * 0.5 * lengths
+
+# the points where the interpolation of a curve may have a kink: the knots of its interpolator, which are
+# the pillars plus, for some schemes (e.g. "monotoneconvex"), points inside the segments. The curve cubes
+# have no interpolator and only their pillars
+def curve_knots(curve):
+    interpolator = getattr(curve, 'interpolator', None)
+    return curve.pillars_number if interpolator is None else interpolator.knots
+
+# the merged grid of protection_leg: the extremes plus all of the knots of the two curves in between, so
+# that the integrand is smooth on each segment
+def protection_grid(discountCurve, creditCurve, t0, t1):
+    pillars = numpy.concatenate((curve_knots(discountCurve), curve_knots(creditCurve)))
+    inner = pillars[(pillars > t0) & (pillars < t1)]
+    return numpy.unique(numpy.concatenate(([t0, t1], inner))).astype(numpy.float64)
+
+# This function returns, for each of the ordinals, the integral of protection_leg from the first pillar
+# of the two curves up to the ordinal, so that the protection leg between t0 and t1 of any number of
+# trades is cumulative_protection(t1) - cumulative_protection(t0).
+# The integrals of the segments of the merged grid of the knots of the two curves (see curve_knots) are
+# computed (and summed up) once; the part of the segment containing each ordinal uses the same closed
+# formula. Before the first pillar and after the last one the hazard rate is zero, so nothing is added there.
+# With the other interpolation schemes the integrals are computed with protection_quadrature
+def cumulative_protection(discountCurve, creditCurve, ordinals, nodes=8):
+    grid = numpy.unique(numpy.concatenate((curve_knots(discountCurve), curve_knots(creditCurve))))
+    if not (log_linear(discountCurve) and log_linear(creditCurve)):
+        cumulated = numpy.concatenate(([0.0], numpy.cumsum(protection_quadrature(discountCurve, creditCurve,
+                                                                                 grid[:-1], grid[1:], nodes))))
+        t = numpy.clip(numpy.asarray(ordinals, dtype=numpy.float64), grid[0], grid[-1])
+        k = numpy.clip(numpy.searchsorted(grid, t, 'right') - 1, 0, max(len(grid) - 2, 0))
+        return cumulated[k] + protection_quadrature(discountCurve, creditCurve, grid[k], t, nodes)
+    ln_dfs = numpy.log(discountCurve.df_vector(grid))
+    ln_ndps = numpy.log(creditCurve.ndp_vector(grid))
+    lengths = grid[1:] - grid[:-1]
+    hazards = (ln_ndps[:-1] - ln_ndps[1:]) / lengths
+    rates = hazards + (ln_dfs[:-1] - ln_dfs[1:]) / lengths
+    p = numpy.exp(ln_dfs + ln_ndps)
+
+    def integral(k, s):
+        # the integral on [grid[k], grid[k] + s], with the limit for r + h going to zero
+        delta_ln_p = rates[k] * s
+        small = numpy.abs(delta_ln_p) < 1e-12
+        ratio = numpy.where(small, s, (1.0 - numpy.exp(- delta_ln_p)) / numpy.where(small, 1.0, rates[k]))
+        return hazards[k] * p[k] * ratio
+
+    segments = numpy.arange(len(lengths))
+    cumulated = numpy.concatenate(([0.0], numpy.cumsum(integral(segments, lengths))))
+
+    t = numpy.clip(numpy.asarray(ordinals, dtype=numpy.float64), grid[0], grid[-1])
+    k = numpy.clip(numpy.searchsorted(grid, t, 'right') - 1, 0, len(lengths) - 1)
+    return cumulated[k] + integral(k, t - grid[k])
+
+# This function returns the derivatives of protection_leg (analytic) with respect to the logarithms of
+# the discount factors and of the survival probabilities at the pillars of the two curves (the first
+# pillar, i.e. today, excluded). On the segment [a, b] of the grid, with
+#   P = df * ndp,  dn = ln ndp(a) - ln ndp(b),  dp = ln P(a) - ln P(b),  phi(u) = (1 - exp(-u)) / u
+# the integral is dn * P(a) * phi(dp), whose derivatives with respect to the four logarithms at the
+# extremes are simple; they are then chained to the pillars through the interpolation weights (the
+# curves must use the default interpolation scheme)
+def protection_leg_gradient(discountCurve, creditCurve, t0, t1):
+    if not (log_linear(discountCurve) and log_linear(creditCurve)):
+        raise ValueError("The gradient of the protection leg needs log-linear curves")
+    grid = protection_grid(discountCurve, creditCurve, t0, t1)
+    ln_dfs = numpy.log(discountCurve.df_vector(grid))
+    ln_ndps = numpy.log(creditCurve.ndp_vector(grid))
+    dn = ln_ndps[:-1] - ln_ndps[1:]
+    dp = dn + ln_dfs[:-1] - ln_dfs[1:]
+    p_a = numpy.exp(ln_dfs[:-1] + ln_ndps[:-1])
+
+    # phi and its derivative, with their Taylor expansion when dp is (almost) zero
+    small = numpy.abs(dp) < 1e-6
+    u = numpy.where(small, 1.0, dp)
+    phi = numpy.where(small, 1.0 - dp / 2.0 + dp**2 / 6.0, (1.0 - numpy.exp(-u)) / u)
+    phi_prime = numpy.where(small, -0.5 + dp / 3.0, (numpy.exp(-u) * (1.0 + u) - 1.0) / u**2)
+
+    d_ln_df_a = dn * p_a * (phi + phi_prime)
+    d_ln_df_b = - dn * p_a * phi_prime
+    d_ln_ndp_a = p_a * phi + d_ln_df_a
+    d_ln_ndp_b = - p_a * phi + d_ln_df_b
+
+    # the derivatives with respect to the values on the grid...
+    d_ln_dfs = numpy.zeros(len(grid))
+    d_ln_dfs[:-1] = d_ln_df_a
+    d_ln_dfs[1:] = d_ln_dfs[1:] + d_ln_df_b
+    d_ln_ndps = numpy.zeros(len(grid))
+    d_ln_ndps[:-1] = d_ln_ndp_a
+    d_ln_ndps[1:] = d_ln_ndps[1:] + d_ln_ndp_b
+
+    # ... are chained to the pillars
+    d_discount = d_ln_dfs.dot(interpolation_weights(grid, discountCurve.pillars_number))[1:]
+    d_credit = d_ln_ndps.dot(interpolation_weights(grid, creditCurve.pillars_number))[1:]
+    return d_discount, d_credit
 
 # example
 if __name__ == '__main__':
@@ -104,4 +431,24 @@ if __name__ == '__main__':
 
     cds = CDS(obsdate, 12, 0.03, 0.4)
     print cds.npv(dc, cc)
+    print "default leg (analytic, gauss, quad):", cds.defaultleg_npv(dc, cc), cds.defaultleg_npv(dc, cc, "gauss"), cds.defaultleg_npv(dc, cc, "quad")
+
+    # with monotone convex curves the analytic default leg is computed by Gauss-Legendre quadrature
+    # between the knots of the two curves; the reference integrates the same curves with quad (the
+    # method "quad" rounds the dates to days, so it is less precise)
+    mc_cc = CreditCurve(obsdate, [date(2011,1,1), date(2012,1,1), date(2015,1,1)], [0.95, 0.9, 0.7], "monotoneconvex")
+    mc_dc = DiscountCurve(obsdate, [date(2011,1,1), date(2012,1,1), date(2015,1,1)], [0.9, 0.8, 0.7], "monotoneconvex")
+    mc_cds = CDS(obsdate, 50, 0.03, 0.4)
+    t0, t1 = mc_cds.startDate.toordinal(), mc_cds.endDate.toordinal()
+    grid = protection_grid(mc_dc, mc_cc, t0, t1)
+    density = lambda t: mc_dc.df_vector([t])[0] * mc_cc.ndp_vector([t])[0] * mc_cc.hazard_vector([t])[0] / 365.0
+    reference = (1 - mc_cds.recovery) * sum(quad(density, a, b, epsabs=1e-15)[0] for a, b in zip(grid[:-1], grid[1:]))
+    print "monotone convex default leg (analytic, reference):", mc_cds.defaultleg_npv(mc_dc, mc_cc), reference
+
+
+    bonds = [FixedCouponBond(date(2009,7,1), date(2013,7,1), 6, 0.05, 0.4), FixedCouponBond(date(2010,3,1), date(2011,9,1), 12, 0.03, 0.2, 100)]
+    print "bond npvs:", [bond.npv(dc, cc) for bond in bonds], risky_bonds_npv(bonds, dc, cc)
 
+    libor = ForwardLiborCurve(obsdate, [date(2010,1,1), date(2012,1,1)], [0.01, 0.02])
+    frns = [FloatingCouponBond(date(2009,7,1), date(2013,7,1), 6, 0.012, 0.01, 0.4), FloatingCouponBond(date(2010,3,1), date(2011,9,1), 6, 0.0, 0.005, 0.2, 100)]
+    print "floating bond npvs:", [frn.npv(dc, libor, cc) for frn in frns], floating_bonds_npv(frns, dc, libor, cc)
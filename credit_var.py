@@ -0,0 +1,108 @@
+# numpy is a numerical package
+import numpy
+
+# ndtri is the inverse of the cumulative distribution function of the standard normal
+from scipy.special import ndtri
+
+from montecarlo import split_runs, worker_random_states, run_parallel
+
+class CreditVaR:
+    ''' The Credit VaR of a portfolio of names, each of which may default before the horizon.
+    The defaults are correlated by means of a Gaussian one-factor copula: the name i defaults if
+      sqrt(correlation) * Z + sqrt(1 - correlation) * epsilon_i < N^-1(PD_i)
+    where Z is the common (systemic) factor, epsilon_i the idiosyncratic one and PD_i = 1 - NDP_i(horizon)
+    is the default probability given by the credit curve of the name. In case of default the loss is
+    exposure * (1 - recovery).
+
+    The simulation is vectorized on both the paths and the names, but it is done in chunks of
+    pathChunk paths and nameChunk names, so that the largest matrix in memory has
+    pathChunk x nameChunk elements whatever the size of the portfolio and the number of paths;
+    only the loss of each path is kept. The paths can be split among many processes.
+    With the same seed the losses are reproducible for a given number of processes and pathChunk;
+    nameChunk only changes the memory used, not the losses (see simulate_losses).
+    '''
+    def __init__(self, horizon, correlation):
+        self.horizon = horizon
+        self.correlation = correlation
+        self.exposures = []
+        self.recoveries = []
+        self.default_probabilities = []
+
+    # we add a name given its exposure, the expected recovery and its credit curve
+    def addName(self, exposure, recovery, creditCurve):
+        self.exposures.append(exposure)
+        self.recoveries.append(recovery)
+        self.default_probabilities.append(1.0 - creditCurve.ndp(self.horizon))
+
+    # we add the reference name of a CDS: a protection seller (positive nominal) pays
+    # nominal * (1 - recovery) in case of default, a protection buyer (negative nominal) receives it
+    def addCDS(self, cds, nominal, creditCurve):
+        self.addName(nominal, cds.recovery, creditCurve)
+
+    # This method returns the simulated losses, one per path
+    # - seed, nworkers: see montecarlo.worker_random_states; the same seed, number of workers and
+    #   pathChunk always give the same losses, whatever nameChunk (see simulate_losses)
+    def losses(self, npaths, seed=0, nworkers=1, pathChunk=10000, nameChunk=100):
+        thresholds = ndtri(numpy.array(self.default_probabilities, dtype=numpy.float64))
+        lgds = numpy.array(self.exposures, dtype=numpy.float64) * (1.0 - numpy.array(self.recoveries, dtype=numpy.float64))
+        tasks = []
+        for runs, randomState in zip(split_runs(npaths, nworkers), worker_random_states(seed, nworkers)):
+            tasks.append((thresholds, lgds, self.correlation, runs, randomState, pathChunk, nameChunk))
+        return numpy.concatenate(run_parallel(simulate_losses_worker, tasks, nworkers))
+
+    # This method returns a tuple with the expected loss, the VaR (the loss quantile at the given
+    # level) and the expected shortfall (the average of the losses not smaller than the VaR)
+    def var(self, npaths, level=0.99, seed=0, nworkers=1, pathChunk=10000, nameChunk=100):
+        losses = self.losses(npaths, seed, nworkers, pathChunk, nameChunk)
+        var = numpy.percentile(losses, 100.0 * level)
+        expected_shortfall = losses[losses >= var].mean()
+        return losses.mean(), var, expected_shortfall
+
+
+# This function simulates the losses of npaths paths of the copula (see CreditVaR) drawing the
+# random numbers from randomState, pathChunk paths and nameChunk names at a time.
+# For each block of paths the systemic factors are drawn first, then the idiosyncratic ones name after
+# name (each chunk of names is a names x paths matrix, filled by rows): the numbers drawn do not depend on
+# nameChunk, so neither do the losses. They do depend on pathChunk, which sets the order of the blocks
+def simulate_losses(thresholds, lgds, correlation, npaths, randomState, pathChunk, nameChunk):
+    systemic = numpy.sqrt(correlation)
+    idiosyncratic = numpy.sqrt(1.0 - correlation)
+    losses = numpy.zeros(npaths)
+    for start in range(0, npaths, pathChunk):
+        end = min(start + pathChunk, npaths)
+        factor = systemic * randomState.standard_normal(end - start)
+        for first in range(0, len(thresholds), nameChunk):
+            last = min(first + nameChunk, len(thresholds))
+            epsilon = randomState.standard_normal((last - first, end - start))
+            defaults = factor + idiosyncratic * epsilon < thresholds[first:last, numpy.newaxis]
+            losses[start:end] = losses[start:end] + lgds[first:last].dot(defaults)
+    return losses
+
+# The function executed by each worker of CreditVaR.losses: it just unpacks the task
+def simulate_losses_worker(task):
+    return simulate_losses(*task)
+
+
+# example
+from datetime import date
+from credit_curves import CreditCurve
+
+if __name__ == '__main__':
+    today = date(2013,10,31)
+    horizon = date(2014,10,31)
+    credit_var = CreditVaR(horizon, 0.3)
+
+    # 200 names with different credit quality
+    for i in range(200):
+        ndp = 0.99 - 0.0002 * i
+        cc = CreditCurve(today, [date(2014,12,20), date(2018,12,20)], [ndp, ndp**4])
+        credit_var.addName(1000000, 0.4, cc)
+
+    expected_loss, var, expected_shortfall = credit_var.var(100000, 0.99, seed=1, nworkers=2)
+    print "Expected loss:", expected_loss
+    print "99% Credit VaR:", var
+    print "99% Expected shortfall:", expected_shortfall
+
+    # the chunks of names only change the memory used: the losses are the same
+    print "Same losses with 10 names per chunk:", numpy.array_equal(credit_var.losses(10000, seed=1, nameChunk=10),
+                                                                    credit_var.losses(10000, seed=1, nameChunk=100))
@@ -1,65 +1,82 @@
 from datetime import date
-from openpyxl import load_workbook
+from ingestion import excel_cells, excel_batches, read_table, batch_results, write_column, as_date, as_float, as_int, as_text
+from ois_bootstrap import DiscountCurveBootstrap
+from curve_cache import curve_cache
+from ois_products import buildOIS
+from credit_products import buildCDS
+from credit_bootstrap import CreditCurveBootstrap
+from trade_store import buildCDSStore
 
 if __name__ == '__main__':
-    wb = load_workbook('CreditCurveBootstrap.xlsx')
-    ws = wb.active
+    # the workbook is read in streaming (see ingestion): each table goes on until its first empty row
+    input_file = 'CreditCurveBootstrap.xlsx'
 
     # Take the input parameters
-    today = ws['C2'].value.date()
-    cds_recovery = ws['C3'].value
+    today, cds_recovery = excel_cells(input_file, ['C2', 'C3'])
+    today = as_date(today)
     cds_startdate = today # We assume that all of the cds start today
 
     # OIS Data
     ois_startdate = today
-    ois_maturities = []
-    ois_mktquotes = []
-    for cell in list(ws.iter_rows('B16:C45')):
-        ois_maturities.append(cell[0].value)
-        ois_mktquotes.append(cell[1].value)
+    ois = read_table(excel_batches(input_file, 'B16', [('maturity', as_int), ('quote', as_float)]))
+    ois_maturities = ois['maturity']
+    ois_mktquotes = ois['quote']
 
     # CDS Input Data
-    cds_input_maturities = []
-    cds_input_quotes = []
-    for cell in list(ws.iter_rows('B7:C12')):
-        cds_input_maturities.append(cell[0].value)
-        cds_input_quotes.append(cell[1].value)
+    # (the sheet gives the maturities of the quoted CDS as their end dates)
+    cds_quotes = read_table(excel_batches(input_file, 'B7', [('maturity', as_date), ('quote', as_float)]))
+    cds_input_maturities = cds_quotes['maturity']
+    cds_input_quotes = cds_quotes['quote']
 
-    # CDS Output Data
-    nominals = []
-    cds_types = []
-    maturities = []
-    spreads = []
-
-    for cell in list(ws.iter_rows('E5:H19')):
-        nominals.append(cell[0].value)
-        cds_types.append(cell[1].value)
-        maturities.append(cell[2].value)
-        spreads.append(cell[3].value)
+    # CDS Output Data: the book is read (and priced) one batch at a time
+    cds_batches = lambda: excel_batches(input_file, 'E5', [('nominal', as_float), ('type', as_text),
+                                                           ('maturity', as_int), ('spread', as_float)])
 
 
     # YOUR CODE HERE ....
     # In the calculation of the npv of output CDS, please note that you have to take into account
     # both the nominal and the type, i.e if the present value is seen from the protection seller or
     # the protection buyer
-    # The result of your code must be a variables of type list named
-    # output_npv. The length of this list has to be the equal to the number of output cds
-    # i.e len(nominals) for example
+    # The result of your code must be an iterable named output_npv, with one npv per output cds
 
+    # the discount curve is bootstrapped from the OIS quotes (fixed leg with annual payments); the curves
+    # are taken from the curve cache (see curve_cache), so they are built only once for the same quotes
+    dc_bootstrapper = DiscountCurveBootstrap(today)
+    for maturity, quote in zip(ois_maturities, ois_mktquotes):
+        dc_bootstrapper.addProduct(buildOIS(ois_startdate, maturity, 12, quote))
+    dc_curve = dc_bootstrapper.bootstrap(cache=curve_cache)
 
+    # the credit curve is bootstrapped from the CDS quotes, given with their end dates
+    cds_bootstrapper = CreditCurveBootstrap(today, dc_curve)
+    for endDate, quote in zip(cds_input_maturities, cds_input_quotes):
+        cds_bootstrapper.addProduct(buildCDS(cds_startdate, endDate, quote, cds_recovery))
+    credit_curve = cds_bootstrapper.bootstrap(cache=curve_cache)
 
+    # the CDS of a batch are stored together and priced in a single call; CDS.npv is the value for the
+    # protection seller (the premiums received minus the protection paid). The npvs are written while
+    # the next batches are read
+    def cds_npv(batch):
+        nominals = batch['nominal']
+        cds_store = buildCDSStore([cds_startdate.toordinal()] * len(nominals), batch['maturity'], batch['spread'], cds_recovery)
+        seller_npvs = cds_store.npv(dc_curve, credit_curve)
+        npvs = []
+        for nominal, cds_type, npv in zip(nominals, batch['type'], seller_npvs):
+            if cds_type == "seller":
+                npvs.append(nominal * npv)
+            elif cds_type == "buyer":
+                npvs.append(- nominal * npv)
+            else:
+                raise ValueError("CDS type not supported")
+        return npvs
+    output_npv = batch_results(cds_batches(), cds_npv)
 
     # END OF YOUR CODE
 
     # Write results
-    # A variable named output_results of type list, with the same length of output_dates, is expected.
+    # A variable named output_npv, with one value per output cds, is expected.
     # In case this is not present, a message is written
     if 'output_npv' not in locals():
-        output_npv = ["Not Successful" for x in range(len(nominals))]
-
-    out_list = list(ws.iter_rows('I5:I19'))
-    for i in range(len(output_npv)):
-        out_list[i][0].value = output_npv[i]
+        output_npv = batch_results(cds_batches(), lambda batch: ["Not Successful" for x in batch['nominal']])
 
     # A new file with the results is created
-    wb.save("CreditCurveBootstrap_output.xlsx")
\ No newline at end of file
+    write_column(input_file, "CreditCurveBootstrap_output.xlsx", 'I5', output_npv)
\ No newline at end of file
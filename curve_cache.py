@@ -0,0 +1,248 @@
+# numpy is a numerical package
+import numpy
+import os
+import sys
+import shutil
+import tempfile
+import threading
+# hashlib computes the hash (the "fingerprint") of a string
+import hashlib
+from datetime import date
+
+from caching import LRUCache
+from storage import save_curve, load_curve, curve_data
+
+# The curves bootstrapped from the same market data are the same curves: the CurveCache keeps them,
+# so that who asks again for a curve built from the same snapshot gets the one already built instead of
+# running the bootstrap again. A snapshot is identified by the hash of everything the curve depends on
+# (see snapshot_key):
+# - the kind of curve (e.g. "OIS discount curve")
+# - the observation date
+# - the definitions of the instruments (e.g. maturity and payment frequency of each OIS)
+# - their quotes
+# - the interpolation scheme
+# - the keys of the curves used by the bootstrap (e.g. the discount curve of a libor bootstrap)
+# - cache_version, the version of the code that builds the curves
+# The curves are kept in memory in a LRUCache with a budget of bytes and, optionally, saved in a
+# directory (with storage.save_curve), which is shared by all of the processes that use it. The directory
+# must be private to the user (see user_directory): the curves found there are trusted.
+# The bootstrappers compute the key of their snapshot (see their method key) and take their curve from a
+# cache when one is given to their method bootstrap.
+# N.B. the curves returned by the cache are shared: they must not be changed (e.g. with set_df).
+
+# This function returns a text that represents value in a unique way: dates, numbers (python or numpy),
+# texts, lists, tuples, dictionaries and arrays are supported
+def canonical(value):
+    if isinstance(value, date):
+        return 'd' + value.isoformat()
+    if isinstance(value, numpy.ndarray):
+        return canonical(value.tolist())
+    if isinstance(value, numpy.generic):
+        return canonical(value.item())
+    if isinstance(value, float):
+        # repr gives all of the digits of the number
+        return 'f' + repr(value)
+    if isinstance(value, (int, long)):
+        return 'i' + str(value)
+    if isinstance(value, basestring):
+        return 's' + repr(str(value))
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(canonical(element) for element in value) + ']'
+    if isinstance(value, dict):
+        return '{' + ','.join(canonical(key) + ':' + canonical(value[key]) for key in sorted(value)) + '}'
+    if value is None:
+        return 'n'
+    raise ValueError("Value not supported in a snapshot key")
+
+# The version of the curves built by this code: it is part of every key, so it must be increased
+# whenever the bootstraps, the interpolation or the format of the saved curves change, otherwise the
+# curves saved in a directory by the previous version would be found again
+cache_version = 1
+
+# This function returns the key of a market data snapshot (see above): instruments and quotes are lists
+# with one element per instrument, parents the keys of the curves used by the bootstrap
+def snapshot_key(kind, today, instruments, quotes, scheme="loglinear", parents=()):
+    text = canonical([cache_version, kind, today, list(instruments), list(quotes), scheme, list(parents)])
+    return hashlib.sha1(text).hexdigest()
+
+# the key of a curve given what it contains (e.g. the discount curve used by a bootstrap): the curves of
+# the same class with the same observation date, pillars, values and interpolation scheme have the same key
+def curve_key(curve):
+    kind, today, pillars, values = curve_data(curve)
+    text = canonical([cache_version, kind, today, pillars, values, getattr(curve, 'interpolation', None)])
+    return hashlib.sha1(text).hexdigest()
+
+# the directory of the curves of the current user (in the home directory), which the other users cannot write:
+# it can be given to a CurveCache to share the curves among the processes of the user
+def user_directory():
+    return os.path.join(os.path.expanduser('~'), '.curve_cache')
+
+# the (approximate) number of bytes used by a curve: its arrays, its lists of dates and values and the
+# objects it contains (e.g. the interpolator, with its knots and coefficients)
+def curve_nbytes(curve):
+    nbytes = 0
+    for value in vars(curve).values():
+        if isinstance(value, numpy.ndarray):
+            nbytes = nbytes + value.nbytes
+        elif isinstance(value, list):
+            nbytes = nbytes + sys.getsizeof(value) + sum(sys.getsizeof(element) for element in value)
+        elif hasattr(value, '__dict__'):
+            nbytes = nbytes + sys.getsizeof(value) + curve_nbytes(value)
+        else:
+            nbytes = nbytes + sys.getsizeof(value)
+    return nbytes
+
+
+class CurveCache:
+    ''' The cache of the bootstrapped curves (see above):
+    - maxbytes: the budget of memory of the curves kept in memory (the least recently used ones are
+      removed when it is exceeded)
+    - directory: if given, the curves are also saved there and the ones not in memory are looked for
+      there before being built; each curve is written in a temporary directory which is then renamed,
+      so that the other processes never see a curve only partially written. The directory is created
+      (readable and writable only by the user) when the first curve is saved; if a curve cannot be
+      saved it is only kept in memory
+    The cache can be used by many threads: when some of them ask at the same time for a curve which is
+    not in the cache, only the first one builds it and the other ones wait for it.
+    '''
+    def __init__(self, maxbytes, directory=None):
+        self.memory = LRUCache(None, maxbytes, curve_nbytes)
+        self.directory = directory
+        # lock protects memory and building; building has a lock for each curve being built
+        self.lock = threading.Lock()
+        self.building = {}
+        self.builds = 0
+
+    # This method returns the curve with the given key: if it is neither in memory nor in the directory,
+    # it is built calling builder (a function without arguments, e.g. the bootstrap method of a
+    # bootstrapper) and stored
+    def get(self, key, builder):
+        with self.lock:
+            if key in self.memory:
+                return self.memory.get(key)
+            key_lock = self.building.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                # the curve may have been built by another thread while we were waiting
+                with self.lock:
+                    curve = self.memory.get(key) if key in self.memory else None
+                if curve is None:
+                    curve = self.load(key)
+                    if curve is None:
+                        curve = builder()
+                        self.builds = self.builds + 1
+                        self.save(key, curve)
+                    with self.lock:
+                        self.memory.put(key, curve)
+        finally:
+            # also if the builder fails: the threads waiting for the curve try to build it themselves
+            with self.lock:
+                self.building.pop(key, None)
+        return curve
+
+    # the curve saved in the directory with the given key (None if there is none)
+    def load(self, key):
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        if hasattr(os, 'getuid') and os.stat(path).st_uid != os.getuid():
+            # a curve saved by another user is not trusted
+            return None
+        try:
+            return load_curve(path)
+        except (IOError, OSError, ValueError):
+            # a curve which cannot be read is built again
+            return None
+
+    def save(self, key, curve):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory, 0o700)
+            except OSError:
+                # another process has just created it (or it cannot be created: see below)
+                pass
+        try:
+            temporary = tempfile.mkdtemp(dir=self.directory)
+        except OSError:
+            # the directory cannot be written: the curve stays in memory only
+            return
+        try:
+            save_curve(temporary, curve)
+            os.rename(temporary, path)
+        except (IOError, OSError):
+            # another process has already saved the same curve, or the disk is full
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    # it removes the curves from memory (not from the directory)
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __contains__(self, key):
+        return key in self.memory
+
+# the cache shared by the scripts (e.g. the projects, which bootstrap their curves from the same quotes):
+# 64 MB of curves, in memory only. The curves can also be shared among the processes of a user with
+# CurveCache(maxbytes, user_directory())
+curve_cache = CurveCache(64 * 1024 * 1024)
+
+
+# example
+if __name__ == '__main__':
+    # the bootstrappers import this module, so they are imported here
+    import time
+    from ois_bootstrap import DiscountCurveBootstrap
+    from ois_products import buildOIS
+
+    today = date(2013,10,31)
+    maturities = [12, 24, 60, 120, 240]
+    quotes = [0.0014, 0.002, 0.0075, 0.0165, 0.0232]
+
+    def ois_bootstrapper(quotes, interpolation="loglinear"):
+        bootstrapper = DiscountCurveBootstrap(today, interpolation)
+        for maturity, quote in zip(maturities, quotes):
+            bootstrapper.addProduct(buildOIS(today, maturity, 12, quote))
+        return bootstrapper
+
+    bootstrapper = ois_bootstrapper(quotes)
+    def slow_bootstrap():
+        # a slow bootstrap, so that the threads below ask for the curve while it is being built
+        time.sleep(0.5)
+        return bootstrapper.bootstrap()
+
+    # the key is computed by the bootstrapper from its products, their quotes and the interpolation
+    key = bootstrapper.key()
+    directory = tempfile.mkdtemp()
+    try:
+        cache = CurveCache(1024 * 1024, directory)
+
+        # 8 pricing jobs on the same snapshot at the same time
+        curves = []
+        threads = [threading.Thread(target=lambda: curves.append(cache.get(key, slow_bootstrap))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print "Bootstraps run by 8 threads:", cache.builds, "same curve:", all(curve is curves[0] for curve in curves)
+
+        # another quote or another interpolation scheme give another key
+        print "Key of the snapshot:", key
+        print "Key with a new quote:", ois_bootstrapper(quotes[:-1] + [0.0233]).key()
+        print "Key with the cubic interpolation:", ois_bootstrapper(quotes, "cubic").key()
+
+        # a new cache on the same directory (e.g. in another process) finds the curve saved by the first one
+        other = CurveCache(1024 * 1024, directory)
+        curve = ois_bootstrapper(quotes).bootstrap(cache=other)
+        print "Bootstraps run by the second cache:", other.builds, "same dfs:", numpy.array_equal(curve.dfs, curves[0].dfs)
+        print "Bytes in memory:", cache.memory.nbytes
+    finally:
+        shutil.rmtree(directory)
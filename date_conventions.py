@@ -1,10 +1,28 @@
+import numpy
 from datetime import date
 from dateutil.relativedelta import relativedelta
+from caching import LRUCache
+
+# the ordinal (see date.toordinal) of the 1st January 1970, which is the origin of numpy.datetime64
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
 # this function converts the excel date representation to the pythonic one
 def date_from_xl(xl_value):
     return date.fromordinal(xl_value + 693594)
 
+# this function converts a date, a list of dates or an array of ordinals to a numpy array of ordinals
+# (i.e. the number returned by date.toordinal); numbers are passed through untouched so that
+# already converted arrays do not pay the conversion again
+# numpy.datetime64 arrays are converted as well
+def to_ordinals(dates):
+    values = numpy.asarray(dates)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[D]').astype(numpy.int64) + EPOCH_ORDINAL
+    if values.dtype == object:
+        ordinals = numpy.fromiter((aDate.toordinal() for aDate in values.ravel()), dtype=numpy.int64, count=values.size)
+        return ordinals.reshape(values.shape)
+    return values
+
 # this function computes the difference between two dates with the act/360 day count convention
 def dc_act360(startDate, endDate):
     return (endDate.toordinal() - startDate.toordinal())/360.0
@@ -23,29 +41,124 @@ def dc_30e360(startDate, endDate):
     if d2 == 31: d2 = 30
     return (360.0*(y2-y1) + 30.0*(m2-m1) + (d2-d1)) / base_day
 
-# this function is used to generate a list of dates, between startdate and enddate,
-# each of which is "tenor"-months distant from the other (except the first: "short coupon stub")
-def dates_generator(tenor, startdate, enddate):
-    # we start with an empty list and populate it
-    relevantdates = []
+# the vector versions of the day count conventions: they take two arrays with the start and the end
+# dates of many periods (as ordinals, numpy.datetime64 or lists of dates) and return the array of
+# the accrual periods
+def dc_act360_vector(startDates, endDates):
+    return (to_ordinals(endDates) - to_ordinals(startDates)) / 360.0
+
+def dc_act365_vector(startDates, endDates):
+    return (to_ordinals(endDates) - to_ordinals(startDates)) / 365.0
+
+# since 360 * (y2 - y1) + 30 * (m2 - m1) = 30 * (number of months between the two months), we just
+# need the months (counted from a common origin) and the days of the dates
+def dc_30e360_vector(startDates, endDates):
+    m1, d1 = ordinals_to_months_days(to_ordinals(startDates))
+    m2, d2 = ordinals_to_months_days(to_ordinals(endDates))
+    d1 = numpy.minimum(d1, 30)
+    d2 = numpy.minimum(d2, 30)
+    return (30.0 * (m2 - m1) + (d2 - d1)) / 360.0
+
+# the registry of the day count conventions, so that a convention can be chosen by its name
+day_counts = {'act/360': dc_act360, 'act/365': dc_act365, '30e/360': dc_30e360}
+day_count_vectors = {'act/360': dc_act360_vector, 'act/365': dc_act365_vector, '30e/360': dc_30e360_vector}
+
+# these functions return the (scalar or vector) day count convention with the given name
+def day_count(name):
+    if name.lower() not in day_counts:
+        raise ValueError("Day count convention not supported: " + name)
+    return day_counts[name.lower()]
+
+def day_count_vector(name):
+    if name.lower() not in day_count_vectors:
+        raise ValueError("Day count convention not supported: " + name)
+    return day_count_vectors[name.lower()]
+
+# this function splits an array of ordinals in the (numpy) arrays of the month, counted from January 1970,
+# and of the day of the month
+def ordinals_to_months_days(ordinals):
+    days = (numpy.asarray(ordinals, dtype=numpy.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    day = (days - months.astype('datetime64[D]')).astype(numpy.int64) + 1
+    return months.astype(numpy.int64), day
 
-    # N.B. We start from the end date and proceed backward in time
-    runningdate = enddate
-    i = 1
-    while (runningdate > startdate):
-        relevantdates.append(runningdate)
-        runningdate = enddate - relativedelta(months = i * tenor)
-        i = i + 1
-    relevantdates.append(startdate)
+# the inverse of ordinals_to_months_days; if the day does not exist in the month (e.g. the 31st of
+# April) the last day of the month is used, as relativedelta does
+def months_days_to_ordinals(months, day):
+    months = numpy.asarray(months, dtype=numpy.int64).astype('datetime64[M]')
+    first = months.astype('datetime64[D]').astype(numpy.int64)
+    days_in_month = (months + 1).astype('datetime64[D]').astype(numpy.int64) - first
+    return first + numpy.minimum(day, days_in_month) - 1 + EPOCH_ORDINAL
 
-    # we sort these dates from the oldest to the newest
-    relevantdates = sorted(relevantdates)
+# this function generates the schedules of many trades at once: the i-th schedule contains the same
+# dates (as ordinals) of dates_generator(tenors[i], startdates[i], enddates[i]).
+# The result is a tuple (offsets, ordinals): all of the schedules are concatenated in ordinals and
+# the i-th one is ordinals[offsets[i]:offsets[i+1]]. Equal schedules are computed only once
+def schedules_generator(tenors, startdates, enddates):
+    tenors = numpy.asarray(tenors, dtype=numpy.int64)
+    starts = to_ordinals(startdates).astype(numpy.int64)
+    ends = to_ordinals(enddates).astype(numpy.int64)
 
-    # return the result
-    return relevantdates
+    # the distinct schedules
+    keys = numpy.column_stack((tenors, starts, ends))
+    unique_keys, inverse = numpy.unique(keys.view([('', numpy.int64)] * 3).ravel(), return_inverse=True)
+    unique_keys = unique_keys.view(numpy.int64).reshape(-1, 3)
+    tenors, starts, ends = unique_keys[:, 0], unique_keys[:, 1], unique_keys[:, 2]
+
+    # going backward from the end date by k * tenor months we need at most
+    # (months between start and end) / tenor + 1 steps to go before the start date
+    end_months, end_days = ordinals_to_months_days(ends)
+    start_months, start_days = ordinals_to_months_days(starts)
+    steps = numpy.maximum(end_months - start_months, 0) // tenors + 2
+    owner = numpy.repeat(numpy.arange(len(unique_keys)), steps)
+    k = numpy.arange(len(owner)) - numpy.repeat(numpy.cumsum(steps) - steps, steps)
+    dates = months_days_to_ordinals(end_months[owner] - k * tenors[owner], end_days[owner])
+
+    # we keep the dates after the start date, we add the start date and we sort each schedule
+    keep = dates > starts[owner]
+    owner = numpy.concatenate((owner[keep], numpy.arange(len(unique_keys))))
+    dates = numpy.concatenate((dates[keep], starts))
+    order = numpy.lexsort((dates, owner))
+    owner, dates = owner[order], dates[order]
+    counts = numpy.bincount(owner, minlength=len(unique_keys))
+    unique_offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+
+    # finally we scatter the distinct schedules back to the trades
+    counts = counts[inverse]
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts)))
+    positions = numpy.arange(offsets[-1]) - numpy.repeat(offsets[:-1], counts) + numpy.repeat(unique_offsets[inverse], counts)
+    return offsets, dates[positions]
+
+# the schedules returned by schedule_ordinals are kept in a bounded cache, since the trades of a book
+# share a limited number of (tenor, start date, end date) combinations
+schedule_cache = LRUCache(10000)
+
+# this function returns the schedule of dates_generator as a (read only) numpy array of ordinals;
+# the result is remembered, so asking again the same schedule costs just a lookup
+def schedule_ordinals(tenor, startdate, enddate):
+    key = (tenor, startdate.toordinal(), enddate.toordinal())
+    ordinals = schedule_cache.get(key)
+    if ordinals is None:
+        offsets, ordinals = schedules_generator([tenor], [startdate], [enddate])
+        ordinals.setflags(write=False)
+        schedule_cache.put(key, ordinals)
+    return ordinals
+
+# this function is used to generate a list of dates, between startdate and enddate,
+# each of which is "tenor"-months distant from the other (except the first: "short coupon stub").
+# N.B. We start from the end date and proceed backward in time, so the dates are
+# enddate - i * tenor months; they are computed (and cached) by schedule_ordinals
+def dates_generator(tenor, startdate, enddate):
+    return [date.fromordinal(ordinal) for ordinal in schedule_ordinals(tenor, startdate, enddate)]
 
 if __name__ == '__main__':
     startDate = date(2010,1,1)
     endDate = date(2012,1,1)
     dates = dates_generator(6, startDate, endDate)
     print dates
+
+    # the schedules of three trades generated at once
+    offsets, ordinals = schedules_generator([6, 12, 6], [startDate, startDate, date(2011,3,31)],
+                                            [endDate, date(2015,1,1), date(2013,8,31)])
+    for i in range(len(offsets) - 1):
+        print [date.fromordinal(ordinal) for ordinal in ordinals[offsets[i]:offsets[i+1]]]
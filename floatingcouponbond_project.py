@@ -1,68 +1,75 @@
 from datetime import date
-from openpyxl import load_workbook
+from ingestion import excel_cells, excel_batches, read_table, batch_results, write_column, as_date, as_float, as_int
+from ois_bootstrap import DiscountCurveBootstrap
+from curve_cache import curve_cache
+from ois_products import buildOIS
+from ir_curves import ForwardLiborCurve
+from credit_curves import CreditCurve
+from credit_products import FloatingCouponBond, floating_bonds_npv
 
 if __name__ == '__main__':
-    wb = load_workbook('FloatingCouponBond.xlsx')
-    ws = wb.active
+    # the workbook is read in streaming (see ingestion): each table goes on until its first empty row
+    input_file = 'FloatingCouponBond.xlsx'
 
     # Take the input parameters
-    today = ws['C2'].value.date()
-
-    libor_tenor = ws['C3'].value
+    today, libor_tenor = excel_cells(input_file, ['C2', 'C3'])
+    today = as_date(today)
+    libor_tenor = as_int(libor_tenor)
     # Please note that the payment frequency is the same of the libor tenor
 
     # OIS Data
     ois_startdate = today
-    ois_maturities = []
-    ois_mktquotes = []
-    for cell in list(ws.iter_rows('B17:C46')):
-        ois_maturities.append(cell[0].value)
-        ois_mktquotes.append(cell[1].value)
+    ois = read_table(excel_batches(input_file, 'B17', [('maturity', as_int), ('quote', as_float)]))
+    ois_maturities = ois['maturity']
+    ois_mktquotes = ois['quote']
 
     # Credit Curve Data
-    ndps = []
-    ndpdates = []
-    for cell in list(ws.iter_rows('B8:C13')):
-        ndpdates.append(cell[0].value.date())
-        ndps.append(cell[1].value)
+    credit = read_table(excel_batches(input_file, 'B8', [('date', as_date), ('ndp', as_float)]))
+    ndpdates = credit['date']
+    ndps = credit['ndp']
 
-    # Bond data
-    nominals = []
-    start_dates = []
-    end_dates = []
-    current_coupon = []
-    margin = []
-    recovery_rates = []
+    # Forward Libor Curve Data
+    libor = read_table(excel_batches(input_file, 'B50', [('date', as_date), ('value', as_float)]))
+    fixing_dates = libor['date']
+    forward_libors = libor['value']
 
-    for cell in list(ws.iter_rows('E5:J19')):
-        nominals.append(cell[0].value)
-        start_dates.append(cell[1].value.date())
-        end_dates.append(cell[2].value.date())
-        current_coupon.append(cell[3].value)
-        margin.append(cell[4].value)
-        recovery_rates.append(cell[5].value)
+    # Bond data: the book is read (and priced) one batch at a time
+    bond_batches = lambda: excel_batches(input_file, 'E5', [('nominal', as_float), ('start_date', as_date),
+                                                            ('end_date', as_date), ('current_coupon', as_float),
+                                                            ('margin', as_float), ('recovery', as_float)])
 
 
     # YOUR CODE HERE ....
     # In the coupon calculation use act/360 convention to compute the accrual period (i.e. tau)
-    # The result of your code must be a variables of type list named
-    # output_npv. The length of this list has to be the equal to the number of bonds
-    # i.e len(nominals) for example
-
-
-
+    # The result of your code must be an iterable named output_npv, with one npv per bond
+
+    # the discount curve is bootstrapped from the OIS quotes (fixed leg with annual payments); the curves
+    # are taken from the curve cache (see curve_cache), so they are built only once for the same quotes
+    dc_bootstrapper = DiscountCurveBootstrap(today)
+    for maturity, quote in zip(ois_maturities, ois_mktquotes):
+        dc_bootstrapper.addProduct(buildOIS(ois_startdate, maturity, 12, quote))
+    dc_curve = dc_bootstrapper.bootstrap(cache=curve_cache)
+
+    libor_curve = ForwardLiborCurve(today, fixing_dates, forward_libors)
+    credit_curve = CreditCurve(today, ndpdates, ndps)
+
+    # all of the bonds of a batch are priced in a single call (the coupons pay with the libor tenor and
+    # accrue act/360); the npvs are written while the next batches are read
+    def bonds_npv(batch):
+        bonds = [FloatingCouponBond(startDate, endDate, libor_tenor, currentCoupon, margin, recovery, nominal)
+                 for startDate, endDate, currentCoupon, margin, recovery, nominal
+                 in zip(batch['start_date'], batch['end_date'], batch['current_coupon'], batch['margin'],
+                        batch['recovery'], batch['nominal'])]
+        return floating_bonds_npv(bonds, dc_curve, libor_curve, credit_curve)
+    output_npv = batch_results(bond_batches(), bonds_npv)
 
     # END OF YOUR CODE
 
     # Write results
-    # A variable named output_results of type list, with the same length of output_dates, is expected.
+    # A variable named output_npv, with one value per bond, is expected.
     # In case this is not present, a message is written
     if 'output_npv' not in locals():
-        output_npv = ["Not Successful" for x in range(len(nominals))]
-
-    out_list = list(ws.iter_rows('K5:K19'))
-    for i in range(len(output_npv)):
-        out_list[i][0].value = output_npv[i]
+        output_npv = batch_results(bond_batches(), lambda batch: ["Not Successful" for x in batch['nominal']])
 
     # A new file with the results is created
-    wb.save("FloatingCouponBond_output.xlsx")
\ No newline at end of file
+    write_column(input_file, "FloatingCouponBond_output.xlsx", 'K5', output_npv)
\ No newline at end of file
@@ -0,0 +1,262 @@
+# csv reads the files of comma separated values
+import csv
+import numpy
+from copy import copy
+from datetime import date, datetime
+
+# openpyxl reads and writes the excel files
+from openpyxl import load_workbook, Workbook
+try:
+    from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+except ImportError:
+    # older versions of openpyxl
+    from openpyxl.utils import coordinate_from_string, column_index_from_string
+try:
+    from openpyxl.cell import WriteOnlyCell
+except ImportError:
+    # older versions of openpyxl
+    from openpyxl.writer.dump_worksheet import WriteOnlyCell
+
+from date_conventions import date_from_xl, to_ordinals
+
+# The tables of the input data (the bonds of a book, the quotes of a curve, ...) are read as a stream of
+# batches: each batch is a dictionary with one list per column, holding the values of at most batchSize
+# consecutive rows already converted to the right type. In this way a table of any length can be
+# processed one batch at a time, without keeping the whole file (or the whole table) in memory.
+# A table is described by the list of its columns, each of which is a (name, converter) pair; the
+# table ends at the first row whose first column is empty (or at the end of the file).
+# The same tables can come from:
+# - an excel sheet, read with the read only (streaming) mode of openpyxl: see excel_batches
+# - a csv file with the names of the columns in the first row: see csv_batches
+# - any columnar source, i.e. anything that returns a column given its name, like a dictionary of
+#   lists or arrays, a numpy structured array or a DataFrame (e.g. read from a parquet file): see columnar_batches
+# read_table collects all of the batches of a table in a single dictionary of lists (e.g. the quotes
+# of a curve, which are needed all together), batch_results processes a table one batch at a time (e.g.
+# to price a book) and write_column writes its results while the next batches are read.
+
+# the converters: they accept what excel, csv files and columnar sources may contain
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, numpy.datetime64):
+        return date.fromordinal(int(to_ordinals(value)))
+    if isinstance(value, (int, long, float)):
+        # a date as a number, as excel stores it
+        return date_from_xl(int(value))
+    # a text in the ISO format, e.g. 2013-10-31
+    return datetime.strptime(value.strip()[:10], '%Y-%m-%d').date()
+
+def as_float(value):
+    return float(value)
+
+def as_int(value):
+    return int(float(value))
+
+def as_text(value):
+    return value.strip()
+
+# this function tells if the value of a cell (or of a csv field) is empty
+def is_empty(value):
+    return value is None or (isinstance(value, basestring) and value.strip() == '')
+
+# This function converts a stream of rows (sequences with one raw value per column) into batches,
+# stopping at the first row whose first value is empty
+def record_batches(rows, columns, batchSize):
+    batch = dict((name, []) for name, converter in columns)
+    size = 0
+    for row in rows:
+        if is_empty(row[0]):
+            break
+        for (name, converter), value in zip(columns, row):
+            batch[name].append(None if is_empty(value) else converter(value))
+        size = size + 1
+        if size == batchSize:
+            yield batch
+            batch = dict((name, []) for name, converter in columns)
+            size = 0
+    if size > 0:
+        yield batch
+
+# This function collects all of the batches of a table
+def read_table(batches):
+    table = None
+    for batch in batches:
+        if table is None:
+            table = batch
+        else:
+            for name in table:
+                table[name].extend(batch[name])
+    return table if table is not None else {}
+
+# This function calls function on each batch (e.g. to price the trades of the batch) and yields its
+# results (one per row of the batch) one at a time, so that only one batch at a time is in memory
+def batch_results(batches, function):
+    for batch in batches:
+        for result in function(batch):
+            yield result
+
+# the column (as a number) and the row of a cell reference like 'E5'
+def cell_position(reference):
+    column, row = coordinate_from_string(reference)
+    return column_index_from_string(column), row
+
+# This function opens a workbook in read only mode: the sheets are parsed while they are read.
+# With data_only the cells with a formula give the value computed by excel at the last save
+def open_workbook(filename, data_only=True):
+    return load_workbook(filename, read_only=True, data_only=data_only)
+
+def close_workbook(workbook):
+    # the older versions of openpyxl have nothing to close
+    if hasattr(workbook, 'close'):
+        workbook.close()
+
+def get_sheet(workbook, sheet):
+    if sheet is None:
+        return workbook.active
+    return workbook[sheet]
+
+# This function returns the cells of the rectangle of the sheet between the two rows and the two
+# columns (numbers starting from 1), row by row; with max_row=None it goes on until the end of the sheet
+def sheet_rows(worksheet, min_row, min_col, max_col, max_row=None):
+    try:
+        return worksheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)
+    except TypeError:
+        # the older versions of openpyxl take the rectangle with another method
+        return worksheet.get_squared_range(min_col, min_row, max_col, max_row)
+
+# This function returns the values of the given cells (e.g. ['C2', 'C3']) of a sheet
+def excel_cells(filename, references, sheet=None):
+    workbook = open_workbook(filename)
+    try:
+        worksheet = get_sheet(workbook, sheet)
+        return [worksheet[reference].value for reference in references]
+    finally:
+        close_workbook(workbook)
+
+# This function reads the table of the sheet whose first row and first column are the ones of the
+# cell anchor (e.g. 'E5'): the table has one column per element of columns and ends at the first row
+# whose first cell is empty
+def excel_batches(filename, anchor, columns, batchSize=10000, sheet=None):
+    min_col, min_row = cell_position(anchor)
+    workbook = open_workbook(filename)
+    try:
+        rows = sheet_rows(get_sheet(workbook, sheet), min_row, min_col, min_col + len(columns) - 1)
+        values = ([cell.value for cell in row] for row in rows)
+        for batch in record_batches(values, columns, batchSize):
+            yield batch
+    finally:
+        close_workbook(workbook)
+
+# This function reads a table from a csv file whose first row has the names of the columns: the
+# columns are found by name, so the file can have them in any order (or have other columns)
+def csv_batches(filename, columns, batchSize=10000, delimiter=','):
+    with open(filename, 'rb') as csvfile:
+        reader = csv.reader(csvfile, delimiter=delimiter)
+        header = [name.strip() for name in next(reader)]
+        positions = [header.index(name) for name, converter in columns]
+        values = ([row[i] if i < len(row) else None for i in positions] for row in reader)
+        for batch in record_batches(values, columns, batchSize):
+            yield batch
+
+# This function reads a table from a columnar source: table[name] must return the column with that name
+def columnar_batches(table, columns, batchSize=10000):
+    data = []
+    for name, converter in columns:
+        column = numpy.asarray(table[name])
+        # numpy dates (e.g. the columns of dates of a DataFrame) become python dates
+        if column.dtype.kind == 'M':
+            column = column.astype('datetime64[D]')
+        data.append(column)
+    for batch in record_batches(columnar_rows(data, batchSize), columns, batchSize):
+        yield batch
+
+# the rows of a list of columns, converted to python values chunkSize rows at a time
+def columnar_rows(data, chunkSize):
+    for start in range(0, len(data[0]), chunkSize):
+        for row in zip(*[column[start:start + chunkSize].tolist() for column in data]):
+            yield row
+
+# This function copies the names defined in the workbook source (e.g. "today", used by the formulas of
+# the sheets) in the workbook target; the names defined for a single sheet are not copied
+def copy_defined_names(source, target):
+    names = source.defined_names
+    if hasattr(names, 'definedName'):
+        for name in names.definedName:
+            if name.localSheetId is None:
+                target.defined_names.append(copy(name))
+    else:
+        # the newer versions of openpyxl keep the names in a dictionary
+        for key in names:
+            target.defined_names[key] = copy(names[key])
+
+# a cell of the write only sheet with the given value and the number format of the cell of the source
+# (e.g. the format of the dates, without which excel would show them as numbers)
+def output_cell(output_sheet, value, cell=None):
+    if value is None:
+        return None
+    result = WriteOnlyCell(output_sheet, value)
+    number_format = getattr(cell, 'number_format', None)
+    if number_format is not None:
+        result.number_format = number_format
+    return result
+
+# This function writes a copy of a sheet of the workbook source in the workbook target, putting the
+# values in the column of the cell anchor starting from its row (e.g. the npvs of a book, one below
+# the other from 'K5'). The source is read in streaming and the target is written in write only mode,
+# row by row: values can be any iterable (e.g. the results of batch_results), which is consumed while
+# the rows are written, so the number of values is not limited by the size of the original table.
+# The values, the formulas, the number formats and the names defined in the workbook are copied
+def write_column(source, target, anchor, values, sheet=None):
+    column, first_row = cell_position(anchor)
+    values = iter(values)
+    # the marker of the end of the values
+    end = object()
+    workbook = open_workbook(source, data_only=False)
+    try:
+        worksheet = get_sheet(workbook, sheet)
+        ncols = max(worksheet.max_column, column)
+        output = Workbook(write_only=True)
+        output_sheet = output.create_sheet(title=worksheet.title)
+        copy_defined_names(workbook, output)
+        source_rows = iter(sheet_rows(worksheet, 1, 1, ncols, worksheet.max_row))
+        r = 1
+        while True:
+            value = next(values, end) if r >= first_row else end
+            if r > worksheet.max_row and value is end:
+                break
+            cells = list(next(source_rows, ()))
+            cells = cells + [None] * (ncols - len(cells))
+            row = [None if cell is None else output_cell(output_sheet, cell.value, cell) for cell in cells]
+            if value is not end:
+                row[column - 1] = output_cell(output_sheet, value, cells[column - 1])
+            output_sheet.append(row)
+            r = r + 1
+        output.save(target)
+    finally:
+        close_workbook(workbook)
+
+
+# example
+import os
+import tempfile
+
+if __name__ == '__main__':
+    bond_columns = [('nominal', as_float), ('start_date', as_date), ('end_date', as_date),
+                    ('cpn_frequency', as_int), ('coupon', as_float), ('recovery', as_float)]
+    bonds = read_table(excel_batches('FixedCouponBond.xlsx', 'E5', bond_columns))
+    print "Bonds read from excel:", len(bonds['nominal']), bonds['end_date'][:3]
+
+    # the same book from a csv file, read in batches of 4 bonds
+    filename = os.path.join(tempfile.mkdtemp(), 'bonds.csv')
+    with open(filename, 'wb') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow([name for name, converter in bond_columns])
+        for row in zip(*[bonds[name] for name, converter in bond_columns]):
+            writer.writerow([value.isoformat() if isinstance(value, date) else value for value in row])
+    print "Batch sizes from csv:", [len(batch['nominal']) for batch in csv_batches(filename, bond_columns, 4)]
+
+    # and from columns of arrays
+    columns = dict((name, numpy.array(bonds[name])) for name, converter in bond_columns)
+    print "Same table from columns:", read_table(columnar_batches(columns, bond_columns)) == bonds
@@ -0,0 +1,252 @@
+# numpy is a numerical package
+import numpy
+
+# The curves interpolate a quantity y known at their pillars x (the ordinals of the dates): the logarithm
+# of the discount factors for the DiscountCurve, of the survival probabilities for the CreditCurve, the
+# forward rates themselves for the ForwardLiborCurve. Each scheme of this module writes the interpolated
+# y as a piecewise polynomial: the pieces start at the knots (the pillars, plus the extra points some
+# schemes need inside a segment) and on each piece
+#   y(x) = c[0] + c[1] * s + c[2] * s**2 + ...     with s = x - knot
+# The coefficients are computed once, when the interpolator is built (or when a value is changed, see
+# set_value), so that evaluating any number of points is one searchsorted plus a polynomial evaluation.
+# Outside the pillars y is flat, as with numpy.interp: before the first pillar it is y at the first one,
+# after the last pillar there is a last constant piece with the value of the last one.
+# The schemes are:
+# - "linear" (or "loglinear" when y is a logarithm): linear between two pillars; numpy.interp does the same
+# - "zerolinear": linear zero rates (or zero hazard rates), i.e. y(x) / (x - x[0]) is linear between two
+#   pillars; y at the first pillar (today) must be zero
+# - "monotoneconvex": the monotone convex method of Hagan and West on the forward rates f = - dy / dx
+# - "cubic": the natural cubic spline of y
+# A scheme is "local" if the value of a pillar only changes the two segments around it: the bootstraps
+# that solve one pillar at a time need to go through the pillars again for the schemes that are not local
+
+class PiecewisePolynomial:
+    ''' The base class of the interpolators:
+    - x: the pillars (sorted)
+    - y: the known values
+    The subclasses compute the knots and the coefficients (one row per piece, one column per power of s)
+    in build
+    '''
+    local = True
+
+    def __init__(self, x, y):
+        self.x = numpy.array(x, dtype=numpy.float64)
+        self.y = numpy.array(y, dtype=numpy.float64)
+        self.build()
+
+    # the last piece: flat after the last pillar
+    def last_piece(self):
+        coefficients = numpy.zeros((1, self.degree + 1))
+        coefficients[0, 0] = self.y[-1]
+        return coefficients
+
+    # This method changes the known value of the pillar in position index and recomputes the coefficients
+    def set_value(self, index, value):
+        self.y[index] = value
+        self.build()
+
+    # the piece of each point and the distance of the point from the start of its piece
+    def pieces(self, x):
+        x = numpy.asarray(x, dtype=numpy.float64)
+        k = numpy.clip(numpy.searchsorted(self.knots, x, side='right') - 1, 0, len(self.knots) - 1)
+        return k, numpy.maximum(x, self.knots[0]) - self.knots[k]
+
+    # the interpolated values at the points x (an array)
+    def value_vector(self, x):
+        k, s = self.pieces(x)
+        c = self.coefficients[k]
+        value = c[..., self.degree]
+        for power in range(self.degree - 1, -1, -1):
+            value = value * s + c[..., power]
+        return value
+
+    # the interpolated value at the point x (a number)
+    def value(self, x):
+        return self.value_vector([x])[0]
+
+    # the derivatives of the interpolated values with respect to x (zero outside the pillars)
+    def derivative_vector(self, x):
+        x = numpy.asarray(x, dtype=numpy.float64)
+        k, s = self.pieces(x)
+        c = self.coefficients[k]
+        value = self.degree * c[..., self.degree]
+        for power in range(self.degree - 1, 0, -1):
+            value = value * s + power * c[..., power]
+        return numpy.where(x < self.knots[0], 0.0, value)
+
+    # the forward rates - dy / dx (when y is the logarithm of the discount factors, or the hazard rates
+    # when y is the logarithm of the survival probabilities), zero outside the pillars
+    def forward_vector(self, x):
+        x = numpy.asarray(x, dtype=numpy.float64)
+        return numpy.where((x < self.knots[0]) | (x >= self.knots[-1]), 0.0, - self.derivative_vector(x))
+
+
+class LinearInterpolator(PiecewisePolynomial):
+    ''' y is linear between two pillars '''
+    degree = 1
+
+    def build(self):
+        slopes = numpy.diff(self.y) / numpy.diff(self.x)
+        self.knots = self.x
+        self.coefficients = numpy.vstack((numpy.column_stack((self.y[:-1], slopes)), self.last_piece()))
+
+    # only the slopes of the two segments around the pillar change
+    def set_value(self, index, value):
+        self.y[index] = value
+        for k in [index - 1, index]:
+            if 0 <= k < len(self.x) - 1:
+                self.coefficients[k, 0] = self.y[k]
+                self.coefficients[k, 1] = (self.y[k + 1] - self.y[k]) / (self.x[k + 1] - self.x[k])
+        self.coefficients[-1, 0] = self.y[-1]
+
+class ZeroLinearInterpolator(PiecewisePolynomial):
+    ''' The zero rates z = - y / (x - x[0]) are linear between two pillars, so that on the segment
+    starting at the pillar k, with t = x[k] - x[0] and m the slope of the zero rates,
+      y = - (z[k] + m * s) * (t + s) = y[k] - (z[k] + m * t) * s - m * s**2
+    The zero rate of the first pillar is the one of the second, i.e. the first segment has a flat zero rate
+    '''
+    degree = 2
+
+    def build(self):
+        self.knots = self.x
+        if len(self.x) == 1:
+            self.coefficients = self.last_piece()
+            return
+        times = self.x - self.x[0]
+        zeros = - self.y[1:] / times[1:]
+        zeros = numpy.concatenate((zeros[:1], zeros))
+        slopes = numpy.diff(zeros) / numpy.diff(self.x)
+        pieces = numpy.column_stack((self.y[:-1], - (zeros[:-1] + slopes * times[:-1]), - slopes))
+        self.coefficients = numpy.vstack((pieces, self.last_piece()))
+
+class CubicSplineInterpolator(PiecewisePolynomial):
+    ''' The natural cubic spline: y and its first two derivatives are continuous and the second
+    derivative is zero at the first and at the last pillar. The second derivatives M at the pillars
+    are the solution of a tridiagonal linear system; on the segment starting at the pillar k, of
+    length h, the coefficients are
+      y[k], (y[k+1] - y[k]) / h - h * (2 * M[k] + M[k+1]) / 6, M[k] / 2, (M[k+1] - M[k]) / (6 * h)
+    '''
+    degree = 3
+    local = False
+
+    def build(self):
+        self.knots = self.x
+        n = len(self.x)
+        if n == 1:
+            self.coefficients = self.last_piece()
+            return
+        h = numpy.diff(self.x)
+        slopes = numpy.diff(self.y) / h
+        M = numpy.zeros(n)
+        if n > 2:
+            matrix = numpy.diag(2.0 * (h[:-1] + h[1:])) + numpy.diag(h[1:-1], 1) + numpy.diag(h[1:-1], -1)
+            M[1:-1] = numpy.linalg.solve(matrix, 6.0 * numpy.diff(slopes))
+        pieces = numpy.column_stack((self.y[:-1], slopes - h * (2.0 * M[:-1] + M[1:]) / 6.0,
+                                     M[:-1] / 2.0, numpy.diff(M) / (6.0 * h)))
+        self.coefficients = numpy.vstack((pieces, self.last_piece()))
+
+class MonotoneConvexInterpolator(PiecewisePolynomial):
+    ''' The monotone convex method of Hagan and West (Interpolation Methods for Curve Construction,
+    2006) on the instantaneous forward rates f = - dy / dx. The discrete forward rates of the segments
+    fd = - (y[k+1] - y[k]) / (x[k+1] - x[k]) give the forward rates at the pillars (their weighted
+    averages); on each segment f = fd + g(u), with u the position in the segment (from 0 to 1) and g
+    one of the four quadratic shapes of the paper chosen from g(0) and g(1) so that f stays between
+    the forwards of the two pillars. Since the integral of g on the segment is zero, y is found again at
+    the pillars. The shapes (ii) - (iv) are made by two quadratics joined at the point eta: each of
+    them becomes a piece with its own knot. On a piece starting at the knot x0, where f = a0 + a1 * s + a2 * s**2,
+      y = y(x0) - a0 * s - a1 * s**2 / 2 - a2 * s**3 / 3
+    '''
+    degree = 3
+    local = False
+
+    def build(self):
+        n = len(self.x)
+        if n == 1:
+            self.knots = self.x
+            self.coefficients = self.last_piece()
+            return
+        h = numpy.diff(self.x)
+        fd = - numpy.diff(self.y) / h
+        # the forward rates at the pillars
+        f = numpy.zeros(n)
+        f[1:-1] = (h[:-1] * fd[1:] + h[1:] * fd[:-1]) / (h[:-1] + h[1:])
+        if n > 2:
+            f[0] = fd[0] - 0.5 * (f[1] - fd[0])
+            f[-1] = fd[-1] - 0.5 * (f[-2] - fd[-1])
+        else:
+            f[0] = f[-1] = fd[0]
+
+        knots = []
+        coefficients = []
+        for k in range(n - 1):
+            start = len(coefficients)
+            for u0, u1, q in self.shape(f[k] - fd[k], f[k + 1] - fd[k]):
+                # g = q0 + q1 * u + q2 * u**2 with u = u0 + s / h, then f = fd + g
+                a0 = fd[k] + q[0] + q[1] * u0 + q[2] * u0**2
+                a1 = (q[1] + 2.0 * q[2] * u0) / h[k]
+                a2 = q[2] / h[k]**2
+                if len(coefficients) == start:
+                    y0 = self.y[k]
+                else:
+                    # the value at the end of the previous piece of the segment
+                    c = coefficients[-1]
+                    length = (u0 - previous_u0) * h[k]
+                    y0 = c[0] + length * (c[1] + length * (c[2] + length * c[3]))
+                knots.append(self.x[k] + u0 * h[k])
+                coefficients.append([y0, - a0, - a1 / 2.0, - a2 / 3.0])
+                previous_u0 = u0
+        knots.append(self.x[-1])
+        self.knots = numpy.array(knots)
+        self.coefficients = numpy.vstack((numpy.array(coefficients), self.last_piece()))
+
+    # The pieces (u0, u1, q) of g on a segment given g0 = g(0) and g1 = g(1): on [u0, u1] g is the
+    # quadratic q0 + q1 * u + q2 * u**2. A quadratic A + c * (u - v)**2 has q = (A + c * v**2, - 2 * c * v, c)
+    def shape(self, g0, g1):
+        def vertex(A, c, v):
+            return (A + c * v**2, - 2.0 * c * v, c)
+
+        if g0 == 0 and g1 == 0:
+            return [(0.0, 1.0, (0.0, 0.0, 0.0))]
+        if (g0 < 0 and -0.5 * g0 <= g1 <= -2.0 * g0) or (g0 > 0 and -0.5 * g0 >= g1 >= -2.0 * g0):
+            # (i): a single quadratic
+            return [(0.0, 1.0, (g0, -4.0 * g0 - 2.0 * g1, 3.0 * g0 + 3.0 * g1))]
+        if (g0 < 0 and g1 > -2.0 * g0) or (g0 > 0 and g1 < -2.0 * g0):
+            # (ii): flat, then a parabola up to g1
+            eta = (g1 + 2.0 * g0) / (g1 - g0)
+            pieces = [(0.0, eta, (g0, 0.0, 0.0)), (eta, 1.0, vertex(g0, (g1 - g0) / (1.0 - eta)**2, eta))]
+        elif (g0 > 0 and 0 > g1 > -0.5 * g0) or (g0 < 0 and 0 < g1 < -0.5 * g0):
+            # (iii): a parabola from g0, then flat
+            eta = 3.0 * g1 / (g1 - g0)
+            pieces = [(0.0, eta, vertex(g1, (g0 - g1) / eta**2, eta)), (eta, 1.0, (g1, 0.0, 0.0))]
+        else:
+            # (iv): g0 and g1 with the same sign, two parabolas with the vertex in eta
+            eta = g1 / (g1 + g0)
+            A = - g0 * g1 / (g0 + g1)
+            pieces = [(0.0, eta, vertex(A, (g0 - A) / eta**2, eta)) if eta > 0 else None,
+                      (eta, 1.0, vertex(A, (g1 - A) / (1.0 - eta)**2, eta)) if eta < 1 else None]
+        # the pieces of zero length are dropped
+        return [piece for piece in pieces if piece is not None and piece[1] > piece[0]]
+
+# the interpolators by the name of their scheme
+interpolators = {'linear': LinearInterpolator, 'loglinear': LinearInterpolator,
+                 'zerolinear': ZeroLinearInterpolator, 'monotoneconvex': MonotoneConvexInterpolator,
+                 'cubic': CubicSplineInterpolator}
+
+# This function builds the interpolator of the given scheme; schemes lists the ones allowed by the curve
+def build_interpolator(scheme, x, y, schemes=None):
+    if scheme not in interpolators or (schemes is not None and scheme not in schemes):
+        raise ValueError("Interpolation not supported")
+    return interpolators[scheme](x, y)
+
+
+# example
+if __name__ == '__main__':
+    x = numpy.array([0.0, 365.0, 730.0, 1825.0, 3650.0])
+    y = numpy.log([1.0, 0.99, 0.975, 0.92, 0.82])
+    points = numpy.linspace(0.0, 4000.0, 9)
+    print "numpy.interp:", numpy.interp(points, x, y)
+    for scheme in ['loglinear', 'zerolinear', 'monotoneconvex', 'cubic']:
+        interpolator = build_interpolator(scheme, x, y)
+        print scheme, "at the pillars:", numpy.max(numpy.abs(interpolator.value_vector(x) - y))
+        print "  values:", interpolator.value_vector(points)
+        print "  forwards (1 / years):", 365.0 * interpolator.forward_vector(points)
@@ -8,13 +8,24 @@ from datetime import date
 # math is mathematical package
 import math
 
+# to_ordinals converts dates (or lists of dates) to the numbers used by the interpolator
+from date_conventions import to_ordinals
+# the interpolators of the curves
+from interpolation import build_interpolator
+
+# the interpolation schemes of the discount factors (on their logarithms) and of the forward libors
+discount_schemes = ['loglinear', 'zerolinear', 'monotoneconvex', 'cubic']
+libor_schemes = ['linear', 'cubic']
+
 class DiscountCurve:
     # we want to create the DiscountCurve class with that will compute df(t, T) where
     # t is the "today" (the so called observation date) and T a generic maturity
     # - obsdate: the date at which the curve refers to (i.e. today)
     # - pillars: a list of dates at which the discount factor is known
     # - dfs: the known discount factors
-    def __init__(self, obsdate, pillars, dfs):
+    # - interpolation: the scheme used to interpolate the logarithms of the discount factors (see
+    #   interpolation): "loglinear" (the default), "zerolinear", "monotoneconvex" or "cubic"
+    def __init__(self, obsdate, pillars, dfs, interpolation="loglinear"):
         # the following generates an error that will block the program
         if pillars[0] < obsdate:
             raise "today is greater than the first pillar date"
@@ -29,19 +40,24 @@ class DiscountCurve:
         self.today = obsdate
         self.pillars = pillars
         self.dfs = dfs
+        self.interpolation = interpolation
 
-        # dates must be converted to numbers, otherwise the interpolation function will not work
-        self.pillars_number = [aDate.toordinal() for aDate in pillars]
+        # dates must be converted to numbers, otherwise the interpolation function will not work;
+        # we store them once in a contiguous float64 array so that numpy does not have to convert
+        # a python list at every interpolation
+        self.pillars_number = numpy.array(to_ordinals(pillars), dtype=numpy.float64)
 
-        # we will linearly interpolate on the logarithm of the discount factors
-        self.logdfs = [math.log(df) for df in dfs]
+        # we will interpolate on the logarithm of the discount factors (linearly by default): the
+        # interpolator computes its coefficients once here
+        self.logdfs = numpy.log(numpy.array(dfs, dtype=numpy.float64))
+        self.interpolator = build_interpolator(interpolation, self.pillars_number, self.logdfs, discount_schemes)
 
     def df(self, aDate):
         # we convert the date to a number
         date_number = aDate.toordinal()
 
-        # we use the linear interpolator of the numpy library
-        log_df = numpy.interp(date_number, self.pillars_number, self.logdfs)
+        # we use the interpolator of the curve
+        log_df = self.interpolator.value(date_number)
 
         #we  will have to the take the exponential beacuse we interpolated the logarithms
         df = math.exp(log_df)
@@ -49,6 +65,71 @@ class DiscountCurve:
         # return the resulting discount factor
         return df
 
+    # this method changes the discount factor of the pillar in position index, without building a new
+    # curve: only the corresponding logarithm (and the coefficients of the interpolator which depend on
+    # it) is recomputed. It is used by the bootstrap, which moves one pillar at a time
+    def set_df(self, index, df):
+        self.dfs[index] = df
+        self.logdfs[index] = math.log(df)
+        self.interpolator.set_value(index, self.logdfs[index])
+
+    # the same as df, but for many dates at once: it accepts a list (or array) of dates or an array
+    # of ordinals and returns a numpy array with the discount factors. The interpolation and the
+    # exponential are done by numpy in a single pass, without any python loop
+    def df_vector(self, dates):
+        log_dfs = self.interpolator.value_vector(to_ordinals(dates))
+        return numpy.exp(log_dfs)
+
+    # the instantaneous forward rate f(t) = - d ln df(t) / dt (continuously compounded, in 1 / years
+    # with 1 year = 365 days), from the derivative of the interpolated logarithms; it is zero after
+    # the last pillar, where the curve is flat
+    def instantaneous_forward(self, aDate):
+        return self.instantaneous_forward_vector([aDate])[0]
+
+    # the same as instantaneous_forward, for a list (or array) of dates or ordinals
+    def instantaneous_forward_vector(self, dates):
+        return 365.0 * self.interpolator.forward_vector(to_ordinals(dates))
+
+# This function returns the matrix of the weights of the linear interpolation: the row i tells how
+# the value interpolated at x[i] depends on the values known at the points xp, i.e.
+#   numpy.interp(x, xp, fp) == interpolation_weights(x, xp).dot(fp)
+# (flat extrapolation included). The weights depend only on the points, not on the values: this is
+# what makes the derivatives of anything interpolated with respect to the known values easy to compute
+def interpolation_weights(x, xp):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    weights = numpy.zeros((len(x), len(xp)))
+    k, w = interpolation_segments(x, xp)
+    rows = numpy.arange(len(x))
+    weights[rows, k] = 1.0 - w
+    weights[rows, k+1] = weights[rows, k+1] + w
+    return weights
+
+# interpolation_weights (and the closed formulas built on the linear interpolation) describe a curve only
+# if it interpolates linearly its values, or their logarithms, as the curves do by default (the curve
+# cubes always do): this function tells if it is the case
+def log_linear(curve):
+    return getattr(curve, 'interpolation', 'loglinear') in ('loglinear', 'linear')
+
+# This function returns, for each x, the index k of the segment [xp[k], xp[k+1]] used by the linear
+# interpolation and the weight w of xp[k+1], so that the interpolated value is
+# (1 - w) * fp[k] + w * fp[k+1] (with flat extrapolation outside xp)
+def interpolation_segments(x, xp):
+    x = numpy.asarray(x, dtype=numpy.float64)
+    xp = numpy.asarray(xp, dtype=numpy.float64)
+    if len(xp) == 1:
+        # a single point: the interpolation is flat, we use a "segment" made by the point itself
+        return numpy.zeros(x.shape, dtype=numpy.int64) - 1, numpy.ones(x.shape)
+    k = numpy.clip(numpy.searchsorted(xp, x, side='right') - 1, 0, len(xp) - 2)
+    w = numpy.clip((x - xp[k]) / (xp[k+1] - xp[k]), 0.0, 1.0)
+    return k, w
+
+# The same as numpy.interp, but fp is a matrix with one set of known values for each row (e.g. one
+# row per scenario): all of the rows are interpolated at once and the result has one row for each
+# row of fp and one column for each x. The search of the segments is done only once for all of the rows
+def interpolate_rows(x, xp, fp):
+    k, w = interpolation_segments(x, xp)
+    return fp[..., k] * (1.0 - w) + fp[..., k+1] * w
+
 class ForwardLiborCurve:
     # we want to create the ForwardLiborCurve class with that will compute Lt, T), i.e.
     # the forward libor rate computed at t (today) that resets (fixes) at T (this means that
@@ -57,26 +138,85 @@ class ForwardLiborCurve:
     # - obsdate: the date at which the curve refers to (i.e. today)
     # - fixingDates: the list of fixing dates of the kwnown forward libor rates
     # - forwardLibors: the kwnown forward libor rates
-    def __init__(self, obsdate, fixingDates, forwardLibors):
+    # - interpolation: the scheme used to interpolate the forward rates, "linear" (the default) or "cubic"
+    def __init__(self, obsdate, fixingDates, forwardLibors, interpolation="linear"):
         # store the input variables
         self.obsdate = obsdate
         self.fixingDates = fixingDates
         self.forwardLibors = forwardLibors
+        self.interpolation = interpolation
 
         # dates must be converted to numbers, otherwise the interpolation function will not work
-        self.fixingDates_number = [aDate.toordinal() for aDate in fixingDates]
+        self.fixingDates_number = numpy.array(to_ordinals(fixingDates), dtype=numpy.float64)
+        self.forwardLibors_array = numpy.array(forwardLibors, dtype=numpy.float64)
+        self.interpolator = build_interpolator(interpolation, self.fixingDates_number, self.forwardLibors_array, libor_schemes)
 
 
     def value(self, fixingDate):
         # we convert the date to a number
         date_number = fixingDate.toordinal()
 
-        #we use the linear interpolator of the numpy library
-        forwardRate = numpy.interp(date_number, self.fixingDates_number, self.forwardLibors)
+        #we use the interpolator of the curve
+        forwardRate = self.interpolator.value(date_number)
 
         # return the resulting interpolated forward rate
         return forwardRate
 
+    # the same as value, but for a list (or array) of fixing dates or ordinals: it returns
+    # a numpy array with all of the forward rates interpolated in a single pass
+    def value_vector(self, fixingDates):
+        return self.interpolator.value_vector(to_ordinals(fixingDates))
+
+class DiscountCurveCube:
+    # The same as the DiscountCurve, but with many scenarios at once: all of the scenarios share the
+    # same pillars, while the discount factors are a matrix with one row per scenario and one column
+    # per pillar. The methods return one discount factor per scenario (and per date), so that the
+    # products priced with a cube return one npv per scenario
+    # - obsdate: the date at which the curve refers to (i.e. today)
+    # - pillars: a list of dates at which the discount factors are known
+    # - dfs: the known discount factors, (number of scenarios) x (number of pillars)
+    def __init__(self, obsdate, pillars, dfs):
+        if pillars[0] < obsdate:
+            raise ValueError("today is greater than the first pillar date")
+
+        dfs = numpy.array(dfs, dtype=numpy.float64, ndmin=2)
+        pillars = list(pillars)
+        # as for the DiscountCurve the first pillar must be the observation date with discount factor 1.0
+        if pillars[0] > obsdate:
+            pillars.insert(0, obsdate)
+            dfs = numpy.column_stack((numpy.ones(len(dfs)), dfs))
+
+        self.today = obsdate
+        self.pillars = pillars
+        self.dfs = dfs
+        self.pillars_number = numpy.array(to_ordinals(pillars), dtype=numpy.float64)
+        self.logdfs = numpy.log(dfs)
+
+    # one discount factor per scenario
+    def df(self, aDate):
+        return self.df_vector([aDate])[:, 0]
+
+    # a matrix with one row per scenario and one column per date
+    def df_vector(self, dates):
+        return numpy.exp(interpolate_rows(to_ordinals(dates), self.pillars_number, self.logdfs))
+
+class ForwardLiborCurveCube:
+    # The same as the ForwardLiborCurve, but with many scenarios at once: forwardLibors is a matrix
+    # with one row per scenario and one column per fixing date
+    def __init__(self, obsdate, fixingDates, forwardLibors):
+        self.obsdate = obsdate
+        self.fixingDates = fixingDates
+        self.forwardLibors = numpy.array(forwardLibors, dtype=numpy.float64, ndmin=2)
+        self.fixingDates_number = numpy.array(to_ordinals(fixingDates), dtype=numpy.float64)
+
+    # one forward rate per scenario
+    def value(self, fixingDate):
+        return self.value_vector([fixingDate])[:, 0]
+
+    # a matrix with one row per scenario and one column per fixing date
+    def value_vector(self, fixingDates):
+        return interpolate_rows(to_ordinals(fixingDates), self.fixingDates_number, self.forwardLibors)
+
 # example
 if __name__ == '__main__':
     # today is the 1st January 2010
@@ -87,9 +227,21 @@ if __name__ == '__main__':
     df = dc.df(date(2010,6,1))    
 
     print "Interpolated Discount Factor:", df
+    print "Interpolated Discount Factors:", dc.df_vector([date(2010,6,1), date(2011,6,1)])
+    print "Instantaneous forwards:", dc.instantaneous_forward_vector([date(2010,6,1), date(2011,6,1)])
+
+    # the same discount factors with the other interpolation schemes
+    for scheme in ['zerolinear', 'monotoneconvex', 'cubic']:
+        curve = DiscountCurve(obsdate, list(pillars), list(dfs), scheme)
+        print scheme, "discount factors:", curve.df_vector([date(2010,6,1), date(2011,6,1)]), \
+            "instantaneous forwards:", curve.instantaneous_forward_vector([date(2010,6,1), date(2011,6,1)])
     
     fwd_pillars = [date(2010,1,1), date(2011,1,1), date(2012,1,1)]
     forwardLibors = [0.03, 0.035, 0.042]
     libor = ForwardLiborCurve(obsdate, fwd_pillars, forwardLibors)
     fwdLibor = libor.value(date(2010,11,1))
     print "Interpolated Forward Libor:", fwdLibor
+
+    # the same curve with the discount factors shifted in three scenarios
+    cube = DiscountCurveCube(obsdate, [date(2011,1,1), date(2012,1,1)], [[0.95, 0.88], [0.94, 0.87], [0.96, 0.89]])
+    print "Interpolated Discount Factors per scenario:", cube.df(date(2010,6,1))
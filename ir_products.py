@@ -1,4 +1,5 @@
 from date_conventions import *
+import numpy
 from dateutil.relativedelta import relativedelta
 from numpy.random import normal
 from math import exp, sqrt
@@ -31,24 +32,19 @@ def buildForwardSwap(swap, aDate):
     ''' With this function we build a forward swap starting from an existing swap
     It will be used for the swaption
     '''
-    # find first floating leg date
-    floatIdx = 0
-    while swap.floatingLegDates[floatIdx] <= aDate:
-        floatIdx = floatIdx + 1
-    if floatIdx > 0:
-        floatIdx = floatIdx - 1
+    # find first floating leg date: the last one not after aDate (the schedules are sorted,
+    # so it is found by a binary search on the ordinals)
+    floatIdx = max(numpy.searchsorted(to_ordinals(swap.floatingLegDates), aDate.toordinal(), 'right') - 1, 0)
 
     # find first fixed leg date
-    fixedIdx = 0
-    while swap.fixedLegDates[fixedIdx] <= aDate:
-        fixedIdx = fixedIdx + 1
-    if fixedIdx > 0:
-        fixedIdx = fixedIdx - 1
+    fixedIdx = max(numpy.searchsorted(to_ordinals(swap.fixedLegDates), aDate.toordinal(), 'right') - 1, 0)
 
     floatingLegDates = swap.floatingLegDates[floatIdx:]
     fixedLegDates = swap.fixedLegDates[fixedIdx:]
 
-    swap = Swap(floatingLegDates, swap.floatingLegNominal, fixedLegDates, swap.fixRate, swap.fixedLegNominal)
+    # the accruals of the remaining periods are the same of the original swap
+    swap = Swap(floatingLegDates, swap.floatingLegNominal, fixedLegDates, swap.fixRate, swap.fixedLegNominal,
+                swap.floating_tau[floatIdx:], swap.fixed_tau[fixedIdx:])
     return swap
 
 class Swap:
@@ -58,8 +54,11 @@ class Swap:
     - the set of payment dates (plus the start date) of the fixed leg
     - the coupon of the fixed leg
     - the nominal of the fixed leg (+1 if the is receive)
+    The dates can also be given as arrays of ordinals, together with the accrual fractions of the
+    two legs (floating_tau, fixed_tau): in this case nothing is copied nor recomputed, which is how
+    the SwapStore of trade_store hands out its trades
     '''
-    def __init__(self, floatingLegDates, floatingLegNominal, fixedLegDates, fixRate, fixedLegNominal):
+    def __init__(self, floatingLegDates, floatingLegNominal, fixedLegDates, fixRate, fixedLegNominal, floating_tau=None, fixed_tau=None):
         # check that the two nominals have opposite sign
         if floatingLegNominal * fixedLegNominal > 0:
             raise "Nominal must have opposite sign"
@@ -71,47 +70,47 @@ class Swap:
         self.floatingLegNominal = floatingLegNominal
         self.fixedLegNominal = fixedLegNominal
 
+        # the schedules are compiled once into numpy arrays: for each flow we keep the
+        # ordinal of the fixing date (the start of the period), the ordinal of the payment
+        # date (the end of the period) and the accrual fraction. In this way the npv of a leg
+        # is just a dot product between these arrays and the curves evaluated in one go
+        floatingLegOrdinals = to_ordinals(self.floatingLegDates)
+        self.floating_fixing = floatingLegOrdinals[:-1]
+        self.floating_payment = floatingLegOrdinals[1:]
+
         # we now compute the accrual periods for the floating leg
-        self.floating_tau = []
-        for i in range(len(self.floatingLegDates) - 1):
-            startPeriod = self.floatingLegDates[i]
-            endPeriod = self.floatingLegDates[i+1]
-            self.floating_tau.append(dc_act360(startPeriod, endPeriod))
+        if floating_tau is None:
+            floating_tau = dc_act360_vector(self.floating_fixing, self.floating_payment)
+        self.floating_tau = floating_tau
 
         # we now compute the accrual periods for the fixed leg
-        self.fixed_tau = []
-        for i in range(len(self.fixedLegDates) - 1):
-            startPeriod = self.fixedLegDates[i]
-            endPeriod = self.fixedLegDates[i+1]
-            self.fixed_tau.append(dc_30e360(startPeriod, endPeriod))
+        fixedLegOrdinals = to_ordinals(self.fixedLegDates)
+        self.fixed_payment = fixedLegOrdinals[1:]
+        if fixed_tau is None:
+            fixed_tau = dc_30e360_vector(fixedLegOrdinals[:-1], self.fixed_payment)
+        self.fixed_tau = fixed_tau
 
     def npv_floating_leg(self, discountCurve, liborCurve):
-        #we now evaluate the floating leg
-        floatingleg_npv = 0
-        for i in range(len(self.floatingLegDates) - 1):
-            startPeriod = self.floatingLegDates[i]
-            endPeriod = self.floatingLegDates[i+1]
-            # we just consider "future" flows.
-            # N.B. Past flows doesn't contribute to the market value
-            if endPeriod > discountCurve.today:
-                fwd_libor = liborCurve.value(startPeriod)
-                df = discountCurve.df(endPeriod)
-                floatingleg_npv = floatingleg_npv + df * self.floating_tau[i] * fwd_libor
+        # we just consider "future" flows.
+        # N.B. Past flows doesn't contribute to the market value
+        alive = self.floating_payment > discountCurve.today.toordinal()
+
+        # we evaluate the curves for all of the alive flows at once
+        fwd_libors = liborCurve.value_vector(self.floating_fixing[alive])
+        dfs = discountCurve.df_vector(self.floating_payment[alive])
+        # (the sum is on the last axis: with curve cubes the curves return one row per scenario)
+        floatingleg_npv = numpy.sum(dfs * fwd_libors * self.floating_tau[alive], axis=-1)
 
         # multiply for the nominal and return the value
         return floatingleg_npv * self.floatingLegNominal
 
     def npv_fixed_leg(self, discountCurve):
         #we now evaluate the fixed leg (no libor curve needed)
-        fixed_npv = 0
-        for i in range(len(self.fixedLegDates) - 1):
-            startPeriod = self.fixedLegDates[i]
-            endPeriod = self.fixedLegDates[i+1]
-            # we just consider "future" flows.
-            # N.B. Past flows doesn't contribute to the market value
-            if endPeriod > discountCurve.today:
-                df = discountCurve.df(endPeriod)
-                fixed_npv = fixed_npv + df * self.fixed_tau[i] * self.fixRate
+        # we just consider "future" flows.
+        # N.B. Past flows doesn't contribute to the market value
+        alive = self.fixed_payment > discountCurve.today.toordinal()
+        dfs = discountCurve.df_vector(self.fixed_payment[alive])
+        fixed_npv = numpy.dot(dfs, self.fixed_tau[alive]) * self.fixRate
 
         # multiply for the nominal and return the value
         return fixed_npv * self.fixedLegNominal
@@ -127,7 +126,9 @@ class Swap:
     # simulation date. Only ONE simulation is done
     # The simulation is done in the Annuity measure, where the swap rate (the ratio between
     # the floating leg npv and the annuity) is a martingale
-    def simulated_npv(self, discountcurve, liborcurve, vol, simuldate):
+    # - randomState: an optional numpy RandomState used to draw the random number; if not given
+    #   the global (unseeded) generator of numpy is used
+    def simulated_npv(self, discountcurve, liborcurve, vol, simuldate, randomState=None):
         # we build the forward swap
         fwdswap = buildForwardSwap(self, simuldate)
 
@@ -141,7 +142,10 @@ class Swap:
         swaprate = floating_leg / annuity
 
         # we draw a random variable from a standard normal distribution
-        epsilon = normal()
+        if randomState is None:
+            epsilon = normal()
+        else:
+            epsilon = randomState.normal()
 
         # We compute the equivalent time in terms of year fraction from today to the simulation date
         # (we need numbers to make computations)
@@ -163,6 +167,7 @@ class Swap:
 
 from scipy.stats import norm
 from math import log, fabs
+from montecarlo import split_runs, worker_random_states, run_parallel
 
 
 class Swaption:
@@ -205,10 +210,21 @@ class Swaption:
     # - instead of the forward of an asset, we have the forward swap rate, which is given by
     #   the ratio of the npv of the floating leg and the npv of the fixed leg
     def npv(self, discountCurve, libor, vol):
+        floatNpv, annuity = self.forward_legs(discountCurve, libor)
+        return self.npv_from_legs(floatNpv, annuity, discountCurve.today, vol)
+
+    # the ABSOLUTE values of the floating leg and of the annuity of the underlying forward swap
+    def forward_legs(self, discountCurve, libor):
         floatNpv = fabs(self.swap.npv_floating_leg(discountCurve, libor))
         annuity = fabs(self.swap.npv_fixed_leg(discountCurve) / self.swap.fixRate)
+        return floatNpv, annuity
+
+    # the Merton formula given the ABSOLUTE values of the floating leg and of the annuity:
+    # it is separated from npv so that whoever has already computed the two legs (e.g. a portfolio)
+    # can reuse it
+    def npv_from_legs(self, floatNpv, annuity, today, vol):
         swapRate = floatNpv / annuity
-        time = dc_act365(discountCurve.today, self.swaptionExpiry)
+        time = dc_act365(today, self.swaptionExpiry)
         d1 = self.d1(swapRate, self.swap.fixRate, time, vol)
         d2 = self.d2(swapRate, self.swap.fixRate, time, vol)
         price = annuity * self.parity * (swapRate * norm.cdf(self.parity * d1) - self.swap.fixRate * norm.cdf(self.parity * d2))
@@ -218,14 +234,20 @@ class Swaption:
     # It actually invokes multiple times (nruns) the simulated_npv function of the swap class.
     # For each result of this function, it applies the payoff condition, which states that
     # the option will be exercised only in case of a positive value for the swap
-    def mc_npv(self, discountCurve, libor, vol, nruns):
+    # - seed: if given, the simulation uses its own generator seeded with it and is repeatable
+    def mc_npv(self, discountCurve, libor, vol, nruns, seed=None):
         # start with a zero npv
         npv = 0
 
+        # the generator is created only if a seed is given, otherwise we keep using the global one
+        randomState = None
+        if seed is not None:
+            randomState = numpy.random.RandomState(seed)
+
         # loop nruns times
         for i in range(nruns):
             # simulate the value of the swap
-            swap_npv = self.swap.simulated_npv(discountCurve, libor, vol, self.swaptionExpiry)
+            swap_npv = self.swap.simulated_npv(discountCurve, libor, vol, self.swaptionExpiry, randomState)
             # Exercise condition: if met sum the result, otherwise do nothing
             # (which is equivalent to add zero)
             if swap_npv > 0:
@@ -237,6 +259,78 @@ class Swaption:
         # ok, done, return the result
         return npv
 
+    # The same Montecarlo method of mc_npv, but vectorized: the swap rate and the annuity do not
+    # depend on the simulation, hence they are computed only once; then all of the random numbers
+    # are drawn as numpy arrays of (at most) chunkSize elements, so that memory stays bounded
+    # whatever the number of runs.
+    # - seed: the seed of the random generator (None means a random seed)
+    # It returns a tuple with the price and its standard error
+    def mc_npv_vectorized(self, discountCurve, libor, vol, nruns, seed=None, chunkSize=100000):
+        floatNpv, annuity = self.forward_legs(discountCurve, libor)
+        swapRate = floatNpv / annuity
+        T = dc_act365(discountCurve.today, self.swaptionExpiry)
+
+        randomState = numpy.random.RandomState(seed)
+        total, total_squares = mc_swaption_sums(swapRate, annuity, self.swap.fixRate, self.parity, vol, T,
+                                                nruns, randomState, chunkSize)
+        return mc_estimate(total, total_squares, nruns)
+
+    # The parallel version of mc_npv_vectorized: the runs are split among nworkers processes, each of
+    # them with its own random generator derived from seed (see montecarlo.worker_random_states).
+    # Each worker returns its sum and sum of squares, which are merged in a single estimate.
+    # For a given seed and number of workers the result is always the same, bit by bit.
+    # It returns a tuple with the price and its standard error
+    def mc_npv_parallel(self, discountCurve, libor, vol, nruns, nworkers=4, seed=0, chunkSize=100000):
+        floatNpv, annuity = self.forward_legs(discountCurve, libor)
+        swapRate = floatNpv / annuity
+        T = dc_act365(discountCurve.today, self.swaptionExpiry)
+
+        randomStates = worker_random_states(seed, nworkers)
+        tasks = []
+        for runs, randomState in zip(split_runs(nruns, nworkers), randomStates):
+            tasks.append((swapRate, annuity, self.swap.fixRate, self.parity, vol, T, runs, randomState, chunkSize))
+        partial_sums = run_parallel(mc_swaption_worker, tasks, nworkers)
+
+        # the partial sums are merged in the order of the workers
+        total = 0.0
+        total_squares = 0.0
+        for partial_total, partial_squares in partial_sums:
+            total = total + partial_total
+            total_squares = total_squares + partial_squares
+        return mc_estimate(total, total_squares, nruns)
+
+
+# This function simulates nruns values at expiry of a swaption whose forward swap rate is lognormal
+# in the annuity measure and returns the sum and the sum of the squares of the payoffs (already
+# multiplied by the annuity). The paths are drawn from randomState in chunks of chunkSize.
+def mc_swaption_sums(swapRate, annuity, strike, parity, vol, T, nruns, randomState, chunkSize):
+    drift = -0.5 * vol**2 * T
+    diffusion = vol * sqrt(T)
+    total = 0.0
+    total_squares = 0.0
+    done = 0
+    while done < nruns:
+        n = min(chunkSize, nruns - done)
+        epsilon = randomState.standard_normal(n)
+        swaprate_simul = swapRate * numpy.exp(drift + diffusion * epsilon)
+        # Exercise condition: the payoff is floored at zero
+        payoff = numpy.maximum(parity * (swaprate_simul - strike), 0.0) * annuity
+        total = total + payoff.sum()
+        total_squares = total_squares + numpy.dot(payoff, payoff)
+        done = done + n
+    return total, total_squares
+
+# The function executed by each worker of Swaption.mc_npv_parallel: it just unpacks the task
+def mc_swaption_worker(task):
+    return mc_swaption_sums(*task)
+
+# Given the sum and the sum of the squares of n simulated values, this function returns
+# their mean and the standard error of the mean
+def mc_estimate(total, total_squares, n):
+    mean = total / n
+    variance = max(total_squares / n - mean**2, 0.0)
+    return mean, sqrt(variance / n)
+
 # example
 from ir_curves import DiscountCurve, ForwardLiborCurve
 
@@ -266,3 +360,9 @@ if __name__ == '__main__':
 
     print "mc receiver swaption: ", reveiver_swaption.mc_npv(dc, libor, 0.2, 1000)
     print "mc payer swaption: ", payer_swaption.mc_npv(dc, libor, 0.2, 1000)
+
+    print "vectorized mc receiver swaption (npv, std. error): ", reveiver_swaption.mc_npv_vectorized(dc, libor, 0.2, 1000000, seed=1)
+    print "vectorized mc payer swaption (npv, std. error): ", payer_swaption.mc_npv_vectorized(dc, libor, 0.2, 1000000, seed=1)
+
+    print "parallel mc receiver swaption (npv, std. error): ", reveiver_swaption.mc_npv_parallel(dc, libor, 0.2, 1000000, nworkers=4, seed=1)
+    print "parallel mc payer swaption (npv, std. error): ", payer_swaption.mc_npv_parallel(dc, libor, 0.2, 1000000, nworkers=4, seed=1)
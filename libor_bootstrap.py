@@ -0,0 +1,179 @@
+from ir_products import *
+from ir_curves import *
+import numpy
+from curve_cache import snapshot_key, curve_key
+
+class ForwardLiborCurveBootstrap:
+    '''
+    This class will find the forward libor rates given an OIS discount curve and a collection
+    of swaps (see buildSwap) whose fixed rate is the market quote, i.e. whose npv must be zero.
+
+    The pillars of the forward curve are the fixing dates of the last floating flow of each swap
+    (plus today, if the value of the current libor fixing is known). The forward curve interpolates
+    linearly the rates, so each interpolated libor is a linear combination of the pillar values with
+    weights that depend only on the dates (see interpolation_weights), and the npv of a swap is
+      floatingLegNominal * sum_k df_k * tau_k * sum_j w_kj * f_j + fixedLegNominal * quote * annuity
+    i.e. it is linear in the unknown forwards f: all of the pillars are found solving a linear system.
+    The matrix of the system and the annuities depend only on the swaps and on the discount curve,
+    so they are computed once (evaluating the discount curve only once on all of the payment dates)
+    and reused for every set of quotes.
+    '''
+    def __init__(self, today, discountCurve, spotLibor=None):
+        self.today = today
+        self.discountCurve = discountCurve
+        self.spotLibor = spotLibor
+        self.products = []
+        self.matrix = None
+        self.curve = None
+
+    def addProduct(self, swap):
+        # we add products and check that they are ordered by their last fixing date
+        if len(self.products) > 0:
+            if swap.floating_fixing[-1] <= self.products[-1].floating_fixing[-1]:
+                raise ValueError("Products not ordered")
+        self.products.append(swap)
+        self.matrix = None
+
+    # this method builds the linear system, it is called once by the first bootstrap
+    def buildSystem(self):
+        today = self.today.toordinal()
+        self.pillars_number = numpy.array([swap.floating_fixing[-1] for swap in self.products], dtype=numpy.float64)
+        if self.spotLibor is not None:
+            self.pillars_number = numpy.concatenate(([today], self.pillars_number))
+
+        # only the flows paid after today contribute to the npv; the discount curve is evaluated
+        # once on the grid of all of the payment dates of all of the swaps
+        floating_alive = [swap.floating_payment > today for swap in self.products]
+        fixed_alive = [swap.fixed_payment > today for swap in self.products]
+        payments = [swap.floating_payment[alive] for swap, alive in zip(self.products, floating_alive)]
+        payments = payments + [swap.fixed_payment[alive] for swap, alive in zip(self.products, fixed_alive)]
+        grid, index = numpy.unique(numpy.concatenate(payments), return_inverse=True)
+        dfs = self.discountCurve.df_vector(grid)[index]
+
+        rows = []
+        annuities = []
+        start = 0
+        for swap, alive in zip(self.products, floating_alive):
+            end = start + numpy.count_nonzero(alive)
+            weights = interpolation_weights(swap.floating_fixing[alive], self.pillars_number)
+            rows.append(swap.floatingLegNominal * (dfs[start:end] * swap.floating_tau[alive]).dot(weights))
+            start = end
+        for swap, alive in zip(self.products, fixed_alive):
+            end = start + numpy.count_nonzero(alive)
+            annuities.append(swap.fixedLegNominal * dfs[start:end].dot(swap.fixed_tau[alive]))
+            start = end
+
+        matrix = numpy.array(rows)
+        self.annuities = numpy.array(annuities)
+        if self.spotLibor is not None:
+            # the spot libor is known: its contribution goes on the right hand side
+            self.known_npv = matrix[:, 0] * self.spotLibor
+            self.matrix = matrix[:, 1:]
+        else:
+            self.known_npv = numpy.zeros(len(self.products))
+            self.matrix = matrix
+
+    # This method finds the forward rates for many sets of quotes at once (e.g. the market quotes
+    # shocked by many scenarios): quotes has one row per set and one column per swap.
+    # It returns a matrix with one row per set and one column per pillar
+    def solve_forwards(self, quotes):
+        if self.matrix is None:
+            self.buildSystem()
+        quotes = numpy.atleast_2d(numpy.asarray(quotes, dtype=numpy.float64))
+        rhs = - (self.annuities * quotes + self.known_npv)
+        forwards = numpy.linalg.solve(self.matrix, rhs.T).T
+        if self.spotLibor is not None:
+            spot = numpy.repeat(self.spotLibor, len(quotes))
+            forwards = numpy.column_stack((spot, forwards))
+        return forwards
+
+    # the same as solve_forwards, but it returns a list of ForwardLiborCurve, one per set of quotes
+    def bootstrap_batch(self, quotes):
+        forwards = self.solve_forwards(quotes)
+        fixingDates = [date.fromordinal(int(pillar)) for pillar in self.pillars_number]
+        return [ForwardLiborCurve(self.today, list(fixingDates), list(row)) for row in forwards]
+
+    # the same as bootstrap_batch, but all of the sets of quotes are returned as a single
+    # ForwardLiborCurveCube, with one scenario per set, ready to price the products once for all of them
+    def bootstrap_cube(self, quotes):
+        forwards = self.solve_forwards(quotes)
+        fixingDates = [date.fromordinal(int(pillar)) for pillar in self.pillars_number]
+        return ForwardLiborCurveCube(self.today, fixingDates, forwards)
+
+    # the key of the market data snapshot of the bootstrap (see curve_cache): the schedules and the
+    # nominals of the swaps, their quotes, the spot libor and the discount curve
+    def key(self):
+        instruments = [(swap.floating_fixing, swap.floating_payment, swap.floating_tau, swap.floatingLegNominal,
+                        swap.fixed_payment, swap.fixed_tau, swap.fixedLegNominal) for swap in self.products]
+        quotes = [swap.fixRate for swap in self.products] + [self.spotLibor]
+        return snapshot_key("Forward libor curve", self.today, instruments + ["spot libor"], quotes, "linear",
+                            [curve_key(self.discountCurve)])
+
+    # the forward curve consistent with the fixed rates of the swaps
+    # - cache: if given (e.g. curve_cache.curve_cache), the curve is taken from this CurveCache when it
+    #   has already been built from the same snapshot (see key)
+    def bootstrap(self, cache=None):
+        if cache is not None:
+            self.curve = cache.get(self.key(), self.bootstrap)
+            return self.curve
+        quotes = [swap.fixRate for swap in self.products]
+        self.curve = self.bootstrap_batch([quotes])[0]
+        return self.curve
+
+    # This method returns the derivatives of the unknown forward pillars (i.e. all of them but the
+    # spot libor) of the last bootstrapped curve:
+    # - with respect to the log discount factors of the pillars of the discount curve (today excluded)
+    # - with respect to the quotes of the swaps
+    # The npvs of the swaps stay zero, hence matrix * df + d npv / dx * dx + annuities * dq = 0
+    # The discount curve must use the default interpolation scheme (see interpolation_weights)
+    def sensitivity(self):
+        if not log_linear(self.discountCurve):
+            raise ValueError("The sensitivities need curves with the default interpolation")
+        if self.matrix is None:
+            # the curve may come from a cache (see bootstrap)
+            self.buildSystem()
+        today = self.today.toordinal()
+        discount_pillars = self.discountCurve.pillars_number
+        npv_x = []
+        for swap in self.products:
+            alive = swap.floating_payment > today
+            payments = swap.floating_payment[alive]
+            flows = swap.floatingLegNominal * swap.floating_tau[alive] * self.discountCurve.df_vector(payments) \
+                    * self.curve.value_vector(swap.floating_fixing[alive])
+            row = flows.dot(interpolation_weights(payments, discount_pillars))
+
+            alive = swap.fixed_payment > today
+            payments = swap.fixed_payment[alive]
+            flows = swap.fixedLegNominal * swap.fixRate * swap.fixed_tau[alive] * self.discountCurve.df_vector(payments)
+            row = row + flows.dot(interpolation_weights(payments, discount_pillars))
+            npv_x.append(row[1:])
+
+        forwards_x = numpy.linalg.solve(self.matrix, - numpy.array(npv_x))
+        forwards_quotes = numpy.linalg.solve(self.matrix, - numpy.diag(self.annuities))
+        return forwards_x, forwards_quotes
+
+
+from ois_bootstrap import DiscountCurveBootstrap
+from ois_products import buildOIS
+
+if __name__ == '__main__':
+    today = date(2010,1,1)
+
+    dc_bootstrapper = DiscountCurveBootstrap(today)
+    for maturity, quote in [(1, 0.01), (3, 0.011), (6, 0.012), (12, 0.014), (24, 0.017), (36, 0.02), (60, 0.025)]:
+        dc_bootstrapper.addProduct(buildOIS(today, maturity, 12, quote))
+    dc_curve = dc_bootstrapper.bootstrap()
+
+    libor_bootstrapper = ForwardLiborCurveBootstrap(today, dc_curve, spotLibor=0.015)
+    for maturity, quote in [(12, 0.016), (24, 0.019), (36, 0.022), (60, 0.027)]:
+        libor_bootstrapper.addProduct(buildSwap(today, maturity, 6, 12, quote))
+    libor_curve = libor_bootstrapper.bootstrap()
+    for i, pillar in enumerate(libor_curve.fixingDates):
+        print pillar, ": ", libor_curve.forwardLibors[i]
+    print "Swap npvs:", [swap.npv(dc_curve, libor_curve) for swap in libor_bootstrapper.products]
+
+    # the same swaps with their quotes shifted up by 1bp and 10bp, in a single call
+    quotes = numpy.array([swap.fixRate for swap in libor_bootstrapper.products])
+    print "Shocked forwards:", libor_bootstrapper.solve_forwards([quotes + 0.0001, quotes + 0.001])
+    shocked_curves = libor_bootstrapper.bootstrap_cube([quotes + 0.0001, quotes + 0.001])
+    print "Swap npvs with the shocked curves:", [swap.npv(dc_curve, shocked_curves) for swap in libor_bootstrapper.products]
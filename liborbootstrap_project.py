@@ -1,54 +1,62 @@
 from datetime import date
-from openpyxl import load_workbook
+from ingestion import excel_cells, excel_batches, read_table, batch_results, write_column, as_date, as_float, as_int
+from ois_bootstrap import DiscountCurveBootstrap
+from curve_cache import curve_cache
+from ois_products import buildOIS
+from ir_products import buildSwap
+from libor_bootstrap import ForwardLiborCurveBootstrap
 
 if __name__ == '__main__':
-    wb = load_workbook('LiborCurveBootstrap.xlsx')
-    ws = wb.active
+    # the workbook is read in streaming (see ingestion): each table goes on until its first empty row
+    input_file = 'LiborCurveBootstrap.xlsx'
 
     # Take the input parameters
-    today = ws['C2'].value.date()
-    libor_tenor = ws['C3'].value
-    libor_value = ws['C4'].value
+    today, libor_tenor, libor_value = excel_cells(input_file, ['C2', 'C3', 'C4'])
+    today = as_date(today)
+    libor_tenor = as_int(libor_tenor)
 
     # OIS Data
     ois_startdate = today
-    ois_maturities = []
-    ois_mktquotes = []
-    for cell in list(ws.iter_rows('B8:C37')):
-        ois_maturities.append(cell[0].value)
-        ois_mktquotes.append(cell[1].value)
+    ois = read_table(excel_batches(input_file, 'B8', [('maturity', as_int), ('quote', as_float)]))
+    ois_maturities = ois['maturity']
+    ois_mktquotes = ois['quote']
 
     # Swap Data
     swap_startdate = today
-    swap_maturities = []
-    swap_mktquotes = []
-    for cell in list(ws.iter_rows('E8:F40')):
-        swap_maturities.append(cell[0].value)
-        swap_mktquotes.append(cell[1].value)
+    swaps = read_table(excel_batches(input_file, 'E8', [('maturity', as_int), ('quote', as_float)]))
+    swap_maturities = swaps['maturity']
+    swap_mktquotes = swaps['quote']
 
-    # Output Dates
-    output_dates = []
-    for cell in list(ws.iter_rows('H8:H40')):
-        output_dates.append(cell[0].value.date())
+    # Output Dates: they are read (and the libors computed) one batch at a time
+    date_batches = lambda: excel_batches(input_file, 'H8', [('date', as_date)])
 
 
-    # YOUR CODE HERE .... The result of your code must be a variable of type list whose name
-    # must be output_results. The length of this list has to be the same of output_dates
+    # YOUR CODE HERE .... The result of your code must be an iterable whose name must be
+    # output_results, with one value per output date
 
+    # the discount curve is bootstrapped from the OIS quotes (fixed leg with annual payments); the curves
+    # are taken from the curve cache (see curve_cache), so they are built only once for the same quotes
+    dc_bootstrapper = DiscountCurveBootstrap(today)
+    for maturity, quote in zip(ois_maturities, ois_mktquotes):
+        dc_bootstrapper.addProduct(buildOIS(ois_startdate, maturity, 12, quote))
+    dc_curve = dc_bootstrapper.bootstrap(cache=curve_cache)
 
+    # the forward libor curve is bootstrapped from the swap quotes (floating leg paying with the
+    # libor tenor, fixed leg with annual payments), the first pillar being today's libor fixing
+    libor_bootstrapper = ForwardLiborCurveBootstrap(today, dc_curve, spotLibor=libor_value)
+    for maturity, quote in zip(swap_maturities, swap_mktquotes):
+        libor_bootstrapper.addProduct(buildSwap(swap_startdate, maturity, libor_tenor, 12, quote))
+    libor_curve = libor_bootstrapper.bootstrap(cache=curve_cache)
 
+    output_results = batch_results(date_batches(), lambda batch: libor_curve.value_vector(batch['date']))
 
     # END OF YOUR CODE
 
     # Write results
-    # A variable named output_results of type list, with the same length of output_dates, is expected.
+    # A variable named output_results, with one value per output date, is expected.
     # In case this is not present, a message is written
     if 'output_results' not in locals():
-        output_result = ["Not Successful" for x in range(len(output_dates))]
-
-    out_list = list(ws.iter_rows('I8:I40'))
-    for i in range(len(output_result)):
-        out_list[i][0].value = output_result[i]
+        output_results = batch_results(date_batches(), lambda batch: ["Not Successful" for x in batch['date']])
 
     # A new file with the results is created
-    wb.save("LiborCurveBootstrap_output.xlsx")
\ No newline at end of file
+    write_column(input_file, "LiborCurveBootstrap_output.xlsx", 'I8', output_results)
\ No newline at end of file
@@ -0,0 +1,37 @@
+# numpy is a numerical package
+import numpy
+
+# multiprocessing allows to run python functions in separate processes
+from multiprocessing import Pool
+
+# This function splits nruns simulations among nworkers workers: each worker receives the same
+# number of runs, the first ones one more run if the division has a remainder.
+# The split depends only on nruns and nworkers, which is one of the conditions needed to have
+# reproducible results
+def split_runs(nruns, nworkers):
+    base, remainder = divmod(nruns, nworkers)
+    return [base + 1 if i < remainder else base for i in range(nworkers)]
+
+# This function returns one independent random generator for each worker, all derived from a single seed.
+# When numpy provides SeedSequence, each worker gets a child of the sequence spawned from the seed;
+# otherwise the worker index is appended to the seed, which numpy mixes in the state of the generator.
+# In both cases the same (seed, nworkers) pair gives the same streams at every run
+def worker_random_states(seed, nworkers):
+    if hasattr(numpy.random, 'SeedSequence'):
+        children = numpy.random.SeedSequence(seed).spawn(nworkers)
+        return [numpy.random.RandomState(child.generate_state(4)) for child in children]
+    return [numpy.random.RandomState([seed, i]) for i in range(nworkers)]
+
+# This function calls function on each element of tasks using a pool of nworkers processes.
+# function must be defined at module level (otherwise it cannot be sent to another process).
+# The results are returned in the same order of the tasks, so that merging them is deterministic
+def run_parallel(function, tasks, nworkers):
+    if nworkers == 1:
+        return [function(task) for task in tasks]
+    pool = Pool(nworkers)
+    try:
+        results = pool.map(function, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return results
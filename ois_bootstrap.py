@@ -1,35 +1,61 @@
 from ois_products import *
 from ir_curves import *
+import numpy
 from scipy.optimize import brentq
+from interpolation import interpolators
+from curve_cache import snapshot_key
 
 class DiscountCurveBootstrapHelper:
     '''
     This class will be used within the root finding algorithm which will recursively
     invoke the method updateDf
     '''
-    def __init__(self, today, product, pillars, dfs):
+    def __init__(self, today, product, pillars, dfs, interpolation="loglinear"):
         self.today = today
         self.product = product
         self.pillars = pillars
         self.dfs = dfs
+        self.interpolation = interpolation
 
     def pricer(self, df):
         self.dfs[-1] = df
-        dc = DiscountCurve(self.today, self.pillars, self.dfs)
+        dc = DiscountCurve(self.today, self.pillars, self.dfs, self.interpolation)
         npv = self.product.npv(dc)
         return npv
 
+class IncrementalBootstrapHelper:
+    '''
+    The helper used by the incremental bootstrap: the curve is built once and only the discount
+    factor of the last pillar is changed by the root finder. The flows of the product paid on or before
+    the previous pillar do not depend on it, so their value (known_npv) is computed only once
+    and just the flows of the last segment are repriced
+    '''
+    def __init__(self, curve, index, known_npv, ordinals, coefficients):
+        self.curve = curve
+        self.index = index
+        self.known_npv = known_npv
+        self.ordinals = ordinals
+        self.coefficients = coefficients
+
+    def pricer(self, df):
+        self.curve.set_df(self.index, df)
+        return self.known_npv + numpy.dot(self.coefficients, self.curve.df_vector(self.ordinals))
+
 class DiscountCurveBootstrap:
     '''
-    This class will find the discount factors given a collection of ir products
+    This class will find the discount factors given a collection of ir products.
+    The curve uses the given interpolation scheme (see DiscountCurve). With the schemes which are not
+    local (e.g. "cubic" or "monotoneconvex") the discount factor of a pillar also moves the curve before
+    the previous pillars, so the products already matched must be repriced: see bootstrap_sweeps
     '''
 
     # In the init we build an empty list products
     # The only parameter we need is the date at which this procedure refers
-    def __init__(self, today):
+    def __init__(self, today, interpolation="loglinear"):
         self.products = []
         self.tenors = []
         self.today = today
+        self.interpolation = interpolation
 
     def addProduct(self, product):
         # we add products and check that they are ordered
@@ -40,7 +66,25 @@ class DiscountCurveBootstrap:
                 raise "Products not ordered"
         self.products.append(product)
 
-    def bootstrap(self):
+    # the key of the market data snapshot of the bootstrap (see curve_cache): the schedules and the
+    # nominals of the products, their quotes and the interpolation scheme
+    def key(self):
+        instruments = [(product.floating_dates, product.floatingLegNominal, product.fixed_payment, product.fixed_tau,
+                        product.fixedLegNominal) for product in self.products]
+        quotes = [product.fixedRate for product in self.products]
+        return snapshot_key("OIS discount curve", self.today, instruments, quotes, self.interpolation)
+
+    # - incremental: if True (the default) the curve is built once and modified in place
+    #   (see bootstrap_incremental), otherwise a new curve is built at each step of the root finder;
+    #   the schemes which are not local always use bootstrap_incremental
+    # - cache: if given (e.g. curve_cache.curve_cache), the curve is taken from this CurveCache when it
+    #   has already been built from the same snapshot (see key)
+    def bootstrap(self, incremental=True, cache=None):
+        if cache is not None:
+            return cache.get(self.key(), lambda: self.bootstrap(incremental))
+        if incremental or not interpolators[self.interpolation].local:
+            return self.bootstrap_incremental()
+
         # we run the iterative procedure
         pillars = [self.today]
         dfs = [1.0]
@@ -51,7 +95,7 @@ class DiscountCurveBootstrap:
 
             # We need to use an auxiliary class to wrap the target function, i.e. the function
             # that will be passed to the root finder (brent algorithm)
-            helper = DiscountCurveBootstrapHelper(self.today, product, pillars, dfs)
+            helper = DiscountCurveBootstrapHelper(self.today, product, pillars, dfs, self.interpolation)
 
             # run the root finding searching the result in the interval [0.0001, 2.]
             df = brentq(helper.pricer, 0.0001, 2.)
@@ -61,7 +105,165 @@ class DiscountCurveBootstrap:
             dfs[-1] = df
 
         # return the output as a tuple consisting of 2 lists
-        return DiscountCurve(self.today, pillars, dfs)
+        return DiscountCurve(self.today, pillars, dfs, self.interpolation)
+
+    # The same procedure of bootstrap, but the curve is built only once with all of its pillars
+    # and the discount factors are set one at a time. The i-th product only has flows up to its
+    # end date, i.e. the i-th pillar, so the pillars not solved yet do not affect its value.
+    # The npv of an OIS is a linear combination of discount factors (see discount_cashflows):
+    # - the flows on or before the previous pillar are already known and are valued only once
+    # - if the only other flow is paid on the new pillar, the npv is linear in its discount factor
+    #   and the equation npv = 0 is solved analytically
+    # - otherwise we run the root finder repricing only the flows of the last segment
+    # This holds only for the local schemes: the other ones are bootstrapped by bootstrap_sweeps
+    def bootstrap_incremental(self):
+        pillars = [self.today] + [product.endDate for product in self.products]
+        dfs = [1.0 for pillar in pillars]
+        curve = DiscountCurve(self.today, pillars, dfs, self.interpolation)
+        if not curve.interpolator.local:
+            return self.bootstrap_sweeps(curve)
+
+        for i, product in enumerate(self.products):
+            index = i + 1
+            previous_pillar = curve.pillars_number[index - 1]
+            last_pillar = curve.pillars_number[index]
+
+            ordinals, coefficients = product.discount_cashflows()
+            known = ordinals <= previous_pillar
+            known_npv = numpy.dot(coefficients[known], curve.df_vector(ordinals[known]))
+            open_ordinals = ordinals[~known]
+            open_coefficients = coefficients[~known]
+
+            last_coefficient = open_coefficients.sum()
+            if numpy.all(open_ordinals == last_pillar) and last_coefficient != 0:
+                df = - known_npv / last_coefficient
+            else:
+                helper = IncrementalBootstrapHelper(curve, index, known_npv, open_ordinals, open_coefficients)
+                df = brentq(helper.pricer, 0.0001, 2.)
+            curve.set_df(index, df)
+
+        return curve
+
+    # The bootstrap for the schemes which are not local: the discount factor of the i-th pillar is found
+    # repricing all of the flows of the i-th product, with the other discount factors fixed. In the first
+    # sweep the pillars not solved yet have the zero rate of the last one solved; then the sweeps are
+    # repeated, since each pillar moves the curve before the previous ones, until the discount factors
+    # change less than tolerance
+    # - max_sweeps: the maximum number of sweeps through the pillars
+    def bootstrap_sweeps(self, curve, tolerance=1e-14, max_sweeps=50):
+        flows = [product.discount_cashflows() for product in self.products]
+        # the time from today of the pillars
+        times = curve.pillars_number - curve.pillars_number[0]
+
+        for sweep in range(max_sweeps):
+            previous_dfs = numpy.array(curve.dfs)
+            for i, (ordinals, coefficients) in enumerate(flows):
+                index = i + 1
+                helper = IncrementalBootstrapHelper(curve, index, 0.0, ordinals, coefficients)
+                df = brentq(helper.pricer, 0.0001, 2.)
+                curve.set_df(index, df)
+                if sweep == 0:
+                    for j in range(index + 1, len(curve.pillars)):
+                        curve.set_df(j, df ** (times[j] / times[index]))
+            if numpy.max(numpy.abs(numpy.array(curve.dfs) - previous_dfs)) < tolerance:
+                return curve
+
+        raise ValueError("The bootstrap did not converge")
+
+
+class DiscountCurveGlobalFit:
+    '''
+    This class finds the discount factors fitting all of the products at the same time, instead of
+    one after the other as DiscountCurveBootstrap does. The unknowns are the logarithms of the
+    discount factors at the pillars (by default the end dates of the products) and the equations
+    are the npv of the products, which must be zero.
+
+    Since the curve interpolates linearly the logarithms (the fitted curve always uses the default
+    interpolation scheme, see log_linear), ln df(t) = sum_j w_j(t) * x_j, where the
+    weights w do not depend on the unknowns x (see interpolation_weights). The npv of an OIS is
+    sum_k c_k * df(t_k) (see discount_cashflows), therefore its derivative with respect to x_j is
+    sum_k c_k * df(t_k) * w_j(t_k): the Jacobian is analytic and is computed with a few matrix products.
+
+    The system is solved with the Levenberg-Marquardt method (which is the Newton method when the
+    damping goes to zero), so the products do not have to be ordered, they may overlap and there may
+    be more products than pillars (in this case the fit is in the least squares sense).
+    After the fit the Jacobian of the npvs with respect to the log discount factors is kept in
+    self.jacobian (one row per product, one column per pillar)
+    '''
+    def __init__(self, today):
+        self.products = []
+        self.today = today
+        self.jacobian = None
+        self.quote_jacobian = None
+        self.curve = None
+
+    def addProduct(self, product):
+        self.products.append(product)
+
+    # - pillars: the dates of the pillars, if None the end dates of the products are used
+    # - tolerance: the fit stops when all of the npvs are smaller (in absolute value) than this
+    # - max_iterations: the maximum number of iterations
+    def fit(self, pillars=None, tolerance=1e-12, max_iterations=50):
+        if pillars is None:
+            pillars = sorted(set(product.endDate for product in self.products))
+        pillars = [self.today] + [pillar for pillar in pillars if pillar > self.today]
+        pillars_number = to_ordinals(pillars)
+
+        # we merge the flows of all of the products: flow k belongs to the product owner[k]
+        ordinals, coefficients, owner = [], [], []
+        for i, product in enumerate(self.products):
+            product_ordinals, product_coefficients = product.discount_cashflows()
+            ordinals.append(product_ordinals)
+            coefficients.append(product_coefficients)
+            owner.append(numpy.repeat(i, len(product_ordinals)))
+        ordinals = numpy.concatenate(ordinals)
+        coefficients = numpy.concatenate(coefficients)
+        aggregation = numpy.zeros((len(self.products), len(ordinals)))
+        aggregation[numpy.concatenate(owner), numpy.arange(len(ordinals))] = 1.0
+
+        # the first pillar is today, whose discount factor is 1: it is not an unknown
+        weights = interpolation_weights(ordinals, pillars_number)[:, 1:]
+
+        def npvs_and_jacobian(x):
+            values = coefficients * numpy.exp(weights.dot(x))
+            return aggregation.dot(values), aggregation.dot(values[:, numpy.newaxis] * weights)
+
+        x = numpy.zeros(len(pillars) - 1)
+        npvs, jacobian = npvs_and_jacobian(x)
+        damping = 1e-3
+        for iteration in range(max_iterations):
+            if numpy.max(numpy.abs(npvs)) < tolerance:
+                break
+            normal_matrix = jacobian.T.dot(jacobian)
+            gradient = jacobian.T.dot(npvs)
+            step = numpy.linalg.solve(normal_matrix + damping * numpy.diag(numpy.diag(normal_matrix)), - gradient)
+            new_npvs, new_jacobian = npvs_and_jacobian(x + step)
+            if new_npvs.dot(new_npvs) < npvs.dot(npvs):
+                x, npvs, jacobian = x + step, new_npvs, new_jacobian
+                damping = damping * 0.1
+            else:
+                damping = damping * 10.0
+        else:
+            if numpy.max(numpy.abs(npvs)) >= tolerance:
+                raise ValueError("The global fit did not converge")
+
+        self.jacobian = jacobian
+        dfs = [1.0] + list(numpy.exp(x))
+        self.curve = DiscountCurve(self.today, pillars, dfs, "loglinear")
+
+        # the derivative of the npv of each product with respect to its own quote (the fixed rate)
+        # is the value of its fixed leg divided by the rate
+        self.quote_jacobian = numpy.array([product.fixedLegNominal *
+                                           numpy.dot(product.fixed_tau, self.curve.df_vector(product.fixed_payment))
+                                           for product in self.products])
+        return self.curve
+
+    # This method returns the derivatives of the log discount factors at the pillars (rows) with
+    # respect to the quotes of the products (columns). Since the npvs stay zero when the quotes move,
+    # jacobian * dx + quote_jacobian * dq = 0, i.e. dx / dq = - jacobian^-1 * diag(quote_jacobian)
+    # (in the least squares sense if there are more products than pillars)
+    def quote_sensitivity(self):
+        return numpy.linalg.lstsq(self.jacobian, - numpy.diag(self.quote_jacobian), rcond=None)[0]
 
 
 from dateutil.relativedelta import relativedelta
@@ -82,3 +284,22 @@ if __name__ == '__main__':
     for i, pillar in enumerate(dc_curve.pillars):
         print pillar, ": ", dc_curve.dfs[i]
 
+    reference_curve = dc_bootstrapper.bootstrap(incremental=False)
+    print "Max difference with the non incremental bootstrap:", numpy.max(numpy.abs(numpy.array(reference_curve.dfs) - numpy.array(dc_curve.dfs)))
+
+    # the same curve fitted with the global solver
+    global_fit = DiscountCurveGlobalFit(today)
+    for product in dc_bootstrapper.products:
+        global_fit.addProduct(product)
+    global_curve = global_fit.fit()
+    print "Max difference with the global fit:", numpy.max(numpy.abs(numpy.array(global_curve.dfs) - numpy.array(dc_curve.dfs)))
+
+
+    # the same products with the other interpolation schemes
+    for interpolation in ["zerolinear", "monotoneconvex", "cubic"]:
+        scheme_bootstrapper = DiscountCurveBootstrap(today, interpolation)
+        for product in dc_bootstrapper.products:
+            scheme_bootstrapper.addProduct(product)
+        scheme_curve = scheme_bootstrapper.bootstrap()
+        print interpolation, "max npv:", max(abs(product.npv(scheme_curve)) for product in scheme_bootstrapper.products), \
+            "last df:", scheme_curve.dfs[-1]
@@ -1,4 +1,5 @@
 from date_conventions import *
+import numpy
 
 class OvernightIndexSwap:
     ''' We define the product by its:
@@ -12,8 +13,10 @@ class OvernightIndexSwap:
     - fixedRate: the coupon paid/received in the fixed leg
     - fixedLegNominal: the nominal used to compute the flows of the floating leg:
       if positive the flows are received, negative paid
+    The fixed leg dates can also be an array of ordinals, given together with its accrual fractions
+    (fixed_tau): this is how the OISStore of trade_store hands out its trades without copying them
     '''
-    def __init__(self, startDate, endDate, floatingLegNominal, fixedLegDates, fixedRate, fixedLegNominal):
+    def __init__(self, startDate, endDate, floatingLegNominal, fixedLegDates, fixedRate, fixedLegNominal, fixed_tau=None):
         # we want opposite signs for the two nominals: if one leg is paid, the other is received
         # if this is not the case generates an error that will stop the program
         if floatingLegNominal * fixedLegNominal > 0:
@@ -27,28 +30,44 @@ class OvernightIndexSwap:
         self.floatingLegNominal = floatingLegNominal
         self.fixedLegNominal = fixedLegNominal
 
+        # the schedules are compiled once into numpy arrays: the ordinals of the start and end date
+        # of the floating leg, the payment ordinals of the fixed leg and its accrual fractions
+        self.floating_dates = to_ordinals([startDate, endDate])
+        fixedLegOrdinals = to_ordinals(fixedLegDates)
+        self.fixed_payment = fixedLegOrdinals[1:]
+        if fixed_tau is None:
+            fixed_tau = dc_act360_vector(fixedLegOrdinals[:-1], self.fixed_payment)
+        self.fixed_tau = fixed_tau
+
     # With this method we compute the value of the floating leg at the observation date of the discount curve
     def npv_floating_leg(self, discountCurve):
         # this formula comes from the fact that for OIS the evaluation method is still the same of
         # the "old" world with just one single curve for forward rate estimation and flow discounting
-        floatingleg_npv = discountCurve.df(self.startDate) - discountCurve.df(self.endDate)
+        # (the indexing is on the last axis: with a curve cube we get one row per scenario)
+        dfs = discountCurve.df_vector(self.floating_dates)
+        floatingleg_npv = dfs[..., 0] - dfs[..., 1]
 
         # We multiply the result for the nominal before returning it
         return floatingleg_npv * self.floatingLegNominal
 
     def npv_fixed_leg(self, discountCurve):
-        # we now evaluate the fixed leg
-        fixed_npv = 0
-        for i in range(len(self.fixedLegDates) - 1):
-            startPeriod = self.fixedLegDates[i]
-            endPeriod = self.fixedLegDates[i+1]
-            tau = dc_act360(startPeriod, endPeriod)
-            df = discountCurve.df(endPeriod)
-            fixed_npv = fixed_npv + df * tau * self.fixedRate
+        # we now evaluate the fixed leg as a dot product between the accruals and the discount factors
+        dfs = discountCurve.df_vector(self.fixed_payment)
+        fixed_npv = numpy.dot(dfs, self.fixed_tau) * self.fixedRate
 
         # We multiply the result for the nominal before returning it
         return fixed_npv * self.fixedLegNominal
 
+    # The npv of an OIS is a linear combination of discount factors: this method returns the dates
+    # (as ordinals) and the coefficients of this combination, so that
+    # npv = sum(coefficients * discountCurve.df_vector(ordinals))
+    def discount_cashflows(self):
+        ordinals = numpy.concatenate((self.floating_dates, self.fixed_payment))
+        floating_coeff = [self.floatingLegNominal, - self.floatingLegNominal]
+        fixed_coeff = self.fixedLegNominal * self.fixedRate * self.fixed_tau
+        coefficients = numpy.concatenate((floating_coeff, fixed_coeff))
+        return ordinals, coefficients
+
     def npv(self, discountCurve):
         # the npv is the sum of the floating and fixed leg values (taken with their sign)
         floatingleg_npv = self.npv_floating_leg(discountCurve)
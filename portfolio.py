@@ -0,0 +1,206 @@
+# numpy is a numerical package
+import numpy
+
+from ir_products import Swap, Swaption
+from ois_products import OvernightIndexSwap
+from credit_products import CDS, cumulative_protection
+from swaption_cube import black_npv
+
+class Portfolio:
+    ''' A collection of products priced together. Instead of letting every product interpolate
+    the curves on its own dates, all of the flows are merged in a single table:
+    - the payment dates of all of the products are merged in a sorted grid without duplicates,
+      the same is done for the libor fixing dates and for the dates at which the survival
+      probability is needed
+    - each curve is evaluated only once per date of its grid
+    - the results are scattered back to the flows and summed product by product
+
+    Each product owns one "slot" where the value of its flows is accumulated; a swaption owns
+    two of them: the (absolute) value of the floating leg and the annuity of its forward swap.
+    '''
+    def __init__(self):
+        self.products = []
+        self.vols = []
+        self.trade_slot = []
+        self.nslots = 0
+
+        # flows discounted with the discount curve only (fixed legs, OIS)
+        self.df_slot, self.df_payment, self.df_coeff, self.df_alive_only = [], [], [], []
+        # flows that also need a forward libor (floating legs)
+        self.libor_slot, self.libor_fixing, self.libor_payment, self.libor_coeff, self.libor_alive_only = [], [], [], [], []
+        # flows that also need a survival probability (CDS premium legs)
+        self.credit_slot, self.credit_payment, self.credit_coeff = [], [], []
+
+        # the merged tables are built lazily, at the first npv after a product has been added
+        self.compiled = False
+
+    # we add a product to the portfolio; a swaption needs also its volatility
+    def addProduct(self, product, vol=None):
+        slot = self.nslots
+        if isinstance(product, Swaption):
+            if vol is None:
+                raise ValueError("A swaption needs a volatility")
+            swap = product.swap
+            # slot: absolute value of the floating leg, slot + 1: the annuity
+            self.addLiborFlows(slot, swap.floating_fixing, swap.floating_payment, abs(swap.floatingLegNominal) * swap.floating_tau, True)
+            self.addDfFlows(slot + 1, swap.fixed_payment, abs(swap.fixedLegNominal) * swap.fixed_tau, True)
+            self.nslots = self.nslots + 2
+        elif isinstance(product, Swap):
+            self.addLiborFlows(slot, product.floating_fixing, product.floating_payment, product.floatingLegNominal * product.floating_tau, True)
+            self.addDfFlows(slot, product.fixed_payment, product.fixedLegNominal * product.fixRate * product.fixed_tau, True)
+            self.nslots = self.nslots + 1
+        elif isinstance(product, OvernightIndexSwap):
+            floating_coeff = numpy.array([product.floatingLegNominal, - product.floatingLegNominal], dtype=numpy.float64)
+            self.addDfFlows(slot, product.floating_dates, floating_coeff, False)
+            self.addDfFlows(slot, product.fixed_payment, product.fixedLegNominal * product.fixedRate * product.fixed_tau, False)
+            self.nslots = self.nslots + 1
+        elif isinstance(product, CDS):
+            self.credit_slot.append(numpy.repeat(slot, len(product.premium_payment)))
+            self.credit_payment.append(product.premium_payment)
+            self.credit_coeff.append(product.spread * product.tau)
+            self.nslots = self.nslots + 1
+        else:
+            raise ValueError("Product not supported")
+
+        self.products.append(product)
+        self.vols.append(vol)
+        self.trade_slot.append(slot)
+        self.compiled = False
+
+    def addDfFlows(self, slot, payment, coeff, alive_only):
+        self.df_slot.append(numpy.repeat(slot, len(payment)))
+        self.df_payment.append(payment)
+        self.df_coeff.append(coeff)
+        self.df_alive_only.append(numpy.repeat(alive_only, len(payment)))
+
+    def addLiborFlows(self, slot, fixing, payment, coeff, alive_only):
+        self.libor_slot.append(numpy.repeat(slot, len(payment)))
+        self.libor_fixing.append(fixing)
+        self.libor_payment.append(payment)
+        self.libor_coeff.append(coeff)
+        self.libor_alive_only.append(numpy.repeat(alive_only, len(payment)))
+
+    # this method merges the flows of all of the products and builds the date grids
+    def compile(self):
+        def merge(arrays, dtype):
+            if len(arrays) == 0:
+                return numpy.zeros(0, dtype=dtype)
+            return numpy.concatenate(arrays).astype(dtype)
+
+        self.flows = {}
+        for name in ['df_slot', 'libor_slot', 'credit_slot']:
+            self.flows[name] = merge(getattr(self, name), numpy.int64)
+        for name in ['df_payment', 'libor_fixing', 'libor_payment', 'credit_payment']:
+            self.flows[name] = merge(getattr(self, name), numpy.int64)
+        for name in ['df_coeff', 'libor_coeff', 'credit_coeff']:
+            self.flows[name] = merge(getattr(self, name), numpy.float64)
+        for name in ['df_alive_only', 'libor_alive_only']:
+            self.flows[name] = merge(getattr(self, name), bool)
+
+        # all of the payment dates are discounted: we build a single grid for the three kinds of flows
+        # and remember, for each flow, the position of its date in the grid
+        payments = [self.flows['df_payment'], self.flows['libor_payment'], self.flows['credit_payment']]
+        self.df_grid, inverse = numpy.unique(numpy.concatenate(payments), return_inverse=True)
+        n_df, n_libor = len(payments[0]), len(payments[1])
+        self.df_index = inverse[:n_df]
+        self.libor_df_index = inverse[n_df:n_df + n_libor]
+        self.credit_df_index = inverse[n_df + n_libor:]
+
+        self.fixing_grid, self.fixing_index = numpy.unique(self.flows['libor_fixing'], return_inverse=True)
+        self.credit_grid, self.credit_index = numpy.unique(self.flows['credit_payment'], return_inverse=True)
+
+        self.slots = numpy.array(self.trade_slot, dtype=numpy.int64)
+        self.swaptions = [i for i, product in enumerate(self.products) if isinstance(product, Swaption)]
+        # the data of the swaptions needed by the Black formula, all priced at once
+        self.swaption_expiries = numpy.array([self.products[i].swaptionExpiry.toordinal() for i in self.swaptions], dtype=numpy.int64)
+        self.swaption_strikes = numpy.array([self.products[i].swap.fixRate for i in self.swaptions], dtype=numpy.float64)
+        self.swaption_parities = numpy.array([self.products[i].parity for i in self.swaptions], dtype=numpy.float64)
+        self.swaption_vols = numpy.array([self.vols[i] for i in self.swaptions], dtype=numpy.float64)
+        self.cds = [i for i, product in enumerate(self.products) if isinstance(product, CDS)]
+        # the extremes of the default legs (start dates, then end dates) and the loss given default
+        self.cds_extremes = numpy.array([self.products[i].startDate.toordinal() for i in self.cds] +
+                                        [self.products[i].endDate.toordinal() for i in self.cds], dtype=numpy.float64)
+        self.cds_lgds = numpy.array([1 - self.products[i].recovery for i in self.cds], dtype=numpy.float64)
+        self.compiled = True
+
+    # the npv of each product of the portfolio, returned as a numpy array in the same order
+    # the products have been added
+    def npv(self, discountCurve, liborCurve=None, creditCurve=None):
+        if not self.compiled:
+            self.compile()
+        flows = self.flows
+        today = discountCurve.today.toordinal()
+        values = numpy.zeros(self.nslots)
+
+        # each curve is evaluated once for each date of its grid
+        dfs = discountCurve.df_vector(self.df_grid)
+
+        # swaps and swaptions only consider "future" flows, OIS and CDS all of them
+        weights = flows['df_coeff'] * dfs[self.df_index]
+        weights[flows['df_alive_only'] & (flows['df_payment'] <= today)] = 0.0
+        values = values + numpy.bincount(flows['df_slot'], weights, minlength=self.nslots)
+
+        if len(self.fixing_grid) > 0:
+            if liborCurve is None:
+                raise ValueError("A libor curve is needed to price the floating legs")
+            fwd_libors = liborCurve.value_vector(self.fixing_grid)
+            weights = flows['libor_coeff'] * dfs[self.libor_df_index] * fwd_libors[self.fixing_index]
+            weights[flows['libor_alive_only'] & (flows['libor_payment'] <= today)] = 0.0
+            values = values + numpy.bincount(flows['libor_slot'], weights, minlength=self.nslots)
+
+        if len(self.credit_grid) > 0:
+            if creditCurve is None:
+                raise ValueError("A credit curve is needed to price the CDS")
+            ndps = creditCurve.ndp_vector(self.credit_grid)
+            weights = flows['credit_coeff'] * dfs[self.credit_df_index] * ndps[self.credit_index]
+            values = values + numpy.bincount(flows['credit_slot'], weights, minlength=self.nslots)
+
+        # we scatter the slots back to the products: for the linear products this is already the npv
+        npvs = values[self.slots]
+
+        # the non linear part: swaptions apply the Black formula to their two slots (all of them in
+        # one call, see swaption_cube.black_npv), CDS subtract their default leg
+        if len(self.swaptions) > 0:
+            slots = self.slots[self.swaptions]
+            times = (self.swaption_expiries - today) / 365.0
+            npvs[self.swaptions] = black_npv(values[slots] / values[slots + 1], values[slots + 1], self.swaption_strikes,
+                                             times, self.swaption_vols, self.swaption_parities)
+        if len(self.cds) > 0:
+            # the protection legs of all of the CDS are differences of cumulative_protection, which
+            # evaluates the two curves once on their merged grid
+            protection = cumulative_protection(discountCurve, creditCurve, self.cds_extremes)
+            n = len(self.cds)
+            npvs[self.cds] = npvs[self.cds] - self.cds_lgds * (protection[n:] - protection[:n])
+
+        return npvs
+
+
+# example
+from datetime import date
+from ir_curves import DiscountCurve, ForwardLiborCurve
+from credit_curves import CreditCurve
+from ir_products import buildSwap
+from ois_products import buildOIS
+
+if __name__ == '__main__':
+    obsdate = date(2010,1,1)
+    dc = DiscountCurve(obsdate, [date(2011,1,1), date(2012,1,1), date(2015,1,1)], [0.95, 0.9, 0.8])
+    libor = ForwardLiborCurve(obsdate, [date(2010,1,1), date(2012,1,1), date(2015,1,1)], [0.04, 0.045, 0.05])
+    cc = CreditCurve(obsdate, [date(2011,1,1), date(2015,1,1)], [0.97, 0.85])
+
+    products = [buildSwap(obsdate, 24, 6, 12, 0.05),
+                buildSwap(obsdate, 36, 6, 12, 0.045, swapType="payer"),
+                Swaption(buildSwap(obsdate, 48, 6, 12, 0.05), date(2011,1,1)),
+                buildOIS(obsdate, 12, 12, 0.04),
+                CDS(obsdate, 24, 0.02, 0.4)]
+
+    portfolio = Portfolio()
+    for product in products:
+        if isinstance(product, Swaption):
+            portfolio.addProduct(product, 0.2)
+        else:
+            portfolio.addProduct(product)
+
+    print "Portfolio NPVs:", portfolio.npv(dc, libor, cc)
+    print "Single NPVs:", [products[0].npv(dc, libor), products[1].npv(dc, libor), products[2].npv(dc, libor, 0.2),
+                           products[3].npv(dc), products[4].npv(dc, cc)]
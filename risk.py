@@ -0,0 +1,203 @@
+# numpy is a numerical package
+import numpy
+
+# ndtr is the cumulative distribution function of the standard normal
+from scipy.special import ndtr
+
+from date_conventions import dc_act365
+from ir_curves import interpolation_weights, log_linear
+from ir_products import Swaption
+from credit_products import CDS, protection_leg_gradient
+
+class RiskEngine:
+    ''' This class computes the bucketed sensitivities of all of the products of a Portfolio
+    to the market quotes the curves have been built from, without repricing anything:
+    - the OIS quotes of the discount curve, fitted with a DiscountCurveGlobalFit
+    - the swap quotes of the forward libor curve, bootstrapped with a ForwardLiborCurveBootstrap (optional)
+    - the pillars of the credit curve (optional): the sensitivities are to the logarithms of the
+      survival probabilities
+    - the CDS spreads of the credit curve, if it has been built with a CreditCurveBootstrap (optional)
+
+    The npvs of the products are (apart from the swaptions and the CDS default legs) linear
+    combinations of discount factors, forward libors and survival probabilities, which in turn
+    depend on the curve parameters through interpolation weights: the derivatives with respect to the
+    parameters are computed analytically in one pass over the flows of the portfolio. They are then
+    chained to the quotes with the Jacobians of the curve building, i.e. the implicit function theorem
+    applied to "the npvs of the quoted products are zero".
+    '''
+    def __init__(self, portfolio, discountFit, liborBootstrap=None, creditCurve=None, creditBootstrap=None):
+        self.portfolio = portfolio
+        self.discountFit = discountFit
+        self.liborBootstrap = liborBootstrap
+        self.creditBootstrap = creditBootstrap
+        if creditCurve is None and creditBootstrap is not None:
+            creditCurve = creditBootstrap.curve
+        self.creditCurve = creditCurve
+
+    # This method returns the derivatives of the npv of each product (rows) with respect to the
+    # parameters of the curves (columns), as a tuple of three matrices:
+    # - the log discount factors of the pillars of the discount curve (today excluded)
+    # - the forward libors of the pillars of the libor curve
+    # - the log survival probabilities of the pillars of the credit curve (today excluded)
+    # The derivatives are chained through interpolation_weights: the curves must use the default
+    # interpolation scheme
+    def parameter_sensitivities(self):
+        discountCurve = self.discountFit.curve
+        curves = [discountCurve, self.creditCurve] + ([self.liborBootstrap.curve] if self.liborBootstrap is not None else [])
+        if not all(log_linear(curve) for curve in curves if curve is not None):
+            raise ValueError("The sensitivities need curves with the default interpolation")
+        portfolio = self.portfolio
+        if not portfolio.compiled:
+            portfolio.compile()
+        flows = portfolio.flows
+        today = discountCurve.today.toordinal()
+        nslots = portfolio.nslots
+
+        # the values of the flows and their derivatives are accumulated in the slots of the portfolio
+        values = numpy.zeros(nslots)
+        slot_x = numpy.zeros((nslots, len(discountCurve.pillars_number) - 1))
+        slot_f = numpy.zeros((nslots, 0))
+        slot_y = numpy.zeros((nslots, 0))
+
+        dfs = discountCurve.df_vector(portfolio.df_grid)
+        df_weights = interpolation_weights(portfolio.df_grid, discountCurve.pillars_number)[:, 1:]
+
+        flow_values = flows['df_coeff'] * dfs[portfolio.df_index]
+        flow_values[flows['df_alive_only'] & (flows['df_payment'] <= today)] = 0.0
+        values = values + numpy.bincount(flows['df_slot'], flow_values, minlength=nslots)
+        numpy.add.at(slot_x, flows['df_slot'], flow_values[:, numpy.newaxis] * df_weights[portfolio.df_index])
+
+        if len(portfolio.fixing_grid) > 0:
+            liborCurve = self.liborBootstrap.curve
+            fwd_libors = liborCurve.value_vector(portfolio.fixing_grid)
+            libor_weights = interpolation_weights(portfolio.fixing_grid, liborCurve.fixingDates_number)
+            slot_f = numpy.zeros((nslots, len(liborCurve.fixingDates_number)))
+
+            annuities = flows['libor_coeff'] * dfs[portfolio.libor_df_index]
+            annuities[flows['libor_alive_only'] & (flows['libor_payment'] <= today)] = 0.0
+            flow_values = annuities * fwd_libors[portfolio.fixing_index]
+            values = values + numpy.bincount(flows['libor_slot'], flow_values, minlength=nslots)
+            numpy.add.at(slot_x, flows['libor_slot'], flow_values[:, numpy.newaxis] * df_weights[portfolio.libor_df_index])
+            numpy.add.at(slot_f, flows['libor_slot'], annuities[:, numpy.newaxis] * libor_weights[portfolio.fixing_index])
+
+        if self.creditCurve is not None:
+            slot_y = numpy.zeros((nslots, len(self.creditCurve.pillars_number) - 1))
+        if len(portfolio.credit_grid) > 0:
+            ndps = self.creditCurve.ndp_vector(portfolio.credit_grid)
+            credit_weights = interpolation_weights(portfolio.credit_grid, self.creditCurve.pillars_number)[:, 1:]
+            flow_values = flows['credit_coeff'] * dfs[portfolio.credit_df_index] * ndps[portfolio.credit_index]
+            values = values + numpy.bincount(flows['credit_slot'], flow_values, minlength=nslots)
+            numpy.add.at(slot_x, flows['credit_slot'], flow_values[:, numpy.newaxis] * df_weights[portfolio.credit_df_index])
+            numpy.add.at(slot_y, flows['credit_slot'], flow_values[:, numpy.newaxis] * credit_weights[portfolio.credit_index])
+
+        # for the linear products the derivatives of the slot are the derivatives of the npv
+        npv_x = slot_x[portfolio.slots]
+        npv_f = slot_f[portfolio.slots]
+        npv_y = slot_y[portfolio.slots]
+
+        # a swaption is a function of the floating leg and of the annuity of its forward swap; the Black
+        # formula is homogeneous of degree one in these two values, so its derivatives are
+        # parity * N(parity * d1) and - parity * strike * N(parity * d2)
+        for i in portfolio.swaptions:
+            swaption = portfolio.products[i]
+            slot = portfolio.slots[i]
+            vol = portfolio.vols[i]
+            swapRate = values[slot] / values[slot + 1]
+            time = dc_act365(discountCurve.today, swaption.swaptionExpiry)
+            strike = swaption.swap.fixRate
+            d1 = swaption.d1(swapRate, strike, time, vol)
+            d2 = swaption.d2(swapRate, strike, time, vol)
+            d_floating = swaption.parity * ndtr(swaption.parity * d1)
+            d_annuity = - swaption.parity * strike * ndtr(swaption.parity * d2)
+            npv_x[i] = d_floating * slot_x[slot] + d_annuity * slot_x[slot + 1]
+            npv_f[i] = d_floating * slot_f[slot] + d_annuity * slot_f[slot + 1]
+
+        # the CDS subtract their default leg
+        for i in portfolio.cds:
+            cds = portfolio.products[i]
+            d_discount, d_credit = protection_leg_gradient(discountCurve, self.creditCurve,
+                                                           cds.startDate.toordinal(), cds.endDate.toordinal())
+            npv_x[i] = npv_x[i] - (1 - cds.recovery) * d_discount
+            npv_y[i] = npv_y[i] - (1 - cds.recovery) * d_credit
+
+        return npv_x, npv_f, npv_y
+
+    # This method returns the derivatives of the npv of each product (rows) with respect to the
+    # quotes (columns) as a dictionary:
+    # - 'ois': the quotes of the OIS of the discount fit (in the order they have been added)
+    # - 'swap': the quotes of the swaps of the libor bootstrap (if any)
+    # - 'credit': the log survival probabilities of the credit curve pillars (if any)
+    # - 'cds': the spreads of the CDS of the credit bootstrap (if any); the credit curve moves also
+    #   with the discount curve, which is included in 'ois'
+    def sensitivities(self):
+        npv_x, npv_f, npv_y = self.parameter_sensitivities()
+        x_ois = self.discountFit.quote_sensitivity()
+        result = {}
+        if self.liborBootstrap is not None and npv_f.shape[1] > 0:
+            forwards_x, forwards_quotes = self.liborBootstrap.sensitivity()
+            # the spot libor is not an unknown of the bootstrap: it does not move with the quotes
+            if self.liborBootstrap.spotLibor is not None:
+                npv_f = npv_f[:, 1:]
+            npv_x = npv_x + npv_f.dot(forwards_x)
+            result['swap'] = npv_f.dot(forwards_quotes)
+        if self.creditBootstrap is not None:
+            ln_ndps_x, ln_ndps_quotes = self.creditBootstrap.sensitivity()
+            npv_x = npv_x + npv_y.dot(ln_ndps_x)
+            result['cds'] = npv_y.dot(ln_ndps_quotes)
+        result['ois'] = npv_x.dot(x_ois)
+        if self.creditCurve is not None:
+            result['credit'] = npv_y
+        return result
+
+    # The sensitivities of the npvs to a 1bp increase of each quote, i.e. the bucketed DV01
+    # (and for the credit curve the change for a 1bp decrease of each log survival probability, which
+    # is about the change for a 1bp increase of the cumulated hazard rate up to that pillar)
+    def dv01(self):
+        result = self.sensitivities()
+        for key in result:
+            result[key] = result[key] * 0.0001
+        if 'credit' in result:
+            result['credit'] = - result['credit']
+        return result
+
+
+# example
+from datetime import date
+from ois_bootstrap import DiscountCurveGlobalFit
+from ois_products import buildOIS
+from ir_products import buildSwap
+from libor_bootstrap import ForwardLiborCurveBootstrap
+from credit_bootstrap import CreditCurveBootstrap
+from credit_products import buildCDS
+from portfolio import Portfolio
+
+if __name__ == '__main__':
+    today = date(2010,1,1)
+
+    discount_fit = DiscountCurveGlobalFit(today)
+    for maturity, quote in [(6, 0.012), (12, 0.014), (24, 0.017), (36, 0.02), (60, 0.025)]:
+        discount_fit.addProduct(buildOIS(today, maturity, 12, quote))
+    dc_curve = discount_fit.fit()
+
+    libor_bootstrapper = ForwardLiborCurveBootstrap(today, dc_curve, spotLibor=0.015)
+    for maturity, quote in [(12, 0.016), (24, 0.019), (36, 0.022), (60, 0.027)]:
+        libor_bootstrapper.addProduct(buildSwap(today, maturity, 6, 12, quote))
+    libor_curve = libor_bootstrapper.bootstrap()
+
+    cds_bootstrapper = CreditCurveBootstrap(today, dc_curve)
+    for endDate, quote in [(date(2011,3,20), 0.01), (date(2014,12,20), 0.015)]:
+        cds_bootstrapper.addProduct(buildCDS(today, endDate, quote, 0.4))
+    cc = cds_bootstrapper.bootstrap()
+
+    portfolio = Portfolio()
+    portfolio.addProduct(buildSwap(today, 30, 6, 12, 0.02, nominal=1000000))
+    portfolio.addProduct(Swaption(buildSwap(today, 48, 6, 12, 0.025, nominal=1000000, swapType="payer"), date(2011,1,1)), 0.2)
+    portfolio.addProduct(buildOIS(today, 18, 12, 0.015, nominal=1000000))
+    portfolio.addProduct(CDS(today, 36, 0.01, 0.4))
+
+    risk = RiskEngine(portfolio, discount_fit, libor_bootstrapper, creditBootstrap=cds_bootstrapper)
+    dv01 = risk.dv01()
+    for key in ['ois', 'swap', 'credit', 'cds']:
+        print key, "DV01 by trade:"
+        print dv01[key]
+        print key, "DV01 of the portfolio:", dv01[key].sum(axis=0)
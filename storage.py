@@ -0,0 +1,140 @@
+# numpy is a numerical package
+import numpy
+import os
+from datetime import date
+
+from ir_curves import DiscountCurve, ForwardLiborCurve, DiscountCurveCube, ForwardLiborCurveCube
+from credit_curves import CreditCurve, CreditCurveCube
+from trade_store import SwapStore, OISStore, CDSStore
+
+# The objects are saved in a directory, one numpy .npy file per array plus kind.npy, which tells what
+# the directory contains. The .npy files are opened with numpy.load(mmap_mode='r'): the operating system
+# maps them in memory and reads the pages only when they are used, so opening even a very large book is
+# almost instantaneous and the processes that open the same book share the same physical memory.
+# The trade stores keep the memory mapped arrays as they are (no copy); the curves, which are small,
+# are rebuilt from them with their usual constructors.
+
+# the classes that can be saved, by the name stored in kind.npy
+curve_classes = {'DiscountCurve': DiscountCurve, 'ForwardLiborCurve': ForwardLiborCurve, 'CreditCurve': CreditCurve,
+                 'DiscountCurveCube': DiscountCurveCube, 'ForwardLiborCurveCube': ForwardLiborCurveCube,
+                 'CreditCurveCube': CreditCurveCube}
+store_classes = {'SwapStore': SwapStore, 'OISStore': OISStore, 'CDSStore': CDSStore}
+
+# This function writes each array of the dictionary arrays in directory/<name>.npy, together with the kind
+def save_arrays(directory, kind, arrays):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    numpy.save(os.path.join(directory, 'kind.npy'), numpy.array(kind))
+    for name in arrays:
+        numpy.save(os.path.join(directory, name + '.npy'), numpy.ascontiguousarray(arrays[name]))
+
+# This function returns the kind of the object saved in directory
+def saved_kind(directory):
+    return str(numpy.load(os.path.join(directory, 'kind.npy'))[()])
+
+# This function opens the arrays saved by save_arrays; with mmap_mode=None they are read in memory
+def load_arrays(directory, names, mmap_mode='r'):
+    arrays = {}
+    for name in names:
+        arrays[name] = numpy.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+    return arrays
+
+# This function returns the name of the class of a curve (or of a curve cube), its observation date, its
+# pillars (as ordinals) and its known values (discount factors, forward libors or survival probabilities)
+def curve_data(curve):
+    kind = curve.__class__.__name__
+    if kind not in curve_classes:
+        raise ValueError("Curve not supported")
+    if isinstance(curve, (ForwardLiborCurve, ForwardLiborCurveCube)):
+        return kind, curve.obsdate, curve.fixingDates_number, curve.forwardLibors
+    elif isinstance(curve, (CreditCurve, CreditCurveCube)):
+        return kind, curve.today, curve.pillars_number, curve.ndps
+    else:
+        return kind, curve.today, curve.pillars_number, curve.dfs
+
+# This function saves a curve (or a curve cube): the data of curve_data and, for the curves, the
+# interpolation scheme
+def save_curve(directory, curve):
+    kind, today, pillars, values = curve_data(curve)
+    arrays = {'today': numpy.array(today.toordinal()),
+              'pillars': numpy.asarray(pillars, dtype=numpy.int64),
+              'values': numpy.asarray(values, dtype=numpy.float64)}
+    if hasattr(curve, 'interpolation'):
+        arrays['interpolation'] = numpy.array([curve.interpolation])
+    save_arrays(directory, kind, arrays)
+
+# This function rebuilds the curve saved in directory by save_curve
+def load_curve(directory):
+    kind = saved_kind(directory)
+    if kind not in curve_classes:
+        raise ValueError("The directory does not contain a curve")
+    arrays = load_arrays(directory, ['today', 'pillars', 'values'], None)
+    today = date.fromordinal(int(arrays['today']))
+    pillars = [date.fromordinal(int(pillar)) for pillar in arrays['pillars']]
+    values = arrays['values']
+    # the constructors of the curves (not of the cubes) want lists
+    if values.ndim == 1:
+        values = list(values)
+    # the curves saved before the interpolation schemes were introduced have no interpolation.npy
+    if os.path.isfile(os.path.join(directory, 'interpolation.npy')):
+        interpolation = str(numpy.load(os.path.join(directory, 'interpolation.npy'))[0])
+        return curve_classes[kind](today, pillars, values, interpolation)
+    return curve_classes[kind](today, pillars, values)
+
+# This function saves a trade store (see trade_store): all of its arrays, schedules included
+def save_store(directory, store):
+    kind = store.__class__.__name__
+    if kind not in store_classes:
+        raise ValueError("Store not supported")
+    arrays = dict((name, value) for name, value in vars(store).items() if isinstance(value, numpy.ndarray))
+    save_arrays(directory, kind, arrays)
+
+# This function opens the store saved in directory by save_store. With the default mmap_mode ('r') the
+# arrays of the store are the read only memory maps of the files: nothing is read until it is used.
+# mmap_mode=None reads everything in memory instead
+def load_store(directory, mmap_mode='r'):
+    kind = saved_kind(directory)
+    if kind not in store_classes:
+        raise ValueError("The directory does not contain a trade store")
+    names = [name[:-4] for name in os.listdir(directory) if name.endswith('.npy') and name != 'kind.npy']
+    # the arrays have the same names of the arguments of the constructor of the store
+    return store_classes[kind](**load_arrays(directory, names, mmap_mode))
+
+
+# example
+import tempfile
+import shutil
+import time
+from trade_store import buildSwapStore
+from montecarlo import run_parallel
+
+# each worker opens the book and the curves by itself, as a separate pricing process would do
+def price_book_worker(directory):
+    dc = load_curve(os.path.join(directory, 'discount'))
+    libor = load_curve(os.path.join(directory, 'libor'))
+    store = load_store(os.path.join(directory, 'swaps'))
+    return store.npv(dc, libor).sum()
+
+if __name__ == '__main__':
+    today = date(2010,1,1)
+    dc = DiscountCurve(today, [date(2011,1,1), date(2015,1,1), date(2030,1,1)], [0.98, 0.9, 0.6])
+    libor = ForwardLiborCurve(today, [date(2010,1,1), date(2015,1,1), date(2030,1,1)], [0.01, 0.03, 0.04])
+
+    n = 200000
+    randomState = numpy.random.RandomState(1)
+    store = buildSwapStore(today.toordinal() - randomState.randint(0, 3650, n), 12 * randomState.randint(1, 21, n),
+                           6, 12, 0.03, 1000000)
+
+    directory = tempfile.mkdtemp()
+    try:
+        save_curve(os.path.join(directory, 'discount'), dc)
+        save_curve(os.path.join(directory, 'libor'), libor)
+        save_store(os.path.join(directory, 'swaps'), store)
+
+        start = time.time()
+        mapped = load_store(os.path.join(directory, 'swaps'))
+        print "Book of", len(mapped), "swaps opened in", time.time() - start, "seconds"
+        print "Same npvs:", numpy.array_equal(mapped.npv(dc, libor), store.npv(dc, libor))
+        print "Book npv from 4 processes:", run_parallel(price_book_worker, [directory] * 4, 4)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,229 @@
+# numpy is a numerical package
+import numpy
+from math import pi, sqrt
+# ndtr is the cumulative distribution function of the standard normal: unlike norm.cdf it is a
+# plain numpy ufunc, with no overhead when it is called on whole arrays
+from scipy.special import ndtr
+
+from date_conventions import dc_act365_vector
+from trade_store import add_months, buildSwapStore
+
+# This function is the Black (Merton) formula of Swaption.npv_from_legs applied to whole arrays at
+# once: forwards (the forward swap rates), annuities, strikes, times (the year fractions to the
+# expiries), vols and parities (1 for the payer, -1 for the receiver) are arrays of the same shape, or
+# anything numpy can broadcast to it. d1 and d2 are computed once and shared by the price and the greeks.
+# When the total volatility vol * sqrt(time) is zero, or the strike is not positive (the swaption is
+# surely exercised if payer, never if receiver), the price is the intrinsic value discounted with the
+# annuity.
+# With greeks=False it returns the prices, otherwise a tuple with:
+# - the prices
+# - the deltas: the derivatives of the prices with respect to the forward swap rates
+# - the vegas: the derivatives of the prices with respect to the vols
+def black_npv(forwards, annuities, strikes, times, vols, parities=1, greeks=False):
+    forwards = numpy.asarray(forwards, dtype=numpy.float64)
+    annuities = numpy.asarray(annuities, dtype=numpy.float64)
+    strikes = numpy.asarray(strikes, dtype=numpy.float64)
+    parities = numpy.asarray(parities, dtype=numpy.float64)
+    sqrt_times = numpy.sqrt(numpy.asarray(times, dtype=numpy.float64))
+    stdevs = numpy.asarray(vols, dtype=numpy.float64) * sqrt_times
+
+    # the zero total volatilities and the strikes not positive would give a division by zero or the log
+    # of a negative number: they are replaced by one and their results by the intrinsic values below
+    expired = (stdevs <= 0) | (strikes <= 0)
+    safe_stdevs = numpy.where(expired, 1.0, stdevs)
+    safe_strikes = numpy.where(expired, forwards, strikes)
+    d1 = numpy.log(forwards / safe_strikes) / safe_stdevs + 0.5 * safe_stdevs
+    d2 = d1 - safe_stdevs
+
+    n1 = ndtr(parities * d1)
+    prices = annuities * parities * (forwards * n1 - strikes * ndtr(parities * d2))
+    intrinsic = annuities * numpy.maximum(parities * (forwards - strikes), 0.0)
+    prices = numpy.where(expired, intrinsic, prices)
+    if not greeks:
+        return prices
+
+    deltas = numpy.where(expired, annuities * parities * (parities * (forwards - strikes) > 0), annuities * parities * n1)
+    # the density of the standard normal in d1
+    density = numpy.exp(-0.5 * d1**2) / sqrt(2 * pi)
+    vegas = numpy.where(expired, 0.0, annuities * forwards * density * sqrt_times)
+    return prices, deltas, vegas
+
+# This function is the inverse of black_npv: given the prices of many swaptions (and their forwards,
+# annuities, strikes, times and parities, arrays or anything that broadcasts to the shape of prices)
+# it returns the vols that give those prices, all of them found at once. To be accurate the solver
+# works on the out of the money swaption (an in the money payer is turned into a receiver with the same
+# strike, and vice versa, by the payer - receiver parity), whose undiscounted price is a function of
+# the total volatility s = vol * sqrt(time) only:
+# - the first guess is the closed formula of Corrado and Miller
+# - then a few Halley steps are done for all of the swaptions at once; the swaptions whose price is
+#   already within tolerance (relative to the price), or whose last step was within tolerance (relative
+#   to s), stop moving
+# - each step also narrows the interval where the solution is (the price grows with s): when a step
+#   goes out of it, the middle of the interval (or twice s, if there is no upper end yet) is taken
+# The prices out of the no arbitrage bounds (below the intrinsic value or above the forward, for the
+# payers, or the strike, for the receivers) have no implied vol: the result is nan, the same as for
+# expired swaptions and for the ones with a forward or a strike not positive.
+def black_implied_vol(prices, forwards, annuities, strikes, times, parities=1, tolerance=1e-12, iterations=20):
+    arrays = numpy.broadcast_arrays(*[numpy.asarray(array, dtype=numpy.float64)
+                                      for array in (prices, forwards, annuities, strikes, times, parities)])
+    prices, forwards, annuities, strikes, times, parities = arrays
+    vols = numpy.repeat(numpy.nan, prices.size).reshape(prices.shape)
+
+    # the undiscounted prices of the out of the money swaptions
+    values = prices / annuities
+    itm = parities * (forwards - strikes) > 0
+    otm_parities = numpy.where(itm, - parities, parities)
+    targets = values - numpy.where(itm, parities * (forwards - strikes), 0.0)
+    upper = numpy.where(otm_parities > 0, forwards, strikes)
+    valid = (targets >= 0) & (targets < upper) & (times > 0) & (forwards > 0) & (strikes > 0)
+
+    # the solver only works on the valid swaptions
+    F, K, p = forwards[valid], strikes[valid], otm_parities[valid]
+    target = targets[valid]
+    x = numpy.log(F / K)
+
+    # the first guess, from the undiscounted price of the payer
+    call = target + numpy.where(p > 0, 0.0, F - K)
+    half = call - 0.5 * (F - K)
+    s = sqrt(2 * pi) / (F + K) * (half + numpy.sqrt(numpy.maximum(half**2 - (F - K)**2 / pi, 0.0)))
+    s = numpy.maximum(s, 1e-8)
+
+    low = numpy.zeros(len(s))
+    high = numpy.repeat(numpy.inf, len(s))
+    step = numpy.repeat(numpy.inf, len(s))
+    with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for iteration in range(iterations):
+            d1 = x / s + 0.5 * s
+            d2 = d1 - s
+            error = p * (F * ndtr(p * d1) - K * ndtr(p * d2)) - target
+            moving = (numpy.abs(error) > tolerance * target) & (numpy.abs(step) > tolerance * s)
+            if not numpy.any(moving):
+                break
+            low = numpy.where(error < 0, s, low)
+            high = numpy.where(error > 0, s, high)
+
+            # the derivatives of the price with respect to s are F * n(d1) and F * n(d1) * d1 * d2 / s
+            newton = error / (F * numpy.exp(-0.5 * d1**2) / sqrt(2 * pi))
+            halley = s - newton / (1 - 0.5 * newton * d1 * d2 / s)
+            fallback = numpy.where(numpy.isinf(high), 2 * s, 0.5 * (low + high))
+            inside = (halley > low) & (halley < high)
+            step = numpy.where(moving, numpy.where(inside, halley, fallback) - s, 0.0)
+            s = s + step
+
+    # a price equal to the intrinsic value has zero vol
+    s = numpy.where(target == 0, 0.0, s)
+    vols[valid] = s / numpy.sqrt(times[valid])
+    return vols
+
+# The parity of the swaptions of a given type ("payer" or "receiver")
+def swaption_parity(swaptionType):
+    if swaptionType == "payer":
+        return 1
+    elif swaptionType == "receiver":
+        return -1
+    raise ValueError("SwaptionType not supported")
+
+
+class SwaptionCube:
+    ''' The swaptions of a volatility cube: for each expiry (months from today) and each tenor (months
+    from the expiry) the underlying is the forward swap starting at the expiry, built with the same
+    conventions of buildSwap, so that each swaption is the same of
+    Swaption(buildSwap(expiryDate, tenor, floatingTenor, fixedTenor, strike, swapType=...), expiryDate).
+    The underlying swaps are kept in a SwapStore (see trade_store) with unit nominal and fix rate: they
+    are built only once, then each curve update just recomputes the forward swap rates and the annuities
+    (see update), and any number of strike and vol cubes is priced with black_npv on these arrays.
+    The forwards, annuities and times have one row per expiry and one column per tenor; the prices
+    one more axis for the strikes (expiry x tenor x strike).
+    '''
+    def __init__(self, discountCurve, liborCurve, expiries, tenors, floatingTenor=6, fixedTenor=12):
+        self.today = discountCurve.today
+        self.expiries = numpy.asarray(expiries, dtype=numpy.int64)
+        self.tenors = numpy.asarray(tenors, dtype=numpy.int64)
+        self.expiryDates = add_months(numpy.repeat(self.today.toordinal(), len(self.expiries)), self.expiries)
+        shape = (len(self.expiries), len(self.tenors))
+
+        # one receiver swap per (expiry, tenor), row by row: its fixed leg is the annuity and its
+        # floating leg is minus the value of the floating leg
+        self.swaps = buildSwapStore(numpy.repeat(self.expiryDates, len(self.tenors)), numpy.tile(self.tenors, len(self.expiries)),
+                                    floatingTenor, fixedTenor, 1.0)
+        self.times = numpy.broadcast_to(dc_act365_vector(numpy.repeat(self.today.toordinal(), shape[0]),
+                                                         self.expiryDates)[:, numpy.newaxis], shape)
+        self.update(discountCurve, liborCurve)
+
+    # This method recomputes the forward swap rates and the annuities with new curves (with the same today)
+    def update(self, discountCurve, liborCurve):
+        shape = (len(self.expiries), len(self.tenors))
+        self.annuities = self.swaps.npv_fixed_leg(discountCurve).reshape(shape)
+        self.forwards = - self.swaps.npv_floating_leg(discountCurve, liborCurve).reshape(shape) / self.annuities
+
+    # The strikes of the cube: strikes is the array of the strikes of the last axis, which are
+    # absolute or, with relative=True, added to the forward swap rate of each expiry and tenor
+    def strike_grid(self, strikes, relative=False):
+        strikes = numpy.asarray(strikes, dtype=numpy.float64)
+        if relative:
+            return self.forwards[:, :, numpy.newaxis] + strikes
+        return numpy.broadcast_to(strikes, self.forwards.shape + strikes.shape)
+
+    # The prices of the swaptions of the cube (expiry x tenor x strike, see black_npv for the greeks):
+    # - strikes: the strikes of the last axis (see strike_grid)
+    # - vols: a cube of vols with the same shape of the prices, or anything that broadcasts to it
+    #   (e.g. a single vol, or a matrix expiry x tenor with one more axis of length one)
+    def npv(self, strikes, vols, swaptionType="payer", relative=False, greeks=False):
+        strikes = self.strike_grid(strikes, relative)
+        return black_npv(self.forwards[:, :, numpy.newaxis], self.annuities[:, :, numpy.newaxis], strikes,
+                         self.times[:, :, numpy.newaxis], vols, swaption_parity(swaptionType), greeks)
+
+    # The implied vols of a cube of market prices (expiry x tenor x strike, see black_implied_vol):
+    # the forward swap rates and the annuities are the ones of the last curves (see update)
+    def implied_vols(self, prices, strikes, swaptionType="payer", relative=False, tolerance=1e-12, iterations=20):
+        strikes = self.strike_grid(strikes, relative)
+        return black_implied_vol(prices, self.forwards[:, :, numpy.newaxis], self.annuities[:, :, numpy.newaxis], strikes,
+                                 self.times[:, :, numpy.newaxis], swaption_parity(swaptionType), tolerance, iterations)
+
+
+# example
+import time
+from datetime import date
+from ir_curves import DiscountCurve, ForwardLiborCurve
+from ir_products import buildSwap, Swaption
+
+if __name__ == '__main__':
+    today = date(2010,1,1)
+    dc = DiscountCurve(today, [date(2011,1,1), date(2015,1,1), date(2030,1,1), date(2050,1,1)], [0.98, 0.9, 0.6, 0.4])
+    libor = ForwardLiborCurve(today, [date(2010,1,1), date(2015,1,1), date(2030,1,1), date(2050,1,1)], [0.01, 0.03, 0.04, 0.04])
+
+    expiries = [1, 3, 6, 12, 24, 36, 60, 84, 120]
+    tenors = [12, 24, 36, 60, 84, 120, 180, 240]
+    strikes = numpy.linspace(-0.02, 0.02, 9)
+    cube = SwaptionCube(dc, libor, expiries, tenors)
+    vols = 0.2 + 0.5 * strikes**2 * numpy.ones((len(expiries), len(tenors), 1))
+
+    start = time.time()
+    prices, deltas, vegas = cube.npv(strikes, vols, relative=True, greeks=True)
+    print "Cube of", prices.size, "payer swaptions priced in", time.time() - start, "seconds"
+
+    # the same swaption priced on its own
+    i, j, k = 3, 2, 6
+    expiryDate = date.fromordinal(int(cube.expiryDates[i]))
+    strike = cube.strike_grid(strikes, relative=True)[i, j, k]
+    swaption = Swaption(buildSwap(expiryDate, tenors[j], 6, 12, strike, swapType="payer"), expiryDate)
+    print "Cube price:", prices[i, j, k], "single price:", swaption.npv(dc, libor, vols[i, j, k])
+    print "ATM receiver prices of the 12 months expiry:", cube.npv(0.0, 0.2, "receiver", relative=True)[3, :, 0]
+
+    # the vols implied by the prices of the cube are the original ones, apart from the swaptions whose price
+    # hardly depends on the vol (the strikes not positive have no implied vol at all: their price is the
+    # intrinsic value whatever the vol)
+    start = time.time()
+    implied = cube.implied_vols(prices, strikes, relative=True)
+    print "Implied vols of the cube found in", time.time() - start, "seconds"
+    sensitive = vegas > 1e-10
+    print "Max error where the vega is not negligible:", numpy.max(numpy.abs(implied - vols)[sensitive]), "without vol:", numpy.isnan(implied).sum()
+
+    # a market cube with a wrong quote: the price of a payer cannot be greater than its annuity times the forward
+    market = prices.copy()
+    market[3, 0, 4] = 2 * cube.annuities[3, 0] * cube.forwards[3, 0]
+    print "Implied vols of the 12 months expiry and tenor with a wrong quote:", cube.implied_vols(market, strikes, relative=True)[3, 0]
+
+    # a new libor curve: only the forwards and the annuities are recomputed
+    cube.update(dc, ForwardLiborCurve(today, [date(2010,1,1), date(2015,1,1), date(2030,1,1), date(2050,1,1)], [0.011, 0.031, 0.041, 0.041]))
+    print "Vega of the same swaption:", vegas[i, j, k], "bumped forward swap rate:", cube.forwards[i, j]
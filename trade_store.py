@@ -0,0 +1,301 @@
+# numpy is a numerical package
+import numpy
+from datetime import date
+
+from date_conventions import to_ordinals, ordinals_to_months_days, months_days_to_ordinals, schedules_generator, \
+    dc_act360_vector, dc_30e360_vector
+from ir_products import Swap
+from ois_products import OvernightIndexSwap
+from credit_products import CDS, cumulative_protection
+
+# The stores of this module keep a whole book of trades of the same type as a few flat numpy arrays
+# (a "struct of arrays") instead of one python object per trade:
+# - the scalar data of the trades (nominals, rates, ...) are arrays with one element per trade
+# - the schedules of all of the trades are concatenated in a single array of ordinals (int32) and the
+#   schedule of the i-th trade is dates[offsets[i]:offsets[i+1]] (the same layout of schedules_generator)
+# - the accrual fractions of the periods are concatenated in the same way: the i-th schedule has one
+#   period less than dates, so its accruals are tau[offsets[i] - i:offsets[i+1] - i - 1]
+# A trade can be taken out of a store as a usual product (Swap, OvernightIndexSwap, CDS) whose arrays
+# are views on the ones of the store, i.e. nothing is copied; the npvs of all of the trades are
+# computed at once with the same leg formulas of the products, the sums being done with bincount.
+
+# This function returns, for each period of the schedules (offsets, dates), the index of its trade and
+# the position in dates of its start (the end is the next position)
+def periods(offsets):
+    counts = numpy.diff(offsets) - 1
+    owner = numpy.repeat(numpy.arange(len(counts)), counts)
+    starts = numpy.arange(len(owner)) + owner
+    return owner, starts
+
+# This function computes, for each trade, the sum of the values of the flows of its periods
+def sum_by_trade(owner, values, ntrades):
+    return numpy.bincount(owner, values, minlength=ntrades)
+
+# The end dates maturity months after the start dates (with the same day, or the last day of the
+# month if it does not exist, as relativedelta does)
+def add_months(startDates, maturities):
+    months, days = ordinals_to_months_days(to_ordinals(startDates))
+    return months_days_to_ordinals(months + numpy.asarray(maturities, dtype=numpy.int64), days)
+
+# The signs of the fixed and floating leg nominals for an array of swap types ("receiver" or "payer")
+def leg_signs(swapTypes, ntrades):
+    swapTypes = numpy.broadcast_to(numpy.asarray(swapTypes), (ntrades,))
+    receiver = swapTypes == "receiver"
+    if not numpy.all(receiver | (swapTypes == "payer")):
+        raise ValueError("SwapType not supported")
+    fixed_sign = numpy.where(receiver, 1.0, -1.0)
+    return fixed_sign, - fixed_sign
+
+# the number of bytes used by the arrays of a store
+def store_nbytes(store):
+    return sum(value.nbytes for value in vars(store).values() if isinstance(value, numpy.ndarray))
+
+
+class SwapStore:
+    ''' A book of swaps (see ir_products.Swap) stored as arrays:
+    - floatingLegNominal, fixedLegNominal, fixRate: one element per swap
+    - floating_offsets, floating_dates, floating_tau: the floating leg schedules (act/360 accruals)
+    - fixed_offsets, fixed_dates, fixed_tau: the fixed leg schedules (30E/360 accruals)
+    See buildSwapStore and swapStoreFromProducts
+    '''
+    def __init__(self, floatingLegNominal, fixedLegNominal, fixRate, floating_offsets, floating_dates, floating_tau,
+                 fixed_offsets, fixed_dates, fixed_tau):
+        self.floatingLegNominal = numpy.asarray(floatingLegNominal, dtype=numpy.float64)
+        self.fixedLegNominal = numpy.asarray(fixedLegNominal, dtype=numpy.float64)
+        self.fixRate = numpy.asarray(fixRate, dtype=numpy.float64)
+        if numpy.any(self.floatingLegNominal * self.fixedLegNominal > 0):
+            raise ValueError("Nominal must have opposite sign")
+        self.floating_offsets = numpy.asarray(floating_offsets, dtype=numpy.int64)
+        self.floating_dates = numpy.asarray(floating_dates, dtype=numpy.int32)
+        self.floating_tau = numpy.asarray(floating_tau, dtype=numpy.float64)
+        self.fixed_offsets = numpy.asarray(fixed_offsets, dtype=numpy.int64)
+        self.fixed_dates = numpy.asarray(fixed_dates, dtype=numpy.int32)
+        self.fixed_tau = numpy.asarray(fixed_tau, dtype=numpy.float64)
+
+    def __len__(self):
+        return len(self.fixRate)
+
+    def nbytes(self):
+        return store_nbytes(self)
+
+    # the i-th swap as a Swap whose schedules and accruals are views on the arrays of the store
+    def swap(self, i):
+        a, b = self.floating_offsets[i], self.floating_offsets[i + 1]
+        c, d = self.fixed_offsets[i], self.fixed_offsets[i + 1]
+        return Swap(self.floating_dates[a:b], self.floatingLegNominal[i], self.fixed_dates[c:d], self.fixRate[i],
+                    self.fixedLegNominal[i], self.floating_tau[a - i:b - i - 1], self.fixed_tau[c - i:d - i - 1])
+
+    # The npvs of the floating legs of all of the swaps (see Swap.npv_floating_leg)
+    def npv_floating_leg(self, discountCurve, liborCurve):
+        owner, starts = periods(self.floating_offsets)
+        payment = self.floating_dates[starts + 1]
+        alive = payment > discountCurve.today.toordinal()
+        values = discountCurve.df_vector(payment) * liborCurve.value_vector(self.floating_dates[starts]) * self.floating_tau
+        return sum_by_trade(owner, numpy.where(alive, values, 0.0), len(self)) * self.floatingLegNominal
+
+    # The npvs of the fixed legs of all of the swaps (see Swap.npv_fixed_leg)
+    def npv_fixed_leg(self, discountCurve):
+        owner, starts = periods(self.fixed_offsets)
+        payment = self.fixed_dates[starts + 1]
+        alive = payment > discountCurve.today.toordinal()
+        values = discountCurve.df_vector(payment) * self.fixed_tau
+        return sum_by_trade(owner, numpy.where(alive, values, 0.0), len(self)) * self.fixRate * self.fixedLegNominal
+
+    def npv(self, discountCurve, liborCurve):
+        return self.npv_fixed_leg(discountCurve) + self.npv_floating_leg(discountCurve, liborCurve)
+
+
+class OISStore:
+    ''' A book of OIS (see ois_products.OvernightIndexSwap) stored as arrays:
+    - startDate, endDate (as ordinals), floatingLegNominal, fixedLegNominal, fixedRate: one element per OIS
+    - fixed_offsets, fixed_dates, fixed_tau: the fixed leg schedules (act/360 accruals)
+    See buildOISStore and oisStoreFromProducts
+    '''
+    def __init__(self, startDate, endDate, floatingLegNominal, fixedLegNominal, fixedRate, fixed_offsets, fixed_dates, fixed_tau):
+        self.startDate = numpy.asarray(startDate, dtype=numpy.int32)
+        self.endDate = numpy.asarray(endDate, dtype=numpy.int32)
+        self.floatingLegNominal = numpy.asarray(floatingLegNominal, dtype=numpy.float64)
+        self.fixedLegNominal = numpy.asarray(fixedLegNominal, dtype=numpy.float64)
+        self.fixedRate = numpy.asarray(fixedRate, dtype=numpy.float64)
+        if numpy.any(self.floatingLegNominal * self.fixedLegNominal > 0):
+            raise ValueError("Nominal must have opposite sign")
+        self.fixed_offsets = numpy.asarray(fixed_offsets, dtype=numpy.int64)
+        self.fixed_dates = numpy.asarray(fixed_dates, dtype=numpy.int32)
+        self.fixed_tau = numpy.asarray(fixed_tau, dtype=numpy.float64)
+
+    def __len__(self):
+        return len(self.fixedRate)
+
+    def nbytes(self):
+        return store_nbytes(self)
+
+    # the i-th OIS as an OvernightIndexSwap whose fixed leg is a view on the arrays of the store
+    def ois(self, i):
+        c, d = self.fixed_offsets[i], self.fixed_offsets[i + 1]
+        return OvernightIndexSwap(date.fromordinal(int(self.startDate[i])), date.fromordinal(int(self.endDate[i])),
+                                  self.floatingLegNominal[i], self.fixed_dates[c:d], self.fixedRate[i],
+                                  self.fixedLegNominal[i], self.fixed_tau[c - i:d - i - 1])
+
+    def npv_floating_leg(self, discountCurve):
+        floatingleg_npv = discountCurve.df_vector(self.startDate) - discountCurve.df_vector(self.endDate)
+        return floatingleg_npv * self.floatingLegNominal
+
+    def npv_fixed_leg(self, discountCurve):
+        owner, starts = periods(self.fixed_offsets)
+        values = discountCurve.df_vector(self.fixed_dates[starts + 1]) * self.fixed_tau
+        return sum_by_trade(owner, values, len(self)) * self.fixedRate * self.fixedLegNominal
+
+    def npv(self, discountCurve):
+        return self.npv_fixed_leg(discountCurve) + self.npv_floating_leg(discountCurve)
+
+
+class CDSStore:
+    ''' A book of CDS (see credit_products.CDS) on the same reference name stored as arrays:
+    - startDate, endDate (as ordinals), spread, recovery: one element per CDS
+    - premium_offsets, premium_dates, tau: the premium leg schedules (act/360 accruals)
+    The default legs are computed with cumulative_protection, i.e. the integral of each segment of
+    the curves is computed once for the whole book.
+    See buildCDSStore and cdsStoreFromProducts
+    '''
+    def __init__(self, startDate, endDate, spread, recovery, premium_offsets, premium_dates, tau):
+        self.startDate = numpy.asarray(startDate, dtype=numpy.int32)
+        self.endDate = numpy.asarray(endDate, dtype=numpy.int32)
+        self.spread = numpy.asarray(spread, dtype=numpy.float64)
+        self.recovery = numpy.asarray(recovery, dtype=numpy.float64)
+        self.premium_offsets = numpy.asarray(premium_offsets, dtype=numpy.int64)
+        self.premium_dates = numpy.asarray(premium_dates, dtype=numpy.int32)
+        self.tau = numpy.asarray(tau, dtype=numpy.float64)
+
+    def __len__(self):
+        return len(self.spread)
+
+    def nbytes(self):
+        return store_nbytes(self)
+
+    # the i-th CDS as a CDS whose schedule is a view on the arrays of the store
+    def cds(self, i):
+        a, b = self.premium_offsets[i], self.premium_offsets[i + 1]
+        return CDS(date.fromordinal(int(self.startDate[i])), None, self.spread[i], self.recovery[i],
+                   self.premium_dates[a:b], self.tau[a - i:b - i - 1])
+
+    def premiumleg_npv(self, discountCurve, creditCurve):
+        owner, starts = periods(self.premium_offsets)
+        payment = self.premium_dates[starts + 1]
+        values = discountCurve.df_vector(payment) * creditCurve.ndp_vector(payment) * self.tau
+        return sum_by_trade(owner, values, len(self)) * self.spread
+
+    def defaultleg_npv(self, discountCurve, creditCurve):
+        protection = cumulative_protection(discountCurve, creditCurve, numpy.concatenate((self.startDate, self.endDate)))
+        n = len(self)
+        return (1 - self.recovery) * (protection[n:] - protection[:n])
+
+    def npv(self, discountCurve, creditCurve):
+        return self.premiumleg_npv(discountCurve, creditCurve) - self.defaultleg_npv(discountCurve, creditCurve)
+
+
+# This function builds a SwapStore with the same conventions of buildSwap, without building any Swap:
+# all of the arguments are arrays with one element per swap (or scalars, shared by all of them)
+def buildSwapStore(startDates, maturities, floatingTenors, fixedTenors, fixRates, nominals=1, swapTypes="receiver"):
+    startDates = to_ordinals(startDates)
+    endDates = add_months(startDates, maturities)
+    n = len(endDates)
+    fixed_sign, floating_sign = leg_signs(swapTypes, n)
+    nominals = numpy.broadcast_to(numpy.asarray(nominals, dtype=numpy.float64), (n,))
+
+    floating_offsets, floating_dates = schedules_generator(numpy.broadcast_to(floatingTenors, (n,)), startDates, endDates)
+    owner, starts = periods(floating_offsets)
+    floating_tau = dc_act360_vector(floating_dates[starts], floating_dates[starts + 1])
+    fixed_offsets, fixed_dates = schedules_generator(numpy.broadcast_to(fixedTenors, (n,)), startDates, endDates)
+    owner, starts = periods(fixed_offsets)
+    fixed_tau = dc_30e360_vector(fixed_dates[starts], fixed_dates[starts + 1])
+    return SwapStore(floating_sign * nominals, fixed_sign * nominals, numpy.broadcast_to(fixRates, (n,)),
+                     floating_offsets, floating_dates, floating_tau, fixed_offsets, fixed_dates, fixed_tau)
+
+# This function builds an OISStore with the same conventions of buildOIS (see buildSwapStore)
+def buildOISStore(startDates, maturities, fixedTenors, fixedRates, nominals=1, swapTypes="receiver"):
+    startDates = to_ordinals(startDates)
+    endDates = add_months(startDates, maturities)
+    n = len(endDates)
+    fixed_sign, floating_sign = leg_signs(swapTypes, n)
+    nominals = numpy.broadcast_to(numpy.asarray(nominals, dtype=numpy.float64), (n,))
+
+    fixed_offsets, fixed_dates = schedules_generator(numpy.broadcast_to(fixedTenors, (n,)), startDates, endDates)
+    owner, starts = periods(fixed_offsets)
+    fixed_tau = dc_act360_vector(fixed_dates[starts], fixed_dates[starts + 1])
+    return OISStore(startDates, endDates, floating_sign * nominals, fixed_sign * nominals,
+                    numpy.broadcast_to(fixedRates, (n,)), fixed_offsets, fixed_dates, fixed_tau)
+
+# This function builds a CDSStore with the same conventions of CDS (see buildSwapStore): the end date
+# is the first of 20/03 - 20/06 - 20/09 - 20/12 not before the start date plus the maturity
+def buildCDSStore(startDates, maturities, spreads, recoveries):
+    startDates = to_ordinals(startDates)
+    months, days = ordinals_to_months_days(add_months(startDates, maturities))
+    # the first month among March, June, September and December not before the one of the date...
+    imm_months = months + (2 - months % 12) % 3
+    # ... if it is the same month and the 20th has already passed we take the next one
+    imm_months = imm_months + numpy.where((imm_months == months) & (days > 20), 3, 0)
+    endDates = months_days_to_ordinals(imm_months, 20)
+    n = len(endDates)
+
+    premium_offsets, premium_dates = schedules_generator(numpy.repeat(3, n), startDates, endDates)
+    owner, starts = periods(premium_offsets)
+    tau = dc_act360_vector(premium_dates[starts], premium_dates[starts + 1])
+    return CDSStore(startDates, endDates, numpy.broadcast_to(spreads, (n,)), numpy.broadcast_to(recoveries, (n,)),
+                    premium_offsets, premium_dates, tau)
+
+# the offsets of the concatenation of many schedules
+def concatenated_offsets(schedules):
+    return numpy.concatenate(([0], numpy.cumsum([len(schedule) for schedule in schedules])))
+
+# These functions store existing products (e.g. the ones of the original scripts) in a store
+def swapStoreFromProducts(swaps):
+    floating = [to_ordinals(swap.floatingLegDates) for swap in swaps]
+    fixed = [to_ordinals(swap.fixedLegDates) for swap in swaps]
+    return SwapStore([swap.floatingLegNominal for swap in swaps], [swap.fixedLegNominal for swap in swaps],
+                     [swap.fixRate for swap in swaps],
+                     concatenated_offsets(floating), numpy.concatenate(floating),
+                     numpy.concatenate([swap.floating_tau for swap in swaps]),
+                     concatenated_offsets(fixed), numpy.concatenate(fixed),
+                     numpy.concatenate([swap.fixed_tau for swap in swaps]))
+
+def oisStoreFromProducts(oiss):
+    fixed = [to_ordinals(ois.fixedLegDates) for ois in oiss]
+    return OISStore([ois.floating_dates[0] for ois in oiss], [ois.floating_dates[1] for ois in oiss],
+                    [ois.floatingLegNominal for ois in oiss], [ois.fixedLegNominal for ois in oiss],
+                    [ois.fixedRate for ois in oiss], concatenated_offsets(fixed), numpy.concatenate(fixed),
+                    numpy.concatenate([ois.fixed_tau for ois in oiss]))
+
+def cdsStoreFromProducts(cdss):
+    premium = [to_ordinals(cds.premiumDates) for cds in cdss]
+    return CDSStore([cds.startDate.toordinal() for cds in cdss], [cds.endDate.toordinal() for cds in cdss],
+                    [cds.spread for cds in cdss], [cds.recovery for cds in cdss],
+                    concatenated_offsets(premium), numpy.concatenate(premium),
+                    numpy.concatenate([cds.tau for cds in cdss]))
+
+
+# example
+from ir_curves import DiscountCurve, ForwardLiborCurve
+from credit_curves import CreditCurve
+
+if __name__ == '__main__':
+    today = date(2010,1,1)
+    dc = DiscountCurve(today, [date(2011,1,1), date(2015,1,1), date(2030,1,1)], [0.98, 0.9, 0.6])
+    libor = ForwardLiborCurve(today, [date(2010,1,1), date(2015,1,1), date(2030,1,1)], [0.01, 0.03, 0.04])
+    cc = CreditCurve(today, [date(2011,1,1), date(2015,1,1), date(2030,1,1)], [0.99, 0.93, 0.7])
+
+    # a book of 200000 swaps with random start dates and maturities
+    n = 200000
+    randomState = numpy.random.RandomState(1)
+    starts = today.toordinal() - randomState.randint(0, 3650, n)
+    maturities = 12 * randomState.randint(1, 21, n)
+    store = buildSwapStore(starts, maturities, 6, 12, 0.03, 1000000, numpy.where(randomState.rand(n) < 0.5, "receiver", "payer"))
+    npvs = store.npv(dc, libor)
+    print "Swaps:", len(store), "bytes per swap:", store.nbytes() / float(len(store))
+    print "First npvs:", npvs[:3]
+    print "Same npvs from the Swap views:", [store.swap(i).npv(dc, libor) for i in range(3)]
+
+    ois_store = buildOISStore(starts[:1000], maturities[:1000], 12, 0.02, 1000000)
+    print "OIS npvs:", ois_store.npv(dc)[:3], [ois_store.ois(i).npv(dc) for i in range(3)]
+
+    cds_store = buildCDSStore(starts[:1000], maturities[:1000], 0.01, 0.4)
+    print "CDS npvs:", cds_store.npv(dc, cc)[:3], [cds_store.cds(i).npv(dc, cc) for i in range(3)]